@@ -0,0 +1,11 @@
+import sys
+import os
+
+# Configurar ruta para encontrar los módulos en 'src'
+sys.path.append(os.path.join(os.path.dirname(__file__), 'src'))
+
+# Ejecución sin interfaz gráfica (no importa tkinter)
+import batch_runner
+
+if __name__ == "__main__":
+    sys.exit(batch_runner.main())
@@ -0,0 +1,183 @@
+"""
+bench_circuit.py - Benchmarks del motor MNA (circuit_sim.Circuit)
+Genera familias de circuitos parametrizadas y mide tiempo y memoria pico por fase
+(armado, resolución y post-proceso). Se llama a Circuit.solve() y los tiempos por fase salen
+de sus propios contadores (enable_profiling/timings), así que se mide el mismo camino que usa
+el simulador.
+Los resultados se guardan en JSON para comparar versiones.
+
+Uso:
+    python benchmarks/bench_circuit.py -o bench.json
+    python benchmarks/bench_circuit.py --families grid ladder --sizes 100 10000 -o nuevo.json --compare bench.json
+"""
+from __future__ import annotations
+import argparse
+import datetime
+import json
+import os
+import platform
+import subprocess
+import sys
+import time
+import tracemalloc
+
+import numpy as np
+import scipy
+
+sys.path.append(os.path.join(os.path.dirname(__file__), '..', 'src'))
+from circuit_sim import Circuit
+
+DEFAULT_SIZES = [10, 100, 1000, 10000, 100000]
+
+# --- FAMILIAS DE CIRCUITOS ---
+# Cada generador recibe la cantidad aproximada de nodos y un RNG, y devuelve un Circuit
+# armado con la API de carga masiva (el nodo 0 es tierra).
+
+def gen_ladder(n, rng):
+    """Escalera resistiva: resistencias serie entre nodos consecutivos y en paralelo a tierra"""
+    k = np.arange(1, n)
+    c = Circuit()
+    c.add_resistors([f"Rs{i}" for i in k], k - 1, k, rng.uniform(1, 10, n - 1))
+    c.add_resistors([f"Rp{i}" for i in k], k, np.zeros(n - 1, dtype=int), rng.uniform(10, 20, n - 1))
+    c.add_vsource("V1", "1", "0", 5.0)
+    return c
+
+def gen_grid(n, rng):
+    """Malla 2-D cuadrada de resistencias (estilo red de distribución), alimentada en una esquina"""
+    side = max(2, int(round(np.sqrt(n))))
+    ids = np.arange(side * side).reshape(side, side)
+    a = np.concatenate((ids[:, :-1].ravel(), ids[:-1, :].ravel()))
+    b = np.concatenate((ids[:, 1:].ravel(), ids[1:, :].ravel()))
+    c = Circuit()
+    c.add_resistors([f"R{i}" for i in range(len(a))], a, b, rng.uniform(0.5, 2.0, len(a)))
+    c.add_vsource("V1", str(side * side - 1), "0", 1.0)
+    c.add_isource("I1", str(side * side // 2), "0", 0.01)
+    return c
+
+def gen_random(n, rng, span=50, extra=1.0):
+    """Grafo disperso aleatorio: árbol aleatorio con aristas de alcance acotado + aristas extra.
+    El alcance acotado mantiene un relleno realista (como un circuito dibujado, no un expansor)."""
+    k = np.arange(1, n)
+    parent = np.maximum(0, k - rng.integers(1, span + 1, n - 1))
+    m = int(extra * n)
+    u = rng.integers(1, n, m)
+    v = np.maximum(0, u - rng.integers(1, span + 1, m))
+    a, b = np.concatenate((k, u)), np.concatenate((parent, v))
+    c = Circuit()
+    c.add_resistors([f"R{i}" for i in range(len(a))], a, b, rng.uniform(1, 1000, len(a)))
+    c.add_vsource("V1", str(n - 1), "0", 10.0)
+    return c
+
+def gen_sources(n, rng, frac=0.1):
+    """Malla con muchas fuentes: un 10 % de nodos fijados con fuentes V a tierra y otro 10 %
+    con fuentes de corriente (estresa el bloque B y el pivoteo del sistema aumentado)"""
+    c = gen_grid(n, rng)
+    # Se excluye el último nodo, que ya tiene la fuente V1 de la malla
+    nodes = rng.permutation(np.arange(1, len(c.nodes) - 1))
+    nv = max(1, int(frac * len(nodes)))
+    vn, inn = nodes[:nv], nodes[nv:2 * nv]
+    c.add_vsources([f"Vx{i}" for i in range(len(vn))], vn, np.zeros(len(vn), dtype=int), rng.uniform(0, 5, len(vn)))
+    c.add_isources([f"Ix{i}" for i in range(len(inn))], inn, np.zeros(len(inn), dtype=int), rng.uniform(-0.1, 0.1, len(inn)))
+    return c
+
+FAMILIES = {'ladder': gen_ladder, 'grid': gen_grid, 'random': gen_random, 'sources': gen_sources}
+
+# --- MEDICIÓN POR FASES ---
+# Fases del informe a partir de las fases de PhaseTimer (el armado suma además la construcción)
+PHASES = {'assembly': ('node_mapping', 'stamping'), 'solve': ('factorization', 'substitution'),
+          'post': ('result_building',)}
+
+def run_phases(family, n, seed, method):
+    """Arma el circuito y lo resuelve una vez con solve(). Devuelve (tiempos, datos del circuito)"""
+    rng = np.random.default_rng(seed)
+    t0 = time.perf_counter()
+    c = FAMILIES[family](n, rng)
+    build = time.perf_counter() - t0
+    c.enable_profiling()
+    voltages, results = c.solve(method)
+    tm = c.timings()
+    t = {ph: sum(tm[k]['total'] for k in keys if k in tm) for ph, keys in PHASES.items()}
+    t['assembly'] += build
+    plan = c.compile()
+    sparse = c._use_sparse(plan.n, method)
+    # Solo para el informe: qué factorización eligió solve() (Cholesky, LU por bloques o completa)
+    factor = type(c._lu_cache['lu']).__name__ if c._lu_cache else '-'
+    info = {'nodes': len(voltages), 'elements': len(results), 'unknowns': plan.n, 'sparse': bool(sparse),
+            'nnz': int(plan.nnz) if sparse else plan.n * plan.n, 'factor': factor}
+    return t, info
+
+def peak_memory(family, n, seed, method):
+    """Memoria pico (tracemalloc, corrida aparte para no contaminar los tiempos): armado
+    (construcción y compile()) y resolución (solve() completo, con los resultados).
+    Solo cuenta memoria de Python/NumPy: la interna de SuperLU/LAPACK no es visible."""
+    rng = np.random.default_rng(seed)
+    peaks = {}
+    tracemalloc.start()
+    c = FAMILIES[family](n, rng)
+    c.compile()
+    peaks['assembly'] = tracemalloc.get_traced_memory()[1]
+
+    tracemalloc.reset_peak()
+    c.solve(method)
+    peaks['solve'] = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return {k: v / 2**20 for k, v in peaks.items()}
+
+def bench(family, n, repeat, seed, method, memory=True):
+    runs = [run_phases(family, n, seed, method) for _ in range(repeat)]
+    info = runs[-1][1]
+    phases = {ph: {'time_s': min(r[0][ph] for r in runs), 'time_median_s': float(np.median([r[0][ph] for r in runs]))}
+              for ph in ('assembly', 'solve', 'post')}
+    if memory:
+        for ph, mb in peak_memory(family, n, seed, method).items(): phases[ph]['peak_mb'] = mb
+    return {'family': family, 'size': n, **info, 'phases': phases}
+
+def metadata():
+    try:
+        rev = subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True,
+                             cwd=os.path.dirname(__file__)).stdout.strip() or None
+    except OSError:
+        rev = None
+    return {'date': datetime.datetime.now().isoformat(timespec='seconds'), 'git': rev,
+            'python': platform.python_version(), 'numpy': np.__version__, 'scipy': scipy.__version__,
+            'platform': platform.platform(), 'cpus': os.cpu_count()}
+
+def compare(new, old_path):
+    """Imprime la razón nuevo/anterior del tiempo de cada fase (<1 = más rápido)"""
+    with open(old_path) as fh: old = json.load(fh)
+    ref = {(r['family'], r['size']): r for r in old['results']}
+    print(f"\n{'familia':<10}{'tamaño':>9}" + ''.join(f"{ph:>12}" for ph in ('assembly', 'solve', 'post')))
+    for r in new['results']:
+        o = ref.get((r['family'], r['size']))
+        if o is None: continue
+        ratios = [r['phases'][ph]['time_s'] / max(o['phases'][ph]['time_s'], 1e-12) for ph in ('assembly', 'solve', 'post')]
+        print(f"{r['family']:<10}{r['size']:>9}" + ''.join(f"{x:>11.2f}x" for x in ratios))
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(description="Benchmarks del motor MNA por familias de circuitos")
+    ap.add_argument('--families', nargs='+', choices=sorted(FAMILIES), default=sorted(FAMILIES))
+    ap.add_argument('--sizes', nargs='+', type=int, default=DEFAULT_SIZES, help="cantidad aproximada de nodos")
+    ap.add_argument('--repeat', type=int, default=3)
+    ap.add_argument('--seed', type=int, default=0)
+    ap.add_argument('--method', choices=('auto', 'dense', 'sparse'), default='auto')
+    ap.add_argument('--no-memory', action='store_true', help="omite la corrida con tracemalloc")
+    ap.add_argument('-o', '--output', default='bench_results.json')
+    ap.add_argument('--compare', help="JSON de una corrida anterior para comparar")
+    args = ap.parse_args(argv)
+
+    report = {'meta': metadata(), 'results': []}
+    print(f"{'familia':<10}{'tamaño':>9}{'incógn.':>9}{'armado':>11}{'solve':>11}{'post':>11}{'pico MB':>10}  factor")
+    for fam in args.families:
+        for n in args.sizes:
+            r = bench(fam, n, args.repeat, args.seed, args.method, memory=not args.no_memory)
+            report['results'].append(r)
+            ph = r['phases']
+            peak = max(p.get('peak_mb', 0.0) for p in ph.values())
+            print(f"{fam:<10}{n:>9}{r['unknowns']:>9}" + ''.join(f"{ph[k]['time_s']*1e3:>9.2f}ms" for k in ('assembly', 'solve', 'post'))
+                  + f"{peak:>10.1f}  {r['factor']}")
+    with open(args.output, 'w') as fh: json.dump(report, fh, indent=2)
+    print(f"\nResultados guardados en {args.output}")
+    if args.compare: compare(report, args.compare)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,178 @@
+"""
+batch_runner.py - Ejecución sin interfaz gráfica de netlists estilo SPICE
+Uso: python batch.py circuitos/*.cir -j 8 -f csv -o resultados.csv
+"""
+from __future__ import annotations
+import argparse
+import csv
+import glob
+import json
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+from typing import Dict, Iterator, List, Tuple
+
+sys.path.append(os.path.dirname(__file__))
+from circuit_sim import Circuit, SolutionCache
+
+# Sufijos de ingeniería de SPICE (se comparan en minúsculas; 'meg' y 'mil' antes que 'm')
+SPICE_SUFFIXES = [('meg', 1e6), ('mil', 25.4e-6), ('t', 1e12), ('g', 1e9), ('k', 1e3),
+                  ('m', 1e-3), ('u', 1e-6), ('µ', 1e-6), ('n', 1e-9), ('p', 1e-12), ('f', 1e-15)]
+CARD_TYPES = ('R', 'V', 'I', 'C', 'L')
+NETLIST_EXTENSIONS = ('.cir', '.net', '.sp', '.spice')
+
+def parse_value(token: str) -> float:
+    """Convierte un valor SPICE ('4k7' no, '4.7k', '10meg', '1e-3', '5V') a float"""
+    t = token.strip().lower()
+    try: return float(t)
+    except ValueError: pass
+    # Número inicial + sufijo; se ignoran las unidades que siguen al sufijo (p. ej. '10kohm')
+    k = 0
+    while k < len(t) and (t[k].isdigit() or t[k] in '.+-e'):
+        # 'e' solo cuenta como exponente si le sigue un dígito o signo
+        if t[k] == 'e' and not (k+1 < len(t) and (t[k+1].isdigit() or t[k+1] in '+-')): break
+        k += 1
+    if k == 0: raise ValueError(f"Valor inválido: {token}")
+    base, rest = float(t[:k]), t[k:]
+    for suf, mult in SPICE_SUFFIXES:
+        if rest.startswith(suf): return base * mult
+    return base
+
+def iter_cards(lines) -> Iterator[Tuple[int, str, str, str, str, float]]:
+    """Parser en streaming: recorre las líneas una a una y produce
+    (línea, tipo, nombre, nodo1, nodo2, valor) por cada tarjeta R/V/I/C/L.
+    Soporta comentarios ('*', ';'), continuaciones ('+'), directivas ('.end' termina)
+    y la línea de título de SPICE (la primera línea siempre es el título, aunque empiece con R, V...)."""
+    pending, pending_no = None, 0
+    def card(no, text):
+        tok = text.split()
+        kind = tok[0][0].upper()
+        if kind not in CARD_TYPES: raise ValueError(f"Línea {no}: tarjeta no soportada '{tok[0]}'")
+        # 'V1 a b DC 5' -> se descarta la palabra DC
+        vals = [t for t in tok[3:] if t.upper() != 'DC']
+        if len(tok) < 4 or not vals: raise ValueError(f"Línea {no}: faltan campos en '{text}'")
+        return no, kind, tok[0], tok[1], tok[2], parse_value(vals[0])
+
+    for no, raw in enumerate(lines, start=1):
+        if no == 1: continue
+        line = raw.split(';', 1)[0].rstrip()
+        if not line.strip() or line.lstrip().startswith('*'): continue
+        if line.lstrip().startswith('+'):
+            if pending is not None: pending += ' ' + line.lstrip()[1:]
+            continue
+        if pending is not None: yield card(pending_no, pending)
+        pending = None
+        head = line.lstrip()
+        if head.startswith('.'):
+            if head.lower().startswith('.end') and not head.lower().startswith('.ends'): return
+            continue
+        pending, pending_no = head, no
+    if pending is not None: yield card(pending_no, pending)
+
+def load_netlist(path: str) -> Circuit:
+    """Arma un Circuit desde un archivo; las tarjetas se juntan por tipo y se cargan en bloque.
+    Una resistencia de 0 Ω se interpreta como cable ideal."""
+    cols: Dict[str, Tuple[List[str], List[str], List[str], List[float]]] = {k: ([], [], [], []) for k in 'RVIWCL'}
+    with open(path, encoding='utf-8', errors='replace') as fh:
+        for _, kind, name, a, b, value in iter_cards(fh):
+            if kind == 'R' and value == 0.0: kind = 'W'
+            c = cols[kind]
+            c[0].append(name); c[1].append(a); c[2].append(b); c[3].append(value)
+    circ = Circuit()
+    if cols['R'][0]: circ.add_resistors(*cols['R'])
+    if cols['V'][0]: circ.add_vsources(*cols['V'])
+    if cols['I'][0]: circ.add_isources(*cols['I'])
+    if cols['W'][0]: circ.add_wires(*cols['W'][:3])
+    if cols['C'][0]: circ.add_capacitors(*cols['C'])
+    if cols['L'][0]: circ.add_inductors(*cols['L'])
+    return circ
+
+# Una SolutionCache por directorio y por proceso (los procesos comparten solo los archivos)
+_CACHES: Dict[str, SolutionCache] = {}
+
+def solve_file(task) -> dict:
+    """Resuelve un netlist y devuelve un registro serializable (se ejecuta en otro proceso)"""
+    path, method, cache_dir = task
+    t0 = time.perf_counter()
+    try:
+        circ = load_netlist(path)
+        if cache_dir: circ.cache = _CACHES.setdefault(cache_dir, SolutionCache(path=cache_dir))
+        voltages, results = circ.solve(method)
+        # Los singulares ya lanzan en solve(); sin voltajes queda un método que no convergió
+        if not voltages: raise ValueError("Sin solución: el método no convergió")
+        return {'file': path, 'ok': True, 'time': time.perf_counter() - t0, 'residual': results.residual,
+                'voltages': voltages, 'results': results.to_dict()}
+    except Exception as e:
+        return {'file': path, 'ok': False, 'time': time.perf_counter() - t0, 'error': str(e)}
+
+def expand_paths(items: List[str]) -> List[str]:
+    """Archivos, directorios (se recorren buscando netlists) o patrones glob"""
+    paths = []
+    for item in items:
+        if os.path.isdir(item):
+            for root, _, files in os.walk(item):
+                paths += [os.path.join(root, f) for f in sorted(files) if f.lower().endswith(NETLIST_EXTENSIONS)]
+        elif os.path.exists(item): paths.append(item)
+        else: paths += sorted(glob.glob(item))
+    return paths
+
+def write_jsonl(records, out):
+    for rec in records:
+        out.write(json.dumps(rec) + '\n')
+        yield rec
+
+def write_csv(records, out):
+    """Formato largo: una fila por nodo (V) y por rama (v, i, p)"""
+    w = csv.writer(out)
+    w.writerow(['file', 'kind', 'name', 'v', 'i', 'p', 'error'])
+    for rec in records:
+        if not rec['ok']:
+            w.writerow([rec['file'], 'error', '', '', '', '', rec['error']])
+        else:
+            for n, v in rec['voltages'].items(): w.writerow([rec['file'], 'node', n, repr(v), '', '', ''])
+            for name, d in rec['results'].items():
+                w.writerow([rec['file'], 'branch', name, repr(d['v']), repr(d['i']), repr(d['p']), ''])
+        yield rec
+
+def run_batch(paths: List[str], out, fmt: str = 'jsonl', workers: int = None, method: str = 'auto',
+              cache_dir: str = None) -> Tuple[int, int]:
+    """Resuelve todos los netlists en un pool de procesos y escribe los resultados a medida
+    que llegan (en el orden de entrada). Devuelve (resueltos, fallidos).
+    cache_dir: directorio de soluciones en disco; los circuitos ya resueltos no se recalculan."""
+    tasks = [(p, method, cache_dir) for p in paths]
+    writer = write_csv if fmt == 'csv' else write_jsonl
+    ok = failed = 0
+    if workers == 1 or len(tasks) <= 1:
+        records = map(solve_file, tasks)
+        for rec in writer(records, out):
+            ok += rec['ok']; failed += not rec['ok']
+        return ok, failed
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        # chunksize > 1: miles de circuitos chicos no pagan un viaje entre procesos cada uno
+        chunk = max(1, len(tasks) // (4 * (workers or os.cpu_count() or 1)))
+        for rec in writer(pool.map(solve_file, tasks, chunksize=chunk), out):
+            ok += rec['ok']; failed += not rec['ok']
+    return ok, failed
+
+def main(argv=None) -> int:
+    ap = argparse.ArgumentParser(description="Simulador DC sin interfaz: resuelve netlists SPICE (tarjetas R/V/I/C/L) en lote")
+    ap.add_argument('paths', nargs='+', help="archivos, directorios o patrones glob")
+    ap.add_argument('-j', '--workers', type=int, default=None, help="procesos en paralelo (por defecto: todos los núcleos)")
+    ap.add_argument('-f', '--format', choices=('jsonl', 'csv'), default='jsonl')
+    ap.add_argument('-o', '--output', default='-', help="archivo de salida ('-' = stdout)")
+    ap.add_argument('--cache', metavar='DIR', help="guarda las soluciones en DIR y reutiliza las de corridas anteriores")
+    ap.add_argument('--method', choices=('auto', 'dense', 'sparse', 'iterative'), default='auto')
+    args = ap.parse_args(argv)
+
+    paths = expand_paths(args.paths)
+    if not paths:
+        print("No se encontraron netlists.", file=sys.stderr); return 2
+    out = sys.stdout if args.output == '-' else open(args.output, 'w', newline='', encoding='utf-8')
+    try:
+        t0 = time.perf_counter()
+        ok, failed = run_batch(paths, out, args.format, args.workers, args.method, args.cache)
+    finally:
+        if out is not sys.stdout: out.close()
+    print(f"{ok} resueltos, {failed} con error en {time.perf_counter() - t0:.2f} s", file=sys.stderr)
+    return 1 if failed else 0
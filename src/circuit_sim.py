@@ -3,126 +3,1940 @@ circuit_sim.py - Motor MNA Robusto con Regularización
 """
 from __future__ import annotations
 import numpy as np
+import scipy.sparse as sp
+import scipy.sparse.linalg as spla
+import scipy.linalg as la
+import scipy.sparse.csgraph as csgraph
+import hashlib
+import json
+import os
+import threading
+import time
+import warnings
+from collections import OrderedDict
+from collections.abc import Mapping
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from contextlib import nullcontext
 from dataclasses import dataclass
-from typing import Dict, List, Tuple
+from typing import Callable, Dict, List, Tuple
 
-@dataclass
+# CHOLMOD (scikit-sparse) es opcional: sin él, el camino SPD disperso usa SuperLU en modo simétrico
+try:
+    from sksparse.cholmod import cholesky as cholmod_cholesky, CholmodError
+except ImportError:
+    cholmod_cholesky = None
+
+# Regularización para evitar singularidades (nodos flotantes)
+GMIN = 1e-12
+# Resistencia mínima admitida (evita la división por cero)
+R_MIN = 1e-9
+# Número de incógnitas a partir del cual solve() usa el motor disperso
+SPARSE_THRESHOLD = 300
+# Bloques (componentes conexas) a partir de este tamaño se factorizan en paralelo
+PARALLEL_BLOCK_MIN = 5000
+# Los bloques más chicos que esto se agrupan (hasta este total de incógnitas) en una sola LU densa
+BLOCK_GROUP_MAX = 64
+# Dimensión del subespacio de Krylov antes de reiniciar GMRES (modo iterativo)
+GMRES_RESTART = 50
+# Nombres aceptados para el nodo de referencia
+GROUND_NAMES = ('GND', 'TIERRA', '0')
+# Tensión térmica a 300 K y argumento a partir del cual la exponencial se continúa en forma lineal
+VT = 0.025852
+EXP_LIM = 40.0
+# Conductancia a tierra inicial del GMIN stepping (se reduce hasta GMIN)
+GMIN_START = 1e-2
+
+def conductance(R: float) -> float:
+    return 1.0 / (R if abs(R) > R_MIN else R_MIN)
+
+def conductances(R: np.ndarray) -> np.ndarray:
+    return 1.0 / np.where(np.abs(R) > R_MIN, R, R_MIN)
+
+@dataclass(frozen=True)
 class Resistor:
     name: str; n1: str; n2: str; value: float
 
-@dataclass
+@dataclass(frozen=True)
 class VSource:
     name: str; n_plus: str; n_minus: str; value: float
 
-@dataclass
+@dataclass(frozen=True)
 class ISource:
     name: str; n_from: str; n_to: str; value: float
 
-class Circuit:
+@dataclass(frozen=True)
+class Wire:
+    """Cortocircuito ideal (0 Ω): sus nodos se fusionan en un supernodo"""
+    name: str; n1: str; n2: str
+
+@dataclass(frozen=True)
+class Capacitor:
+    """Abierto en DC; en transitorio se reemplaza por su modelo compañero"""
+    name: str; n1: str; n2: str; value: float
+
+@dataclass(frozen=True)
+class Inductor:
+    """En DC es una fuente de 0 V (su corriente es una incógnita de rama)"""
+    name: str; n1: str; n2: str; value: float
+
+@dataclass(frozen=True)
+class Diode:
+    name: str; anode: str; cathode: str; Is: float; n: float
+
+@dataclass(frozen=True)
+class BJT:
+    """Ebers-Moll (transporte); polarity 'npn' o 'pnp'"""
+    name: str; c: str; b: str; e: str; Is: float; beta_f: float; beta_r: float; polarity: str
+
+@dataclass(frozen=True)
+class MOSFET:
+    """Ley cuadrática (nivel 1) con modulación de canal; polarity 'nmos' o 'pmos'"""
+    name: str; d: str; g: str; s: str; K: float; vth: float; lam: float; polarity: str
+
+@dataclass
+class SweepResult:
+    """Resultado de Circuit.sweep: una fila por punto del barrido"""
+    values: np.ndarray; nodes: List[str]; voltages: np.ndarray; branches: List[str]; currents: np.ndarray
+
+@dataclass
+class MonteCarloResult:
+    """Estadísticas por nodo de Circuit.monte_carlo (las muestras no se conservan)"""
+    n_samples: int; nodes: List[str]; mean: np.ndarray; std: np.ndarray
+    percentiles: Dict[float, np.ndarray]; vmin: np.ndarray; vmax: np.ndarray
+
+@dataclass
+class SensitivityResult:
+    """Resultado de Circuit.sensitivity: una fila por salida y una columna por parámetro
+    (resistencias, fuentes de voltaje y fuentes de corriente, en ese orden)"""
+    outputs: List[str]; output_values: np.ndarray; names: List[str]; values: np.ndarray; dydp: np.ndarray
+
+@dataclass(frozen=True)
+class SubcircuitInstance:
+    """Instancia de un subcircuito: nodos del circuito padre conectados a cada puerto"""
+    name: str; definition: str; nodes: Tuple[str, ...]; params: Dict[str, float]
+
+@dataclass
+class FloatingIsland:
+    """Grupo de nodos sin camino de conducción a tierra en DC (Circuit.floating_islands).
+    Se resuelve aparte con `reference` en 0 V, así que sus voltajes son relativos a ese nodo.
+    injection es la corriente neta que le entregan las fuentes de corriente: si no es 0 el
+    sistema no tiene solución y la KCL no cierra en el nodo de referencia"""
+    nodes: List[str]; reference: str; injection: float
+
+@dataclass
+class NewtonReport:
+    """Resumen de la última resolución no lineal (Circuit.newton_report). strategy indica qué
+    hizo falta para converger: 'newton', 'gmin' (GMIN stepping) o 'source' (source stepping)"""
+    converged: bool; strategy: str; iterations: int; factorizations: int; steps: int
+    residual: float; time: float
+
+@dataclass
+class IterativeReport:
+    """Resumen de la última resolución iterativa (Circuit.iterative_report). residual es la
+    norma relativa ‖Kx - b‖/‖b‖ del sistema que se resolvió (reducido SPD o aumentado)"""
+    converged: bool; solver: str; preconditioner: str; iterations: int; warm_start: bool
+    residual: float; time: float
+
+@dataclass
+class TransientResult:
+    """Resultado de Circuit.transient: una fila por instante (t = 0, dt, ..., t_stop),
+    una columna por nodo o rama registrada"""
+    time: np.ndarray; nodes: List[str]; voltages: np.ndarray; branches: List[str]; currents: np.ndarray
+
+class CircuitResults(Mapping):
+    """Resultados por elemento de Circuit.solve, guardados en arreglos (v, i, p en el orden de
+    names). Se usa como el diccionario de antes: results['R1'] da {'v', 'i', 'p'} (más 'ib' en
+    los BJT e 'i_ports' en los subcircuitos). kcl es la corriente neta que entra a cada nodo de
+    kcl_nodes y residual la norma ‖Ax − z‖ del sistema resuelto. names, kcl_nodes e index (nombre
+    -> posición) pueden venir compartidos de StampPlan.result_layout: no se copian."""
+    def __init__(self, names=(), v=(), i=(), p=(), extra=None, kcl_nodes=(), kcl=(), residual: float = 0.0,
+                 index: Dict[str, int] = None):
+        self.names = names if isinstance(names, list) else list(names)
+        self.v, self.i, self.p = (np.asarray(x, dtype=float) for x in (v, i, p))
+        self.extra: Dict[str, dict] = extra or {}
+        self.kcl_nodes = kcl_nodes if isinstance(kcl_nodes, list) else list(kcl_nodes)
+        self.kcl, self.residual = np.asarray(kcl, dtype=float), float(residual)
+        self._index = index if index is not None else {name: k for k, name in enumerate(self.names)}
+
+    def __getitem__(self, name: str) -> dict:
+        k = self._index[name]
+        d = {'v': float(self.v[k]), 'i': float(self.i[k]), 'p': float(self.p[k])}
+        if name in self.extra: d.update(self.extra[name])
+        return d
+
+    def __iter__(self): return iter(self.names)
+    def __len__(self): return len(self.names)
+    def __repr__(self): return f"CircuitResults({len(self.names)} elementos, residual={self.residual:.3g})"
+
+    def power_balance(self) -> float:
+        """Potencia neta absorbida por todo el circuito (0 si se conserva la energía)"""
+        return float(self.p.sum())
+
+    def power_totals(self) -> Tuple[float, float]:
+        """(suministrada, disipada): suma de las potencias negativas (cambiada de signo) y positivas"""
+        return float(-self.p[self.p < 0].sum()), float(self.p[self.p > 0].sum())
+
+    def kcl_residuals(self) -> Dict[str, float]:
+        return dict(zip(self.kcl_nodes, self.kcl.tolist()))
+
+    def kcl_error(self) -> float:
+        return float(np.abs(self.kcl).max(initial=0.0))
+
+    def to_dict(self) -> Dict[str, dict]:
+        """Diccionario de diccionarios (JSON)"""
+        return {name: self[name] for name in self.names}
+
+    def copy(self) -> CircuitResults:
+        return CircuitResults(self.names, self.v.copy(), self.i.copy(), self.p.copy(),
+                              {k: dict(d) for k, d in self.extra.items()}, self.kcl_nodes, self.kcl.copy(), self.residual,
+                              self._index)
+
+    def state(self) -> dict:
+        """Contenido como tipos de JSON (CircuitResults(**state) lo reconstruye)"""
+        return {'names': self.names, 'v': self.v.tolist(), 'i': self.i.tolist(), 'p': self.p.tolist(),
+                'extra': self.extra, 'kcl_nodes': self.kcl_nodes, 'kcl': self.kcl.tolist(), 'residual': self.residual}
+
+class PortModel:
+    """Red reducida a sus puertos (Circuit.reduce): equivalente de Norton Y·v = J + i, con v los
+    voltajes de los puertos respecto de tierra e i la corriente que entra a cada puerto desde
+    afuera. Y es el complemento de Schur de la matriz MNA sobre los puertos y J la corriente de
+    cortocircuito. Una carga se evalúa con un solve de p×p en lugar de la red completa."""
+    def __init__(self, ports: List[str], Y: np.ndarray, J: np.ndarray, expand, reactive: bool = False):
+        self.ports, self.Y, self.J = ports, Y, J
+        # La reducción es de DC: si la red tiene capacitores o inductores no sirve en transitorio
+        self.reactive = reactive
+        # Para reconstruir los nodos internos: x_I = y0 - W·v
+        self._expand = expand
+
+    def thevenin(self) -> Tuple[np.ndarray, np.ndarray]:
+        """Impedancia Z = Y⁻¹ y voltajes a circuito abierto v_oc = Z·J (Y singular: puertos flotantes)"""
+        Z = np.linalg.inv(self.Y)
+        return Z, Z @ self.J
+
+    def admittance(self, loads) -> np.ndarray:
+        """Matriz de admitancia p×p de resistencias de carga (n1, n2, R) entre puertos o a tierra"""
+        col = {p: k for k, p in enumerate(self.ports)}
+        Yl = np.zeros_like(self.Y)
+        for n1, n2, R in loads:
+            g = conductance(R)
+            a = -1 if str(n1).upper() in GROUND_NAMES else col[n1]
+            b = -1 if str(n2).upper() in GROUND_NAMES else col[n2]
+            if a >= 0: Yl[a, a] += g
+            if b >= 0: Yl[b, b] += g
+            if a >= 0 and b >= 0: Yl[a, b] -= g; Yl[b, a] -= g
+        return Yl
+
+    def solve(self, Y_load=None, I_load=None) -> np.ndarray:
+        """Voltajes de los puertos con una carga lineal de admitancia Y_load (p×p) y corriente
+        I_load inyectada en los puertos. Admite lotes: Y_load de forma (K, p, p) da (K, p)."""
+        Y = self.Y if Y_load is None else self.Y + np.asarray(Y_load, dtype=float)
+        J = self.J if I_load is None else self.J + np.asarray(I_load, dtype=float)
+        J = np.broadcast_to(J, Y.shape[:-1])
+        return np.linalg.solve(Y, J[..., None])[..., 0]
+
+    def voltages(self, v: np.ndarray) -> Dict[str, float]:
+        """Voltajes de todos los nodos de la red dados los de los puertos"""
+        keep, P, W, y0, node_names, node_cols, n = self._expand
+        x = np.zeros(n + 1)
+        x[P] = v
+        x[keep] = y0 - W @ np.asarray(v, dtype=float)
+        out = dict(zip(node_names, x[node_cols].tolist()))
+        out['0'] = 0.0
+        return out
+
+class SubcircuitDef:
+    """Definición de subcircuito: nodos de puerto y una función build(circ, **params) que arma el
+    contenido sobre un Circuit vacío (el nodo '0' es la tierra global; puede instanciar otros
+    subcircuitos). Cada combinación de parámetros se reduce una sola vez a un PortModel y las
+    instancias (Circuit.add_subcircuit) estampan solo ese modelo de p×p."""
+    def __init__(self, name: str, ports: List[str], build: Callable[..., None]):
+        self.name, self.ports, self.build = name, [str(p) for p in ports], build
+        self._models: Dict[tuple, PortModel] = {}
+
+    def model(self, **params) -> PortModel:
+        key = tuple(sorted(params.items()))
+        if key not in self._models:
+            circ = Circuit()
+            self.build(circ, **params)
+            self._models[key] = circ.reduce(self.ports)
+        return self._models[key]
+
+class LUFactor:
+    """Factorización LU reutilizable: LAPACK (densa) o SuperLU con COLAMD (dispersa)"""
+    def __init__(self, A, sparse: bool):
+        self.sparse = sparse
+        if sparse:
+            self.lu = spla.splu(A, permc_spec='COLAMD')
+        else:
+            with warnings.catch_warnings():
+                warnings.simplefilter('ignore', la.LinAlgWarning)
+                self.lu = la.lu_factor(A, check_finite=False)
+            if not np.all(np.diag(self.lu[0])): raise np.linalg.LinAlgError("Matriz singular")
+
+    def solve(self, b, trans: bool = False):
+        if self.sparse: return self.lu.solve(b, trans='T' if trans else 'N')
+        return la.lu_solve(self.lu, b, trans=1 if trans else 0, check_finite=False)
+
+class BlockLU:
+    """LU de un sistema bloque-diagonal (salvo permutación): una LUFactor por componente conexa.
+    Cada bloque es un arreglo de índices de incógnitas; en las islas flotantes se quitó la
+    incógnita de referencia, que queda en 0. Misma interfaz solve() que LUFactor."""
+    def __init__(self, A, sparse: bool, blocks: List[np.ndarray]):
+        # Los bloques chicos se agrupan hasta BLOCK_GROUP_MAX incógnitas: factorizar la unión
+        # equivale a factorizarlos por separado (no hay acoplamiento) y ahorra llamadas, con un
+        # costo acotado por grupo (juntarlos todos costaría (Σn)³)
+        self.sparse, self.blocks, grupo, m = sparse, [], [], 0
+        for b in blocks:
+            if not len(b): continue
+            if len(b) >= BLOCK_GROUP_MAX: self.blocks.append(b); continue
+            if m + len(b) > BLOCK_GROUP_MAX: self.blocks.append(np.sort(np.concatenate(grupo))); grupo, m = [], 0
+            grupo.append(b); m += len(b)
+        if grupo: self.blocks.append(np.sort(np.concatenate(grupo)))
+        subs = self._submatrices(A, self.blocks) if sparse else None
+        def fact(k):
+            idx = self.blocks[k]
+            if not sparse: return LUFactor(A[np.ix_(idx, idx)], False)
+            # Los bloques chicos de un sistema disperso se factorizan densos (como solve() en 'auto')
+            return LUFactor(subs[k].tocsc(), True) if len(idx) > SPARSE_THRESHOLD else LUFactor(subs[k].toarray(), False)
+        big = [k for k, b in enumerate(self.blocks) if len(b) >= PARALLEL_BLOCK_MIN]
+        self.lus = [None] * len(self.blocks)
+        if len(big) > 1:
+            # LAPACK y SuperLU sueltan el GIL: los bloques grandes se factorizan en hilos
+            with ThreadPoolExecutor() as pool:
+                for k, lu in zip(big, pool.map(fact, big)): self.lus[k] = lu
+        for k in range(len(self.blocks)):
+            if self.lus[k] is None: self.lus[k] = fact(k)
+
+    @staticmethod
+    def _submatrices(A, blocks):
+        """Submatriz (COO, índices locales) de cada bloque en una sola pasada por los no nulos:
+        recortar A por filas y columnas en cada bloque recorrería la matriz entera cada vez"""
+        A = A.tocoo(); n = A.shape[0]
+        grp, loc = np.full(n, -1), np.zeros(n, dtype=int)
+        for k, idx in enumerate(blocks): grp[idx] = k; loc[idx] = np.arange(len(idx))
+        g = grp[A.row]; keep = (g >= 0) & (g == grp[A.col])
+        g, r, c, d = g[keep], loc[A.row[keep]], loc[A.col[keep]], A.data[keep]
+        orden = np.argsort(g, kind='stable')
+        cortes = np.searchsorted(g[orden], np.arange(1, len(blocks)))
+        return [sp.coo_matrix((d[o], (r[o], c[o])), shape=(len(b), len(b)))
+                for b, o in zip(blocks, np.split(orden, cortes))]
+
+    def solve(self, b, trans: bool = False):
+        x = np.zeros(np.shape(b))
+        for idx, lu in zip(self.blocks, self.lus): x[idx] = lu.solve(b[idx], trans)
+        return x
+
+class SPDFactor:
+    """Camino simétrico definido positivo. Sin fuentes flotantes (todas las fuentes de voltaje
+    e inductores con un terminal a tierra) y con resistencias positivas, el voltaje de los nodos
+    fijados por una fuente es conocido y se sustituye: queda G_FF·v_F = b_F - G_FX·v_X, con G_FF
+    SPD, en lugar del sistema aumentado indefinido. Cholesky de LAPACK (densa), CHOLMOD si está
+    instalado o, si no, SuperLU en modo simétrico (sin pivoteo, orden de mínimo grado sobre A+Aᵀ).
+    solve() devuelve la solución completa del sistema MNA, como LUFactor; la corriente de cada
+    fuente sale del KCL en su nodo. La matriz MNA es simétrica, así que trans no cambia nada."""
+    def __init__(self, A, sparse: bool, plan: StampPlan):
+        self.sparse, self.N = sparse, plan.N
+        self.free, self.fixed, self.sign, self.refs = plan.spd
+        self.rows = plan.N + np.arange(len(self.fixed))
+        free, fixed = self.free, self.fixed
+        if sparse:
+            Ar = A.tocsr()
+            S = Ar[free]
+            G_FF, self.G_FX, self.G_X = S[:, free].tocsc(), S[:, fixed], Ar[fixed][:, :plan.N]
+        else:
+            G_FF, self.G_FX, self.G_X = A[np.ix_(free, free)], A[np.ix_(free, fixed)], A[fixed, :plan.N]
+        self.chol = None
+        if not len(free): return
+        if not sparse:
+            self.chol = la.cho_factor(G_FF, check_finite=False)
+        elif cholmod_cholesky is not None:
+            try: self.chol = cholmod_cholesky(G_FF)
+            except CholmodError as e: raise np.linalg.LinAlgError(str(e))
+        else:
+            self.chol = spla.splu(G_FF, permc_spec='MMD_AT_PLUS_A', diag_pivot_thresh=0.0,
+                                  options={'SymmetricMode': True})
+
+    def _solve_free(self, r):
+        if not self.sparse: return la.cho_solve(self.chol, r, check_finite=False)
+        if cholmod_cholesky is not None: return self.chol(r)
+        return self.chol.solve(r)
+
+    def solve(self, b, trans: bool = False):
+        b = np.asarray(b, dtype=float)
+        sign = self.sign[:, None] if b.ndim == 2 else self.sign
+        x = np.zeros(b.shape)
+        vx = sign * b[self.rows]
+        x[self.fixed] = vx
+        if len(self.free): x[self.free] = self._solve_free(b[self.free] - self.G_FX @ vx)
+        # KCL en el nodo fijado: lo que no entregan las resistencias lo entrega la fuente
+        x[self.rows] = sign * (b[self.fixed] - self.G_X @ x[:self.N])
+        return x
+
+def _ic_preconditioner(K, drop_tol: float):
+    """Cholesky incompleto L·D·Lᵀ de K (SPD), tomado del ILU de SuperLU en modo simétrico
+    (sin pivoteo: U ≈ D·Lᵀ). Se guarda solo L y el precondicionador es simétrico, como
+    exige CG: M⁻¹ = Pᵀ L⁻ᵀ D⁻¹ L⁻¹ P"""
+    ilu = spla.spilu(K, drop_tol=drop_tol, fill_factor=50, drop_rule='basic', permc_spec='MMD_AT_PLUS_A',
+                     diag_pivot_thresh=0.0, options={'SymmetricMode': True})
+    d, p = ilu.U.diagonal(), ilu.perm_r
+    if not np.array_equal(p, ilu.perm_c) or d.min(initial=1.0) <= 0:
+        raise np.linalg.LinAlgError("Cholesky incompleto no definido positivo")
+    # L es triangular: su "LU" con orden natural no tiene relleno y resuelve L y Lᵀ en C
+    Lf = spla.splu(ilu.L.tocsc(), permc_spec='NATURAL', diag_pivot_thresh=0.0, options={'SymmetricMode': True})
+    def apply(r):
+        y = np.empty_like(r); y[p] = r
+        return Lf.solve(Lf.solve(y) / d, trans='T')[p]
+    return spla.LinearOperator(K.shape, apply)
+
+def _ilu_preconditioner(K, drop_tol: float):
+    """ILU con pivoteo del sistema aumentado (para GMRES; no es simétrico)"""
+    ilu = spla.spilu(K, drop_tol=drop_tol, fill_factor=50, drop_rule='basic', permc_spec='MMD_AT_PLUS_A')
+    return spla.LinearOperator(K.shape, ilu.solve)
+
+def _jacobi_preconditioner(K, n_nodes: int):
+    """Jacobi (positivo, sirve para CG y MINRES). En el sistema aumentado la diagonal de las
+    filas de rama es 0: se usa la del complemento de Schur Bᵀ diag(G)⁻¹ B"""
+    d = np.abs(K.diagonal())
+    inv = np.where(d[:n_nodes] > 0, 1.0 / np.where(d[:n_nodes] > 0, d[:n_nodes], 1.0), 0.0)
+    if K.shape[0] > n_nodes:
+        B = K[:n_nodes, n_nodes:]
+        d[n_nodes:] = B.multiply(B).T @ inv
+    d[d == 0] = 1.0
+    return sp.diags(1.0 / d)
+
+# Versión del motor para la caché de soluciones: va en cada clave y en el subdirectorio del
+# almacén en disco. Subirla cuando cambie el estampado, los solvers o el formato de resultados
+SOLUTION_CACHE_VERSION = 1
+
+class SolutionCache:
+    """Caché LRU de soluciones DC (voltages, results) indexada por Circuit.fingerprint(), para
+    no volver a resolver circuitos ya vistos (deshacer/rehacer, lotes repetidos). Con `path`
+    además guarda cada solución como JSON en path/v<SOLUTION_CACHE_VERSION>: persiste entre
+    corridas y se comparte entre procesos. Se puede usar desde varios hilos."""
+    def __init__(self, max_entries: int = 128, path: str = None):
+        self.max_entries = max_entries
+        self.path = os.path.join(path, f"v{SOLUTION_CACHE_VERSION}") if path else None
+        self._lru: OrderedDict = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = self.misses = 0
+        if path: os.makedirs(self.path, exist_ok=True)
+
+    def __len__(self): return len(self._lru)
+
+    @staticmethod
+    def _copy(sol):
+        # Copia de dos niveles: quien recibe la solución puede modificarla sin tocar la caché
+        voltages, results = sol
+        return dict(voltages), results.copy()
+
+    def _remember(self, key: str, sol):
+        with self._lock:
+            self._lru[key] = sol
+            self._lru.move_to_end(key)
+            while len(self._lru) > self.max_entries: self._lru.popitem(last=False)
+
+    def get(self, key: str):
+        with self._lock:
+            sol = self._lru.get(key)
+            if sol is not None: self._lru.move_to_end(key)
+        if sol is None and self.path:
+            try:
+                with open(os.path.join(self.path, key + '.json'), encoding='utf-8') as fh: voltages, state = json.load(fh)
+                sol = (voltages, CircuitResults(**state))
+                self._remember(key, sol)
+            except (OSError, ValueError, TypeError):
+                sol = None
+        with self._lock:
+            if sol is None: self.misses += 1
+            else: self.hits += 1
+        return None if sol is None else self._copy(sol)
+
+    def put(self, key: str, voltages, results):
+        sol = self._copy((voltages, results))
+        self._remember(key, sol)
+        if self.path:
+            # Escritura atómica: otro proceso nunca lee un archivo a medio escribir
+            final = os.path.join(self.path, key + '.json')
+            tmp = f"{final}.{os.getpid()}.{threading.get_ident()}.tmp"
+            with open(tmp, 'w', encoding='utf-8') as fh: json.dump((sol[0], sol[1].state()), fh)
+            os.replace(tmp, final)
+
+    def clear(self):
+        with self._lock: self._lru.clear()
+
+class PhaseTimer:
+    """Contadores de tiempo por fase: cantidad, total y última duración (segundos).
+    Deshabilitado, phase() devuelve siempre el mismo contexto nulo: el costo es un if."""
+    _NULL = nullcontext()
+
+    def __init__(self, enabled: bool = False):
+        self.enabled = enabled
+        self.stats: Dict[str, List[float]] = {}
+
+    def phase(self, name: str):
+        return _Phase(self, name) if self.enabled else self._NULL
+
+    def record(self, name: str, dt: float):
+        st = self.stats.get(name)
+        if st is None: st = self.stats[name] = [0, 0.0, 0.0]
+        st[0] += 1; st[1] += dt; st[2] = dt
+
+    def report(self) -> Dict[str, Dict[str, float]]:
+        return {name: {'count': c, 'total': t, 'last': last, 'mean': t / c}
+                for name, (c, t, last) in self.stats.items()}
+
+    def reset(self): self.stats.clear()
+
+class _Phase:
+    __slots__ = ('timer', 'name', 't0')
+    def __init__(self, timer: PhaseTimer, name: str): self.timer, self.name = timer, name
+    def __enter__(self): self.t0 = time.perf_counter()
+    def __exit__(self, *exc): self.timer.record(self.name, time.perf_counter() - self.t0)
+
+class ElementStore:
+    """Almacenamiento columnar de un tipo de elemento: nombres, IDs enteros de nodo y valores.
+    Los agregados individuales se acumulan en listas y los lotes como arreglos; todo se
+    concatena recién cuando se leen las columnas."""
     def __init__(self):
-        self.resistors: List[Resistor] = []
-        self.vsources: List[VSource] = []
-        self.isources: List[ISource] = []
-        self.nodes: set = set()
+        self.names: List[str] = []
+        self._chunks: List[Tuple[np.ndarray, np.ndarray, np.ndarray]] = []
+        self._pending: Tuple[list, list, list] = ([], [], [])
+
+    def __len__(self): return len(self.names)
+
+    def append(self, name: str, n1: int, n2: int, value: float):
+        self.names.append(name)
+        self._pending[0].append(n1); self._pending[1].append(n2); self._pending[2].append(value)
+
+    def extend(self, names: List[str], n1: np.ndarray, n2: np.ndarray, values: np.ndarray):
+        self._flush()
+        self.names.extend(names); self._chunks.append((n1, n2, values))
+
+    def _flush(self):
+        if self._pending[0]:
+            p1, p2, pv = self._pending
+            self._chunks.append((np.array(p1, dtype=np.int64), np.array(p2, dtype=np.int64), np.array(pv, dtype=float)))
+            self._pending = ([], [], [])
+
+    def _columns(self):
+        self._flush()
+        if len(self._chunks) != 1:
+            if not self._chunks: self._chunks = [(np.empty(0, np.int64), np.empty(0, np.int64), np.empty(0))]
+            else: self._chunks = [tuple(np.concatenate(col) for col in zip(*self._chunks))]
+        return self._chunks[0]
+
+    @property
+    def n1(self) -> np.ndarray: return self._columns()[0]
+    @property
+    def n2(self) -> np.ndarray: return self._columns()[1]
+    @property
+    def values(self) -> np.ndarray: return self._columns()[2]
+
+# --- MODELOS NO LINEALES ---
+# Cada modelo recibe los voltajes de terminal (k×T) y los parámetros (k×P) de todos los
+# dispositivos de un tipo y devuelve, vectorizado, la corriente que entra al dispositivo por
+# cada terminal (k×T) y el jacobiano J[k, t, u] = dI_t/dV_u (k×T×T).
+
+def _limexp(x: np.ndarray):
+    """exp(x) y su derivada, continuadas en forma lineal por encima de EXP_LIM (evita desbordes)"""
+    xc = np.minimum(x, EXP_LIM)
+    e = np.exp(xc)
+    return e * (1.0 + x - xc), e
+
+def _diode(V, P):
+    Is, nvt = P[:, 0], P[:, 1] * VT
+    e, de = _limexp((V[:, 0] - V[:, 1]) / nvt)
+    i, g = Is * (e - 1.0), Is * de / nvt
+    J = np.empty((len(i), 2, 2))
+    J[:, 0, 0] = J[:, 1, 1] = g; J[:, 0, 1] = J[:, 1, 0] = -g
+    return np.column_stack((i, -i)), J
+
+def _bjt(V, P):
+    """Terminales (C, B, E). Con p = ±1 (npn/pnp) los voltajes y corrientes se reflejan;
+    como p² = 1 el jacobiano no cambia de signo"""
+    Is, bf, br, p = P[:, 0], P[:, 1], P[:, 2], P[:, 3]
+    ef, dff = _limexp(p * (V[:, 1] - V[:, 2]) / VT)
+    er, drr = _limexp(p * (V[:, 1] - V[:, 0]) / VT)
+    ic = Is * (ef - er) - Is / br * (er - 1.0)
+    ib = Is / bf * (ef - 1.0) + Is / br * (er - 1.0)
+    # Derivadas respecto de vbe y vbc
+    c_be, c_bc = Is * dff / VT, -Is * drr / VT * (1.0 + 1.0 / br)
+    b_be, b_bc = Is / bf * dff / VT, Is / br * drr / VT
+    J = np.empty((len(ic), 3, 3))
+    # vbe = p(Vb - Ve), vbc = p(Vb - Vc)
+    J[:, 0, 0], J[:, 0, 1], J[:, 0, 2] = -c_bc, c_be + c_bc, -c_be
+    J[:, 1, 0], J[:, 1, 1], J[:, 1, 2] = -b_bc, b_be + b_bc, -b_be
+    J[:, 2] = -(J[:, 0] + J[:, 1])
+    Ic, Ib = p * ic, p * ib
+    return np.column_stack((Ic, Ib, -(Ic + Ib))), J
+
+def _mosfet(V, P):
+    """Terminales (D, G, S), simétrico: con vds < 0 drenador y fuente intercambian su papel"""
+    K, vth, lam, p = P[:, 0], P[:, 1], P[:, 2], P[:, 3]
+    vds = p * (V[:, 0] - V[:, 2])
+    rev = vds < 0
+    vgs = p * (V[:, 1] - np.where(rev, V[:, 0], V[:, 2]))
+    vds = np.abs(vds)
+    vov = np.maximum(vgs - vth, 0.0)
+    clm = 1.0 + lam * vds
+    lin = vds < vov
+    vsat = np.where(lin, vds, vov)
+    base = K * (vov * vsat - vsat**2 / 2)
+    i = base * clm
+    gm = K * vsat * clm
+    gds = np.where(lin, K * (vov - vds) * clm, 0.0) + base * lam
+    # Corriente que entra por D; en modo inverso entra por S
+    Id = np.where(rev, -p * i, p * i)
+    dD = np.where(rev, gm + gds, gds); dG = np.where(rev, -gm, gm); dS = np.where(rev, -gds, -(gm + gds))
+    J = np.zeros((len(i), 3, 3))
+    J[:, 0, 0], J[:, 0, 1], J[:, 0, 2] = dD, dG, dS
+    J[:, 2] = -J[:, 0]
+    return np.column_stack((Id, np.zeros(len(i)), -Id)), J
+
+# Tipo -> (modelo, nombres de los parámetros)
+DEVICE_MODELS = {'D': (_diode, ('Is', 'n')), 'Q': (_bjt, ('Is', 'beta_f', 'beta_r', 'polarity')),
+                 'M': (_mosfet, ('K', 'vth', 'lam', 'polarity'))}
+POLARITY = {'npn': 1.0, 'pnp': -1.0, 'nmos': 1.0, 'pmos': -1.0}
+
+class DeviceStore:
+    """Dispositivos no lineales de un tipo: nombres, IDs de nodo por terminal (k×T) y
+    parámetros del modelo (k×P)"""
+    def __init__(self, terminals: int):
+        self.terminals = terminals
+        self.names: List[str] = []
+        self._nodes: List[Tuple[int, ...]] = []
+        self._params: List[Tuple[float, ...]] = []
+
+    def __len__(self): return len(self.names)
+
+    def append(self, name: str, ids, params):
+        self.names.append(name); self._nodes.append(tuple(ids)); self._params.append(tuple(params))
+
+    @property
+    def nodes(self) -> np.ndarray: return np.array(self._nodes, dtype=np.int64).reshape(-1, self.terminals)
+    @property
+    def params(self) -> np.ndarray: return np.array(self._params, dtype=float).reshape(len(self.names), -1)
+
+def _pair_stamp(i: np.ndarray, j: np.ndarray):
+    """Plantilla de un elemento de dos terminales: (i,i,+) (j,j,+) (i,j,-) (j,i,-) sin las filas
+    de tierra. Devuelve filas, columnas, elemento de cada entrada y signo"""
+    k = np.arange(len(i))
+    mi, mj = i >= 0, j >= 0
+    both = mi & mj
+    rows = np.concatenate((i[mi], j[mj], i[both], j[both]))
+    cols = np.concatenate((i[mi], j[mj], j[both], i[both]))
+    return rows, cols, np.concatenate((k[mi], k[mj], k[both], k[both])), \
+        np.repeat([1.0, -1.0], [mi.sum() + mj.sum(), 2 * both.sum()])
+
+def _grounded_components(a: np.ndarray, b: np.ndarray, n: int):
+    """Componentes conexas de n incógnitas unidas por las aristas (a, b), con -1 = tierra.
+    Devuelve la etiqueta de cada incógnita y, por componente, si alguna arista la une a tierra.
+    Las aristas de tierra a tierra (p. ej. una resistencia entre '0' y 'GND') no cuentan"""
+    inner = (a >= 0) & (b >= 0)
+    graph = sp.coo_matrix((np.ones(inner.sum()), (a[inner], b[inner])), shape=(n, n))
+    _, labels = csgraph.connected_components(graph, directed=False)
+    grounded = np.zeros(labels.max(initial=-1) + 1, dtype=bool)
+    grounded[labels[np.concatenate((a[(b < 0) & (a >= 0)], b[(a < 0) & (b >= 0)]))]] = True
+    return labels, grounded
+
+class StampPlan:
+    """Topología compilada (Circuit.compile): los índices de estampado como arreglos enteros,
+    calculados una sola vez. El índice -1 representa la tierra: los vectores de trabajo llevan
+    una posición extra al final que absorbe (o lee como 0) todo lo que va a tierra."""
+    def __init__(self, circ: Circuit):
+        self.version = circ._version
+        res, vsrc, isrc = circ._stores['R'], circ._stores['V'], circ._stores['I']
+        cap, ind = circ._stores['C'], circ._stores['L']
+        node_idx, self.unknowns = circ._supernode_index()
+        # Incógnitas de rama: primero las fuentes de voltaje y después los inductores
+        N, M = len(self.unknowns), len(vsrc) + len(ind)
+        self.N, self.M, self.n = N, M, N + M
+        self.l_row = N + len(vsrc)
+
+        self.r_names, self.v_names, self.s_names = res.names, vsrc.names, isrc.names
+        self.c_names, self.l_names = cap.names, ind.names
+        self.w_names = circ._stores['W'].names
+        self.r_i, self.r_j = node_idx[res.n1], node_idx[res.n2]
+        self.v_p, self.v_m = node_idx[vsrc.n1], node_idx[vsrc.n2]
+        self.s_f, self.s_t = node_idx[isrc.n1], node_idx[isrc.n2]
+        self.c_i, self.c_j = node_idx[cap.n1], node_idx[cap.n2]
+        self.l_p, self.l_m = node_idx[ind.n1], node_idx[ind.n2]
+        order = sorted(range(1, len(circ._node_names)), key=circ._node_names.__getitem__)
+        self.node_names = [circ._node_names[k] for k in order]
+        self.node_ids = np.array(order, dtype=np.int64)
+        self.node_cols = node_idx[self.node_ids]
+
+        # Referencias a los valores del almacén: Circuit.set_value los modifica en el lugar
+        self.R, self.V, self.I = res.values, vsrc.values, isrc.values
+        self.C, self.L = cap.values, ind.values
 
-    def _add_node(self, node: str):
-        if str(node).upper() in ['GND', 'TIERRA', '0']: node = '0'
-        self.nodes.add(str(node))
+        # Entradas fijas: GMIN (nodos flotantes) y bloques B/Bᵀ de las fuentes de voltaje e inductores
+        kv = np.arange(M)
+        rows, cols, vals = [np.arange(N)], [np.arange(N)], [np.full(N, GMIN)]
+        for nodes, sg in ((np.concatenate((self.v_p, self.l_p)), 1.0), (np.concatenate((self.v_m, self.l_m)), -1.0)):
+            m = nodes >= 0
+            rows += [nodes[m], N + kv[m]]; cols += [N + kv[m], nodes[m]]; vals.append(np.full(2 * m.sum(), sg))
+        # Subcircuitos: el Y de cada instancia es fijo (va a la base) y su J va al lado derecho.
+        # Se agrupan las instancias que comparten modelo para evaluarlas juntas
+        groups: Dict[int, list] = {}
+        for name, _, ids, _, model in circ._subckts:
+            groups.setdefault(id(model), [model, [], []])
+            groups[id(model)][1].append(name); groups[id(model)][2].append(ids)
+        self.subckts = []
+        for model, names, ids in groups.values():
+            ids = np.array(ids, dtype=np.int64).reshape(len(names), -1)
+            tn, p = node_idx[ids], ids.shape[1]
+            rr, cc = np.repeat(tn, p, axis=1).ravel(), np.tile(tn, (1, p)).ravel()
+            m = (rr >= 0) & (cc >= 0)
+            rows.append(rr[m]); cols.append(cc[m]); vals.append(np.tile(model.Y.ravel(), len(names))[m])
+            self.subckts.append((names, ids, tn, model))
+        s_rows, s_cols, s_vals = np.concatenate(rows), np.concatenate(cols), np.concatenate(vals)
+        # Diagonal de los inductores: 0 en DC, -L/h (o -2L/h) en transitorio
+        l_diag = self.l_row + np.arange(len(self.L))
 
-    def add_resistor(self, name: str, n1: str, n2: str, R: float):
-        self.resistors.append(Resistor(name, str(n1), str(n2), float(R)))
-        self._add_node(n1); self._add_node(n2)
+        # Plantillas de resistencias y capacitores (conductancia g o C/h)
+        r_rows, r_cols, self.res_idx, self.res_sign = _pair_stamp(self.r_i, self.r_j)
+        c_rows, c_cols, self.cap_idx, self.cap_sign = _pair_stamp(self.c_i, self.c_j)
 
-    def add_vsource(self, name: str, n_plus: str, n_minus: str, V: float):
-        self.vsources.append(VSource(name, str(n_plus), str(n_minus), float(V)))
-        self._add_node(n_plus); self._add_node(n_minus)
+        # Dispositivos no lineales: bloque T×T del jacobiano de cada uno, sin filas ni columnas de tierra
+        self.devices = []
+        d_rows, d_cols = [np.empty(0, np.int64)], [np.empty(0, np.int64)]
+        for kind, st in circ._devices.items():
+            if not len(st): continue
+            tn, T = node_idx[st.nodes], st.terminals
+            rr, cc = np.repeat(tn, T, axis=1).ravel(), np.tile(tn, (1, T)).ravel()
+            m = (rr >= 0) & (cc >= 0)
+            d_rows.append(rr[m]); d_cols.append(cc[m])
+            # Para bincount la tierra (-1) va a la posición extra n
+            self.devices.append((kind, st.names, tn, np.where(tn < 0, N + M, tn).ravel(), st.params, m))
+        d_rows, d_cols = np.concatenate(d_rows), np.concatenate(d_cols)
 
-    def add_isource(self, name: str, n_from: str, n_to: str, I: float):
-        self.isources.append(ISource(name, str(n_from), str(n_to), float(I)))
-        self._add_node(n_from); self._add_node(n_to)
+        # Patrón CSC fijo: en orden columna-mayor la posición de cada entrada sale de np.unique
+        n = self.n
+        uniq, pos = np.unique(np.concatenate((s_cols * n + s_rows, l_diag * (n + 1), r_cols * n + r_rows,
+                                              c_cols * n + c_rows, d_cols * n + d_rows)), return_inverse=True)
+        self.nnz = len(uniq)
+        self.indices, self.indptr = uniq % n, np.searchsorted(uniq // n, np.arange(n + 1))
+        self.flat = (uniq % n) * n + uniq // n
+        a, b = len(s_vals), len(s_vals) + len(l_diag)
+        c, d = b + len(r_rows), b + len(r_rows) + len(c_rows)
+        self.base = np.bincount(pos[:a], weights=s_vals, minlength=self.nnz).astype(float)
+        # Las primeras N entradas fijas son las diagonales de los nodos (GMIN)
+        self.pos_diag = pos[:N]
+        self.pos_ind, self.pos_res, self.pos_cap, self.pos_dev = pos[a:b], pos[b:c], pos[c:d], pos[d:]
+
+        self._compile_components()
+        self._compile_spd()
+        self._compile_wires(circ)
+        self._layout, self._base_csc = None, {}
+
+    def _compile_components(self):
+        """Componentes conexas del grafo de conducción en DC sin el nodo de tierra (resistencias,
+        fuentes de voltaje, inductores y dispositivos; capacitores y fuentes de corriente no
+        conectan). Sin la fila y columna de tierra la matriz es bloque-diagonal por componente.
+        blocks: incógnitas de cada componente que toca tierra y de cada isla flotante sin su
+        referencia (la primera incógnita de nodo de la isla); islands: incógnitas de cada isla"""
+        n, N = self.n, self.N
+        br = np.arange(N, n)
+        a = [self.r_i, br, br]
+        b = [self.r_j, np.concatenate((self.v_p, self.l_p)), np.concatenate((self.v_m, self.l_m))]
+        for _, _, tn, _, _, _ in self.devices:
+            for t in range(1, tn.shape[1]):
+                a.append(tn[:, 0]); b.append(tn[:, t])
+        # Subcircuitos: puertos acoplados por Y y puertos con conducción interna a tierra
+        for _, _, tn, model in self.subckts:
+            Y = model.Y
+            for i, j in zip(*np.nonzero(np.triu(Y, 1))):
+                a.append(tn[:, i]); b.append(tn[:, j])
+            to_ground = np.abs(Y.sum(axis=1)) > 1e-12 * np.abs(np.diag(Y))
+            for i in np.flatnonzero(to_ground):
+                a.append(tn[:, i]); b.append(np.full(len(tn), -1))
+        a, b = np.concatenate(a), np.concatenate(b)
+        self.edges = (a, b)
+        labels, grounded = _grounded_components(a, b, n)
+        order = np.argsort(labels, kind='stable')
+        cuts = np.flatnonzero(np.diff(labels[order])) + 1
+        self.blocks, self.islands = [], []
+        for idx in np.split(order, cuts) if n else []:
+            if grounded[labels[idx[0]]]: self.blocks.append(idx)
+            else:
+                self.islands.append(idx)
+                self.blocks.append(idx[1:])
+        # Caso común: una sola componente, con tierra (se factoriza la matriz completa)
+        self.decomposed = len(self.blocks) != 1 or bool(self.islands)
+
+    def _compile_spd(self):
+        """Partición de SPDFactor: (libres, nodo fijado por cada rama, signo, referencias de islas),
+        o None si hay dispositivos o alguna fuente de voltaje o inductor sin terminal a tierra.
+        El signo es +1 si el terminal + va al nodo (v = V) y -1 si va el - (v = -V)"""
+        self.spd = None
+        p, m = np.concatenate((self.v_p, self.l_p)), np.concatenate((self.v_m, self.l_m))
+        if self.devices or not ((p < 0) ^ (m < 0)).all(): return
+        for _, _, _, model in self.subckts:
+            Y = model.Y
+            if not np.allclose(Y, Y.T) or np.linalg.eigvalsh(Y).min(initial=0.0) < -1e-12 * np.abs(Y).max(initial=0.0): return
+        node = np.where(p >= 0, p, m)
+        refs = np.array([isl[0] for isl in self.islands], dtype=np.int64)
+        fixed = np.concatenate((node, refs))
+        # Dos fuentes sobre el mismo nodo: sistema singular, lo reporta la LU
+        if len(np.unique(fixed)) != len(fixed): return
+        self.spd = (np.setdiff1d(np.arange(self.N), fixed), node, np.where(p >= 0, 1.0, -1.0), refs)
+
+    def _compile_wires(self, circ: Circuit):
+        """Prepara la recuperación de corrientes de cables por KCL: se toma un bosque generador
+        del grafo de cables y se factoriza su matriz de incidencia sin las raíces (cuadrada y no
+        singular). Los cables fuera del bosque (lazos de cables) quedan en 0 A."""
+        res, vsrc, isrc, cap, ind, w = (circ._stores[k] for k in 'RVICLW')
+        n_all = self.n_all = len(circ._node_names)
+        self.b_a = np.concatenate((res.n1, vsrc.n1, isrc.n1, cap.n1, ind.n1))
+        self.b_b = np.concatenate((res.n2, vsrc.n2, isrc.n2, cap.n2, ind.n2))
+        # IDs de nodo de cada terminal de los dispositivos (en el orden de plan.devices) y después
+        # de cada puerto de los subcircuitos (en el orden de plan.subckts)
+        self.d_nodes = np.concatenate([circ._devices[kind].nodes.ravel() for kind, *_ in self.devices]
+                                      + [ids.ravel() for _, ids, _, _ in self.subckts] or [np.empty(0, np.int64)])
+        # Incidencia nodo × corriente (ramas R, V, I, C, L, terminales y cables, en ese orden):
+        # +1 donde la corriente sale del nodo y -1 donde entra. La KCL es incidence @ corrientes = 0.
+        # Lo que entra a un subcircuito por sus puertos vuelve por la tierra global (fila 0)
+        nb, nd = len(self.b_a), len(self.d_nodes)
+        cols = np.arange(nb + nd + len(w))
+        sub = cols[nb + nd - sum(ids.size for _, ids, _, _ in self.subckts):nb + nd]
+        self.incidence = sp.csr_matrix(
+            (np.concatenate((np.ones(nb + nd), -np.ones(nb + len(sub)), np.ones(len(w)), -np.ones(len(w)))),
+             (np.concatenate((self.b_a, self.d_nodes, self.b_b, np.zeros(len(sub), np.int64), w.n1, w.n2)),
+              np.concatenate((cols[:nb + nd], cols[:nb], sub, cols[nb + nd:], cols[nb + nd:])))),
+            shape=(n_all, len(cols)))
+        self.wire_tree = None
+        if not len(w): return
+
+        a, b = np.minimum(w.n1, w.n2), np.maximum(w.n1, w.n2)
+        ok = a != b
+        graph = sp.coo_matrix((np.ones(ok.sum()), (a[ok], b[ok])), shape=(n_all, n_all)).tocsr()
+        tree = csgraph.minimum_spanning_tree(graph).tocoo()
+        if tree.nnz == 0: return
+        ta, tb = np.minimum(tree.row, tree.col), np.maximum(tree.row, tree.col)
+        # Cable de cada arista del bosque (con cables en paralelo se usa el primero)
+        keys, first = np.unique(np.where(ok, a * n_all + b, -1), return_index=True)
+        tw = first[np.searchsorted(keys, ta * n_all + tb)]
+
+        # Una raíz por componente: el nodo de menor ID, que es la tierra (ID 0) si está incluida
+        _, labels = csgraph.connected_components(graph, directed=False)
+        wn = np.unique(np.concatenate((ta, tb)))
+        _, first_in_comp = np.unique(labels[wn], return_index=True)
+        rows_nodes = np.setdiff1d(wn, wn[first_in_comp])
+        row_of = np.full(n_all + 1, -1); row_of[rows_nodes] = np.arange(len(rows_nodes))
+        r1, r2 = row_of[w.n1[tw]], row_of[w.n2[tw]]
+        e = np.arange(len(tw))
+        D = sp.csc_matrix((np.concatenate((np.ones((r1 >= 0).sum()), -np.ones((r2 >= 0).sum()))),
+                           (np.concatenate((r1[r1 >= 0], r2[r2 >= 0])), np.concatenate((e[r1 >= 0], e[r2 >= 0])))),
+                          shape=(len(tw), len(tw)))
+        self.wire_tree = (spla.splu(D), rows_nodes, tw)
+
+    def result_layout(self):
+        """Nombres de los resultados (R, V, I, C, L, dispositivos, subcircuitos y cables), su
+        índice y los nodos de la KCL con sus IDs. Se arma una vez por topología y lo comparten
+        todos los CircuitResults de este plan"""
+        if self._layout is None:
+            names = (self.r_names + self.v_names + self.s_names + self.c_names + self.l_names
+                     + [nm for _, dn, *_ in self.devices for nm in dn] + [nm for sn, *_ in self.subckts for nm in sn]
+                     + self.w_names)
+            self._layout = (names, {nm: k for k, nm in enumerate(names)}, ['0'] + self.node_names,
+                            np.append(0, self.node_ids))
+        return self._layout
+
+    def base_matrix(self, gmin: bool = True):
+        """Parte fija de la matriz (GMIN, bloques B/Bᵀ e Y de los subcircuitos) como CSC, armada
+        una vez por plan: A = base_matrix() + resistencias"""
+        if gmin not in self._base_csc:
+            base = self.base
+            if not gmin: base = base.copy(); base[self.pos_diag] -= GMIN
+            self._base_csc[gmin] = self.assemble(base, True)
+        return self._base_csc[gmin]
+
+    def g(self) -> np.ndarray:
+        return conductances(self.R)
+
+    def data(self, g: np.ndarray = None, gc: np.ndarray = None, rl: np.ndarray = None, gmin: bool = True) -> np.ndarray:
+        """Valores de la matriz MNA [G B; Bᵀ 0] sobre el patrón fijo, con un único bincount.
+        gc y rl son los modelos compañeros del transitorio (C/h por capacitor, L/h por inductor).
+        gmin=False quita la regularización (la resolución DC por bloques no la necesita)"""
+        if g is None: g = self.g()
+        base = self.base
+        if not gmin: base = base.copy(); base[self.pos_diag] -= GMIN
+        data = base + np.bincount(self.pos_res, weights=g[self.res_idx] * self.res_sign, minlength=self.nnz)
+        if gc is not None: data += np.bincount(self.pos_cap, weights=gc[self.cap_idx] * self.cap_sign, minlength=self.nnz)
+        if rl is not None: data[self.pos_ind] -= rl
+        return data
+
+    def matrix(self, sparse: bool, g: np.ndarray = None, gc: np.ndarray = None, rl: np.ndarray = None,
+               gmin: bool = True):
+        return self.assemble(self.data(g, gc, rl, gmin), sparse)
+
+    def assemble(self, data: np.ndarray, sparse: bool):
+        if sparse: return sp.csc_matrix((data, self.indices, self.indptr), shape=(self.n, self.n))
+        A = np.zeros(self.n * self.n); A[self.flat] = data
+        return A.reshape(self.n, self.n)
+
+    def device_eval(self, xe: np.ndarray):
+        """Evalúa los dispositivos en xe (solución con la posición de tierra al final).
+        Devuelve la corriente que sale de cada incógnita hacia los dispositivos y los valores
+        del jacobiano en el orden de pos_dev"""
+        out, jv = np.zeros(self.n + 1), []
+        for kind, _, tn, tb, P, m in self.devices:
+            I, J = DEVICE_MODELS[kind][0](xe[tn], P)
+            out += np.bincount(tb, weights=I.ravel(), minlength=self.n + 1)
+            jv.append(J.ravel()[m])
+        return out[:self.n], np.concatenate(jv) if jv else np.empty(0)
+
+    def rhs(self) -> np.ndarray:
+        z = np.zeros(self.n + 1)
+        z[self.N:self.l_row] = self.V
+        np.subtract.at(z, self.s_f, self.I); np.add.at(z, self.s_t, self.I)
+        for _, _, tn, model in self.subckts: np.add.at(z, tn, np.broadcast_to(model.J, tn.shape))
+        return z[:self.n]
+
+    def subckt_currents(self, xe: np.ndarray) -> np.ndarray:
+        """Corriente que entra a cada puerto de cada subcircuito (Y·v - J), en el orden de
+        subckts y por filas. xe lleva la tierra al final; admite una columna por punto de barrido"""
+        out = []
+        for _, _, tn, model in self.subckts:
+            V = xe[tn]
+            I = np.moveaxis(np.tensordot(model.Y, V, axes=([1], [1])), 0, 1)
+            out.append((I - model.J.reshape((-1,) + (1,) * (V.ndim - 2))).reshape((-1,) + V.shape[2:]))
+        return np.concatenate(out) if out else np.zeros((0,) + xe.shape[1:])
+
+    def unit_vector(self, i: int, j: int) -> np.ndarray:
+        """Vector de incidencia e_i - e_j (sin la fila de tierra)"""
+        u = np.zeros(self.n + 1); u[i] += 1.0; u[j] -= 1.0
+        return u[:self.n]
+
+    def wire_currents(self, i_branch: np.ndarray, i_term: np.ndarray = None) -> np.ndarray:
+        """Corriente de cada cable dadas las corrientes de R, V, I, C, L (en ese orden) y las de
+        terminal de los dispositivos y puertos de subcircuitos. Admite una columna extra por punto de barrido."""
+        tail = i_branch.shape[1:]
+        out = np.zeros((self.n_all,) + tail)
+        np.add.at(out, self.b_a, i_branch); np.subtract.at(out, self.b_b, i_branch)
+        if i_term is not None: np.add.at(out, self.d_nodes, i_term)
+        iw = np.zeros((len(self.w_names),) + tail)
+        if self.wire_tree is not None:
+            # KCL en cada nodo no raíz: corriente que sale por los cables = -(la que sale por el resto)
+            lu, rows_nodes, tw = self.wire_tree
+            iw[tw] = lu.solve(-out[rows_nodes])
+        return iw
+
+# Memoria máxima (en floats) de un lote de matrices densas apiladas en Monte Carlo
+MC_DENSE_BATCH_FLOATS = 4_000_000
+# Percentiles de Monte Carlo: histograma por nodo de entre MC_HIST_BINS intervalos, con a lo
+# sumo MC_HIST_CELLS celdas (nodos × intervalos) por lote
+MC_HIST_BINS = (64, 4096)
+MC_HIST_CELLS = 4_000_000
+
+def _mc_histogram(V: np.ndarray, hist) -> np.ndarray:
+    """Cuentas por nodo (columnas de V) en los intervalos fijos hist = (lo, w, bins): la
+    columna 0 cuenta lo que cae por debajo de lo y la bins+1 lo que pasa de lo + bins·w"""
+    lo, w, bins = hist
+    k = np.floor((V - lo) / np.where(w > 0, w, 1.0)) + 1
+    k = np.clip(np.where(w > 0, k, 1), 0, bins + 1).astype(np.int64)
+    cols = V.shape[1]
+    return np.bincount((k + np.arange(cols) * (bins + 2)).ravel(), minlength=cols * (bins + 2)) \
+        .reshape(cols, bins + 2).astype(np.int32)
+
+def _hist_percentiles(H: np.ndarray, hist, vmin: np.ndarray, vmax: np.ndarray, q, count: int):
+    """Percentiles (definición lineal de np.percentile) a partir de los histogramas fusionados,
+    interpolando dentro del intervalo; los desbordes se interpolan hasta el mín/máx global"""
+    lo, w, bins = hist
+    cum, rows = np.cumsum(H, axis=1), np.arange(H.shape[0])
+    left_edge = lambda b: np.where(b == 0, vmin, lo + (np.minimum(b, bins + 1) - 1) * w)
+    right_edge = lambda b: np.where(b == bins + 1, vmax, np.where(b == 0, lo, lo + b * w))
+    out = {}
+    for p in q:
+        r = p / 100.0 * (count - 1) + 0.5
+        b = np.minimum((cum < r).sum(axis=1), bins + 1)
+        before = np.where(b > 0, cum[rows, np.maximum(b - 1, 0)], 0)
+        frac = np.clip((r - before) / np.maximum(H[rows, b], 1), 0.0, 1.0)
+        a, c = left_edge(b), right_edge(b)
+        out[float(p)] = np.clip(a + frac * (c - a), vmin, vmax)
+    return out
+
+def _mc_batch(task):
+    """Lote de Monte Carlo: sortea todas las perturbaciones del lote de una vez, arma las
+    matrices de forma vectorizada y devuelve solo estadísticas parciales.
+    Es una función de módulo para poder ejecutarse en otro proceso."""
+    plan, seed, K = task
+    rng = np.random.default_rng(seed)
+    R0, tol, n = plan['R0'], plan['tol'], plan['n']
+    if plan['dist'] == 'normal': dev = rng.normal(0.0, tol / 3.0, (K, len(R0)))
+    else: dev = rng.uniform(-tol, tol, (K, len(R0)))
+    g = conductances(R0 * (1.0 + dev))
+    # Valores de la matriz en el patrón CSC fijo: base + contribución de cada resistencia
+    data = plan['base'][None, :] + (plan['P'].T @ g.T).T
+
+    X = np.empty((K, n))
+    if plan['sparse']:
+        # Patrón con las columnas ya reordenadas (orden de COLAMD calculado una vez en el plan):
+        # cada muestra solo hace la factorización numérica, sin volver a ordenar
+        pidx, indices, indptr, q = plan['order']
+        for k in range(K):
+            A = sp.csc_matrix((data[k][pidx], indices, indptr), shape=(n, n))
+            X[k, q] = spla.splu(A, permc_spec='NATURAL').solve(plan['z'])
+    else:
+        step = max(1, MC_DENSE_BATCH_FLOATS // (n * n))
+        for a in range(0, K, step):
+            b = min(K, a + step)
+            A = np.zeros((b - a, n * n)); A[:, plan['flat']] = data[a:b]
+            X[a:b] = np.linalg.solve(A.reshape(b - a, n, n), np.broadcast_to(plan['z'], (b - a, n))[..., None])[..., 0]
+
+    # Columna extra de ceros: el índice -1 (tierra) lee 0 V
+    V = np.hstack((X, np.zeros((K, 1))))[:, plan['cols']]
+    mean = V.mean(axis=0)
+    # El lote piloto (sin intervalos todavía) devuelve sus muestras para fijarlos
+    H = _mc_histogram(V, plan['hist']) if plan.get('hist') else V
+    return K, mean, ((V - mean)**2).sum(axis=0), V.min(axis=0), V.max(axis=0), H
+
+# Plan de Monte Carlo de cada proceso del pool: se envía una sola vez al iniciarlo, no con cada lote
+_MC_WORKER_PLAN = None
+
+def _mc_init(plan):
+    global _MC_WORKER_PLAN
+    _MC_WORKER_PLAN = plan
+
+def _mc_worker(task):
+    seed, K = task
+    return _mc_batch((_MC_WORKER_PLAN, seed, K))
+
+class Circuit:
+    def __init__(self, max_lowrank_updates: int = 8, cholesky: bool = True):
+        # Almacenamiento columnar por tipo: R, V, I, cables (W), capacitores (C) e inductores (L)
+        self._stores: Dict[str, ElementStore] = {k: ElementStore() for k in 'RVIWCL'}
+        # Dispositivos no lineales: diodos (D), BJT (Q) y MOSFET (M)
+        self._devices: Dict[str, DeviceStore] = {'D': DeviceStore(2), 'Q': DeviceStore(3), 'M': DeviceStore(3)}
+        # Instancias de subcircuitos: (nombre, definición, IDs de nodo, parámetros, modelo reducido)
+        self._subckts: List[tuple] = []
+        # Nodos internados: nombre -> ID entero (la tierra siempre es el ID 0)
+        self._node_ids: Dict[str,int] = {}
+        self._node_names: List[str] = []
+        self._node_id('0')
+        self._by_name: Dict[str, Tuple[str,int]] = {}
+        # Caché de la última factorización + actualizaciones de bajo rango (Woodbury)
+        self.max_lowrank_updates = max_lowrank_updates
+        self._version = 0
+        # Cambios de valor (set_value) y fingerprint memorizado para (_version, _value_version)
+        self._value_version = 0
+        self._fp = self._fp_topology = None
+        self._lu_cache = None
+        self._lowrank_g0: Dict[str,float] = {}
+        self._plan: StampPlan = None
+        # Camino SPD (Cholesky) automático cuando la topología lo permite
+        self.cholesky = cholesky
+        # Caché de soluciones compartible entre circuitos (None = sin caché)
+        self.cache: SolutionCache = None
+        # Instrumentación por fase (deshabilitada por defecto; se puede compartir entre circuitos)
+        self.timer = PhaseTimer()
+        # Resolución no lineal: última solución (arranque en caliente) y su reporte
+        self._nl_x = None
+        self.newton_report: NewtonReport = None
+        # Modo iterativo: última solución, precondicionador reutilizable y reporte
+        self._it_x = None
+        self._it_cache = None
+        self.iterative_report: IterativeReport = None
+
+    # --- Instrumentación ---
+    def enable_profiling(self, enabled: bool = True): self.timer.enabled = enabled
+    def timings(self) -> Dict[str, Dict[str, float]]:
+        """Por fase ('node_mapping', 'stamping', 'factorization', 'substitution',
+        'device_eval', 'result_building'): count, total, last y mean en segundos"""
+        return self.timer.report()
+    def reset_timings(self): self.timer.reset()
+
+    # --- Vistas de compatibilidad (se arman a pedido desde los arreglos) ---
+    # Son copias: tuplas de registros inmutables, para que agregar o editar sobre ellas falle en
+    # lugar de perderse. El circuito se modifica con add_*() y set_value().
+    def _view(self, kind: str, cls):
+        st, nm = self._stores[kind], self._node_names
+        return tuple(cls(name, nm[a], nm[b], v) for name, a, b, v in zip(st.names, st.n1.tolist(), st.n2.tolist(), st.values.tolist()))
+
+    @property
+    def resistors(self) -> Tuple[Resistor, ...]: return self._view('R', Resistor)
+    @property
+    def vsources(self) -> Tuple[VSource, ...]: return self._view('V', VSource)
+    @property
+    def isources(self) -> Tuple[ISource, ...]: return self._view('I', ISource)
+    @property
+    def capacitors(self) -> Tuple[Capacitor, ...]: return self._view('C', Capacitor)
+    @property
+    def inductors(self) -> Tuple[Inductor, ...]: return self._view('L', Inductor)
+    @property
+    def wires(self) -> Tuple[Wire, ...]:
+        st, nm = self._stores['W'], self._node_names
+        return tuple(Wire(name, nm[a], nm[b]) for name, a, b in zip(st.names, st.n1.tolist(), st.n2.tolist()))
+    @property
+    def diodes(self) -> Tuple[Diode, ...]:
+        st, nm = self._devices['D'], self._node_names
+        return tuple(Diode(name, nm[a], nm[k], *p) for name, (a, k), p in zip(st.names, st._nodes, st._params))
+    @property
+    def bjts(self) -> Tuple[BJT, ...]:
+        st, nm = self._devices['Q'], self._node_names
+        return tuple(BJT(name, *(nm[t] for t in ids), Is, bf, br, 'npn' if pol > 0 else 'pnp')
+                     for name, ids, (Is, bf, br, pol) in zip(st.names, st._nodes, st._params))
+    @property
+    def mosfets(self) -> Tuple[MOSFET, ...]:
+        st, nm = self._devices['M'], self._node_names
+        return tuple(MOSFET(name, *(nm[t] for t in ids), K, vth, lam, 'nmos' if pol > 0 else 'pmos')
+                     for name, ids, (K, vth, lam, pol) in zip(st.names, st._nodes, st._params))
+    @property
+    def subcircuits(self) -> Tuple[SubcircuitInstance, ...]:
+        return tuple(SubcircuitInstance(name, d.name, tuple(self._node_names[t] for t in ids), dict(params))
+                     for name, d, ids, params, _ in self._subckts)
+    @property
+    def nodes(self) -> frozenset: return frozenset(self._node_names)
+
+    def _node_id(self, node) -> int:
+        node = str(node)
+        nid = self._node_ids.get(node)
+        if nid is None:
+            key = '0' if node.upper() in GROUND_NAMES else node
+            nid = self._node_ids.get(key)
+            if nid is None:
+                nid = len(self._node_names)
+                self._node_names.append(key); self._node_ids[key] = nid
+            # Alias ya normalizado (p. ej. 'GND' -> 0) para no repetir el upper()
+            self._node_ids[node] = nid
+        return nid
+
+    def _intern(self, nodes) -> np.ndarray:
+        """IDs enteros de un arreglo de nodos (cadenas o enteros); solo se normalizan los únicos"""
+        uniq, inv = np.unique(np.asarray(nodes).ravel(), return_inverse=True)
+        ids = np.array([self._node_id(u) for u in uniq.tolist()], dtype=np.int64)
+        return ids[inv.ravel()]
+
+    def _add(self, kind: str, name: str, a, b, value: float = 0.0):
+        st = self._stores[kind]
+        self._by_name[name] = (kind, len(st))
+        st.append(name, self._node_id(a), self._node_id(b), float(value))
+        # Cambio de topología: la factorización en caché deja de ser válida
+        self._version += 1
+
+    def _add_bulk(self, kind: str, names, n1, n2, values=None):
+        names = [str(nm) for nm in names]
+        ids1, ids2 = self._intern(n1), self._intern(n2)
+        vals = np.zeros(len(names)) if values is None else np.asarray(values, dtype=float).ravel()
+        if not len(names) == len(ids1) == len(ids2) == len(vals):
+            raise ValueError("names, n1, n2 y values deben tener la misma longitud")
+        st = self._stores[kind]
+        self._by_name.update((nm, (kind, k)) for k, nm in enumerate(names, start=len(st)))
+        st.extend(names, ids1, ids2, vals.copy())
+        self._version += 1
+
+    def add_resistor(self, name: str, n1: str, n2: str, R: float): self._add('R', name, n1, n2, R)
+    def add_vsource(self, name: str, n_plus: str, n_minus: str, V: float): self._add('V', name, n_plus, n_minus, V)
+    def add_isource(self, name: str, n_from: str, n_to: str, I: float): self._add('I', name, n_from, n_to, I)
+    def add_wire(self, name: str, n1: str, n2: str): self._add('W', name, n1, n2)
+    def add_capacitor(self, name: str, n1: str, n2: str, C: float): self._add('C', name, n1, n2, C)
+    def add_inductor(self, name: str, n1: str, n2: str, L: float): self._add('L', name, n1, n2, L)
+
+    # --- Dispositivos no lineales (se resuelven con Newton-Raphson en solve()) ---
+    def _add_device(self, kind: str, name: str, nodes, params):
+        st = self._devices[kind]
+        self._by_name[name] = (kind, len(st))
+        st.append(name, [self._node_id(nd) for nd in nodes], [float(v) for v in params])
+        self._version += 1
+
+    def add_diode(self, name: str, anode: str, cathode: str, Is: float = 1e-14, n: float = 1.0):
+        self._add_device('D', name, (anode, cathode), (Is, n))
+
+    def add_bjt(self, name: str, c: str, b: str, e: str, Is: float = 1e-16, beta_f: float = 100.0,
+                beta_r: float = 1.0, polarity: str = 'npn'):
+        self._add_device('Q', name, (c, b, e), (Is, beta_f, beta_r, POLARITY[polarity.lower()]))
+
+    def add_mosfet(self, name: str, d: str, g: str, s: str, K: float = 1e-3, vth: float = 1.0,
+                   lam: float = 0.0, polarity: str = 'nmos'):
+        """K = μCox·W/L (A/V²): en saturación Id = K/2·(Vgs - Vth)²·(1 + λVds)"""
+        self._add_device('M', name, (d, g, s), (K, vth, lam, POLARITY[polarity.lower()]))
+
+    def add_subcircuit(self, name: str, definition: SubcircuitDef, nodes, **params):
+        """Instancia `definition` conectando sus puertos (en orden) a `nodes`. El modelo reducido
+        se calcula la primera vez que se usa cada combinación de parámetros"""
+        if len(nodes) != len(definition.ports):
+            raise ValueError(f"{definition.name} tiene {len(definition.ports)} puertos y se dieron {len(nodes)} nodos")
+        model = definition.model(**params)
+        self._by_name[name] = ('X', len(self._subckts))
+        self._subckts.append((name, definition, [self._node_id(nd) for nd in nodes], params, model))
+        self._version += 1
+
+    def subcircuit_voltages(self, name: str, voltages: Dict[str, float] = None) -> Dict[str, float]:
+        """Voltajes internos de una instancia ('instancia.nodo') a partir de los voltajes del
+        circuito padre (por defecto, los de un solve() nuevo). Solo se expande a pedido"""
+        kind, k = self._by_name[name]
+        if kind != 'X': raise ValueError(f"{name} no es un subcircuito")
+        if voltages is None: voltages = self.solve()[0]
+        _, _, ids, _, model = self._subckts[k]
+        v = np.array([voltages[self._node_names[t]] for t in ids])
+        skip = set(model.ports) | {'0'}
+        return {f"{name}.{nd}": val for nd, val in model.voltages(v).items() if nd not in skip}
+
+    # --- Carga masiva: aceptan listas o arreglos de NumPy (nodos como cadenas o enteros) ---
+    def add_resistors(self, names, n1, n2, values): self._add_bulk('R', names, n1, n2, values)
+    def add_vsources(self, names, n_plus, n_minus, values): self._add_bulk('V', names, n_plus, n_minus, values)
+    def add_isources(self, names, n_from, n_to, values): self._add_bulk('I', names, n_from, n_to, values)
+    def add_wires(self, names, n1, n2): self._add_bulk('W', names, n1, n2)
+    def add_capacitors(self, names, n1, n2, values): self._add_bulk('C', names, n1, n2, values)
+    def add_inductors(self, names, n1, n2, values): self._add_bulk('L', names, n1, n2, values)
+
+    def set_value(self, name: str, value: float):
+        """Cambia el valor de un componente sin invalidar la factorización en caché.
+        Los cambios de resistencia se resuelven en el próximo solve() con una actualización
+        de Woodbury; los de fuentes solo afectan al vector z"""
+        kind, k = self._by_name[name]
+        if kind == 'W': raise ValueError(f"{name} es un cable ideal: no tiene valor")
+        if kind in self._devices: raise ValueError(f"{name} es un dispositivo no lineal: no tiene un único valor")
+        if kind == 'X': raise ValueError(f"{name} es un subcircuito: no tiene un único valor")
+        vals = self._stores[kind].values
+        value = float(value)
+        if vals[k] == value: return
+        if kind == 'R' and self._lu_cache is not None:
+            self._lowrank_g0.setdefault(name, conductance(vals[k]))
+        vals[k] = value
+        self._value_version += 1
+
+    def _supernode_index(self) -> Tuple[np.ndarray, List[str]]:
+        """Fusiona en supernodos los nodos unidos por cables (componentes conexas del grafo de
+        cables). Devuelve el índice de incógnita de cada ID de nodo (-1 = tierra), con una
+        posición extra al final para el -1, y el nodo representante de cada incógnita"""
+        n_all, w = len(self._node_names), self._stores['W']
+        if len(w):
+            graph = sp.coo_matrix((np.ones(len(w)), (w.n1, w.n2)), shape=(n_all, n_all))
+            _, labels = csgraph.connected_components(graph, directed=False)
+        else:
+            labels = np.arange(n_all)
+        _, first = np.unique(labels, return_index=True)
+        keep = np.ones(len(first), dtype=bool); keep[labels[0]] = False
+        idx_of_label = np.full(len(first), -1, dtype=np.int64)
+        idx_of_label[keep] = np.arange(keep.sum())
+        reps = [self._node_names[k] for k in first[keep].tolist()]
+        return np.append(idx_of_label[labels], -1), reps
+
+    def floating_islands(self) -> List[FloatingIsland]:
+        """Grupos de nodos sin conexión a tierra en DC (vacío si todo está referenciado)"""
+        plan = self.compile()
+        if not plan.islands: return []
+        names_of: Dict[int, List[str]] = {}
+        for nm, k in zip(plan.node_names, plan.node_cols.tolist()): names_of.setdefault(k, []).append(nm)
+        # Corriente neta que entra a cada incógnita por las fuentes de corriente
+        inj = np.zeros(plan.n + 1)
+        np.add.at(inj, plan.s_t, plan.I); np.subtract.at(inj, plan.s_f, plan.I)
+        out = []
+        for idx in plan.islands:
+            nodes = [nm for k in idx.tolist() if k < plan.N for nm in names_of.get(k, ())]
+            out.append(FloatingIsland(nodes, names_of[int(idx[0])][0], float(inj[idx].sum())))
+        return out
+
+    def supernodes(self) -> Dict[str,str]:
+        """Nodo -> representante de su supernodo ('0' si está unido a tierra)"""
+        node_idx, reps = self._supernode_index()
+        return {nm: reps[k] if k >= 0 else '0' for nm, k in zip(self._node_names, node_idx.tolist())}
 
     def node_index_map(self) -> Tuple[Dict[str,int], List[str]]:
-        if '0' not in self.nodes: self.nodes.add('0')
-        unknowns = sorted([n for n in self.nodes if n != '0'])
-        idx = {n:i for i,n in enumerate(unknowns)}
-        return idx, unknowns
-
-    def solve(self):
-        idx_map, nodes = self.node_index_map()
-        N = len(nodes)
-        M = len(self.vsources)
-        
-        G = np.zeros((N,N), dtype=float)
-        B = np.zeros((N,M), dtype=float)
-        E = np.zeros((M,), dtype=float)
-        Ivec = np.zeros((N,), dtype=float)
-
-        # Regularización para evitar singularidades (nodos flotantes)
-        GMIN = 1e-12
-        for i in range(N):
-            G[i,i] += GMIN
-
-        for r in self.resistors:
-            val = r.value if abs(r.value) > 1e-9 else 1e-9
-            g = 1.0 / val
-            n1, n2 = r.n1, r.n2
-            if n1 != '0': i = idx_map[n1]; G[i,i] += g
-            if n2 != '0': j = idx_map[n2]; G[j,j] += g
-            if n1 != '0' and n2 != '0':
-                i, j = idx_map[n1], idx_map[n2]
-                G[i,j] -= g; G[j,i] -= g
-
-        for k, vs in enumerate(self.vsources):
-            E[k] = vs.value
-            if vs.n_plus != '0': B[idx_map[vs.n_plus], k] = 1.0
-            if vs.n_minus != '0': B[idx_map[vs.n_minus], k] = -1.0
-
-        for isrc in self.isources:
-            if isrc.n_from != '0': Ivec[idx_map[isrc.n_from]] -= isrc.value
-            if isrc.n_to != '0': Ivec[idx_map[isrc.n_to]] += isrc.value
-
-        if M > 0:
-            top = np.hstack((G, B))
-            bottom = np.hstack((B.T, np.zeros((M, M), dtype=float)))
-            A = np.vstack((top, bottom))
-            z = np.concatenate((Ivec, E))
+        """Índice de incógnita de cada nodo. Los nodos de un mismo supernodo comparten índice
+        y los unidos a tierra no aparecen en el mapa"""
+        node_idx, reps = self._supernode_index()
+        return {nm: k for nm, k in zip(self._node_names, node_idx.tolist()) if k >= 0}, reps
+
+    def _use_sparse(self, size: int, method: str) -> bool:
+        if method == 'auto': return size > SPARSE_THRESHOLD
+        if method not in ('dense', 'sparse'): raise ValueError(f"Método desconocido: {method}")
+        return method == 'sparse'
+
+    def compile(self) -> StampPlan:
+        """Compila la topología a arreglos de índices. Solo se recalcula si cambió la topología;
+        mientras tanto solve() arma G, B y z con unas pocas llamadas a bincount.
+        Tras compilar, los valores deben cambiarse con set_value()."""
+        if self._plan is None or self._plan.version != self._version:
+            with self.timer.phase('node_mapping'): self._plan = StampPlan(self)
+        return self._plan
+
+    def _factorize(self, plan: StampPlan, sparse: bool) -> LUFactor:
+        """Factoriza la matriz DC sin GMIN: cada componente conexa con tierra es no singular por
+        sí misma y las islas flotantes se resuelven con su nodo de referencia en 0 V.
+        Sin fuentes flotantes y con resistencias positivas se usa Cholesky (SPDFactor); si no,
+        si hay más de una componente se factoriza cada bloque por separado (BlockLU)."""
+        with self.timer.phase('stamping'): A = plan.matrix(sparse, gmin=False)
+        with self.timer.phase('factorization'):
+            lu = None
+            if self.cholesky and plan.spd is not None and (plan.R > 0).all():
+                try: lu = SPDFactor(A, sparse, plan)
+                except np.linalg.LinAlgError: lu = None
+            if lu is None: lu = BlockLU(A, sparse, plan.blocks) if plan.decomposed else LUFactor(A, sparse)
+        self._lu_cache = {'key': (plan.version, sparse), 'lu': lu, 'W': {}}
+        self._lowrank_g0 = {}
+        return self._lu_cache['lu']
+
+    def _current_factor(self, plan: StampPlan, sparse: bool) -> LUFactor:
+        """LU de la matriz con los valores actuales (refactoriza si hay actualizaciones pendientes)"""
+        cache = self._lu_cache
+        if cache is None or cache['key'] != (plan.version, sparse) or self._lowrank_g0:
+            return self._factorize(plan, sparse)
+        return cache['lu']
+
+    def _solve_cached(self, plan: StampPlan, sparse: bool):
+        """Reutiliza la LU de la última resolución. Los cambios de resistencias posteriores
+        se aplican con la identidad de Sherman-Morrison-Woodbury:
+            (A0 + U D Uᵀ)⁻¹ z = y - W (I + D UᵀW)⁻¹ D Uᵀy,   y = A0⁻¹z,  W = A0⁻¹U
+        Pasadas max_lowrank_updates resistencias modificadas se refactoriza desde cero."""
+        cache, timer = self._lu_cache, self.timer
+        if cache is None or cache['key'] != (plan.version, sparse) \
+                or len(self._lowrank_g0) > self.max_lowrank_updates:
+            lu = self._factorize(plan, sparse)
         else:
-            A = G; z = Ivec
+            lu = cache['lu']
+        with timer.phase('stamping'): z = plan.rhs()
+        with timer.phase('substitution'): y = lu.solve(z)
+        names = list(self._lowrank_g0)
+        if not names: return y
 
+        k = len(names)
+        U = np.empty((plan.n, k)); W = np.empty((plan.n, k)); dg = np.empty(k)
+        for c, name in enumerate(names):
+            r = self._by_name[name][1]
+            U[:, c] = plan.unit_vector(plan.r_i[r], plan.r_j[r])
+            if name not in cache['W']: cache['W'][name] = lu.solve(U[:, c])
+            W[:, c] = cache['W'][name]
+            dg[c] = conductance(plan.R[r]) - self._lowrank_g0[name]
         try:
-            sol = np.linalg.solve(A, z)
+            with timer.phase('substitution'):
+                cap = np.eye(k) + dg[:, None] * (U.T @ W)
+                return y - W @ np.linalg.solve(cap, dg * (U.T @ y))
         except np.linalg.LinAlgError:
-            # Fallback extremo (no debería ocurrir con GMIN)
-            return {}, {}
+            lu = self._factorize(plan, sparse)
+            with timer.phase('substitution'): return lu.solve(z)
+
+    def _topology_digest(self):
+        """Parte estructural del fingerprint (nombres, nodos, dispositivos y subcircuitos): hash
+        parcial y orden canónico de cada almacén de valores. Solo cambia con _version"""
+        h = hashlib.sha256()
+        node = np.array(self._node_names, dtype=object)
+        def add(tag, names, nodes):
+            order = np.argsort(np.array(names, dtype=str), kind='stable')
+            cols = [np.array(names, dtype=object)[order]] + [node[nd[order]] for nd in nodes]
+            h.update(f"\x02{tag}\x02".encode())
+            h.update('\x01'.join('\x00'.join(row) for row in zip(*cols)).encode())
+            return order
+        orders = {kind: add(kind, st.names, (st.n1, st.n2)) for kind, st in self._stores.items() if len(st)}
+        for kind, st in self._devices.items():
+            if len(st): h.update(np.ascontiguousarray(st.params[add(kind, st.names, st.nodes.T)]).tobytes())
+        if self._subckts:
+            names, defs, ids, params, models = zip(*self._subckts)
+            # Subcircuitos: la definición entra por su nombre, sus parámetros y su modelo reducido
+            tags = [f"{d.name}\x00{sorted(p.items())!r}\x00{hashlib.sha256(m.Y.tobytes() + m.J.tobytes()).hexdigest()}"
+                    for d, p, m in zip(defs, params, models)]
+            order = np.argsort(np.array(names, dtype=str), kind='stable')
+            h.update('\x02X\x02'.encode())
+            h.update('\x01'.join(f"{names[k]}\x00{tags[k]}\x00" + '\x00'.join(node[ids[k]]) for k in order).encode())
+        return h, orders
+
+    def fingerprint(self) -> str:
+        """Hash canónico (SHA-256) de la topología y los valores: no depende del orden en que se
+        agregaron los elementos, así que dos circuitos con el mismo hash tienen la misma solución.
+        La parte estructural se recalcula solo si cambia la topología (_version) y el hash
+        completo solo si además cambió algún valor (_value_version)"""
+        key = (self._version, self._value_version)
+        if self._fp is not None and self._fp[0] == key: return self._fp[1]
+        if self._fp_topology is None or self._fp_topology[0] != self._version:
+            self._fp_topology = (self._version,) + self._topology_digest()
+        _, h0, orders = self._fp_topology
+        h = h0.copy()
+        for kind, order in orders.items(): h.update(self._stores[kind].values[order].tobytes())
+        self._fp = (key, h.hexdigest())
+        return self._fp[1]
+
+    def solve(self, method: str = 'auto'):
+        """Resuelve el punto de operación DC.
+        method: 'auto' (disperso por encima de SPARSE_THRESHOLD incógnitas), 'dense', 'sparse'
+        o 'iterative' (solve_iterative con sus valores por omisión).
+        Con self.cache, un circuito ya resuelto (mismo fingerprint) se devuelve sin resolver.
+        Un sistema lineal singular (lazo de fuentes de voltaje, fuente en corto) lanza LinAlgError."""
+        if self.cache is None: return self._solve(method)
+        with self.timer.phase('cache'): key = f"{self.fingerprint()}-{method}-v{SOLUTION_CACHE_VERSION}"
+        sol = self.cache.get(key)
+        if sol is not None: return sol
+        voltages, results = self._solve(method)
+        if voltages: self.cache.put(key, voltages, results)
+        return voltages, results
+
+    def _solve(self, method: str):
+        if method == 'iterative': return self.solve_iterative()
+        plan = self.compile()
+        sparse = self._use_sparse(plan.n, method)
+        if plan.devices: return self.solve_nonlinear(method)
+
+        try:
+            sol = self._solve_cached(plan, sparse)
+        except (np.linalg.LinAlgError, RuntimeError) as e:
+            self._lu_cache = None
+            raise np.linalg.LinAlgError("Sistema singular: ¿lazo de fuentes de voltaje ideales o fuente en corto?") from e
+        with self.timer.phase('result_building'): return self._build_results(plan, sol)
+
+    def solve_iterative(self, solver: str = 'auto', precond: str = 'ilu', tol: float = 1e-10,
+                        maxiter: int = None, drop_tol: float = 1e-2, x0=None):
+        """Punto DC con un método de Krylov, sin factorizar el sistema completo (mallas muy
+        grandes, donde la LU no entra en memoria).
+        solver: 'cg' sobre la matriz SPD reducida de SPDFactor (fuentes a tierra, resistencias
+        positivas), 'minres' o 'gmres' sobre el sistema aumentado sin las referencias de las
+        islas; 'auto' usa cg si se puede y si no gmres.
+        precond: 'ilu' (Cholesky incompleto en cg, ILU en gmres; drop_tol controla el relleno)
+        o 'jacobi'. minres necesita un precondicionador positivo: solo 'jacobi'.
+        tol: tolerancia relativa del residuo (MINRES la mide en la norma del precondicionador;
+        el residuo real queda en el reporte). Arranca desde x0 (solución MNA completa) o desde
+        la última solución si la topología no cambió: tras una edición chica alcanzan pocas
+        iteraciones. El precondicionador se reutiliza con la misma topología (sigue siendo
+        válido con otros valores) y se recalcula si las iteraciones se duplican.
+        El resumen queda en self.iterative_report; si no converge devuelve ({}, {})."""
+        t0, timer = time.perf_counter(), self.timer
+        plan = self.compile()
+        if plan.devices: raise ValueError("solve_iterative() requiere un circuito lineal")
+        spd = plan.spd is not None and (plan.R > 0).all()
+        if solver == 'auto': solver = 'cg' if spd else 'gmres'
+        if solver not in ('cg', 'minres', 'gmres'): raise ValueError(f"Método iterativo desconocido: {solver}")
+        if precond not in ('ilu', 'jacobi'): raise ValueError(f"Precondicionador desconocido: {precond}")
+        if solver == 'cg' and not spd:
+            raise ValueError("cg requiere fuentes de voltaje a tierra y resistencias positivas")
+        if solver == 'minres' and precond == 'ilu': raise ValueError("minres requiere precondicionador 'jacobi'")
 
-        Vsol = sol[:N]
-        Isrc_v = sol[N: N+M] if M > 0 else []
+        with timer.phase('stamping'):
+            A, z = plan.matrix(True, gmin=False), plan.rhs()
+            if solver == 'cg':
+                free, fixed, sign, _ = plan.spd
+                rows = plan.N + np.arange(len(fixed))
+                Ar = A.tocsr(); S = Ar[free]
+                idx, K, vx = free, S[:, free].tocsc(), sign * z[rows]
+                b = z[free] - S[:, fixed] @ vx
+            else:
+                idx = np.sort(np.concatenate(plan.blocks)) if plan.blocks else np.empty(0, np.int64)
+                K = A[idx][:, idx].tocsc(); b = z[idx]
+        warm = x0 is not None or (self._it_x is not None and self._it_x[0] == plan.version)
+        x = np.asarray(x0, dtype=float) if x0 is not None else self._it_x[1] if warm else np.zeros(plan.n)
 
+        key = (plan.version, solver, precond, drop_tol)
+        cache = self._it_cache
+        if cache is None or cache['key'] != key:
+            with timer.phase('factorization'):
+                name, M = precond, None
+                if precond == 'ilu':
+                    try:
+                        M = (_ic_preconditioner if solver == 'cg' else _ilu_preconditioner)(K, drop_tol)
+                    except (np.linalg.LinAlgError, RuntimeError):
+                        name = 'jacobi'
+                if M is None: M = _jacobi_preconditioner(K, np.searchsorted(idx, plan.N))
+            cache = self._it_cache = {'key': key, 'M': M, 'name': name, 'iters': None}
+
+        its = [0]
+        def count(*_): its[0] += 1
+        info, y = 0, np.empty(0)
+        if len(b):
+            with timer.phase('substitution'):
+                kw = dict(x0=x[idx], rtol=tol, maxiter=maxiter, M=cache['M'], callback=count)
+                if solver == 'cg': y, info = spla.cg(K, b, **kw)
+                elif solver == 'minres': y, info = spla.minres(K, b, **kw)
+                else: y, info = spla.gmres(K, b, restart=GMRES_RESTART, callback_type='pr_norm', **kw)
+        nb = np.linalg.norm(b)
+        residual = float(np.linalg.norm(K @ y - b) / nb) if nb > 0 else 0.0
+        ok = info == 0
+        self.iterative_report = IterativeReport(ok, solver, cache['name'], its[0], warm, residual,
+                                                time.perf_counter() - t0)
+        if cache['iters'] is None: cache['iters'] = its[0]
+        elif its[0] > 2 * cache['iters'] + 10: self._it_cache = None
+        if not ok:
+            self._it_x = None
+            return {}, CircuitResults()
+
+        sol = np.zeros(plan.n); sol[idx] = y
+        if solver == 'cg':
+            # Fuentes: voltaje fijado y corriente por KCL en su nodo (como SPDFactor.solve)
+            sol[fixed] = vx
+            sol[rows] = sign * (z[fixed] - Ar[fixed][:, :plan.N] @ sol[:plan.N])
+        self._it_x = (plan.version, sol)
+        with timer.phase('result_building'): return self._build_results(plan, sol)
+
+    def _newton(self, plan: StampPlan, sparse: bool, x: np.ndarray, lin, z: np.ndarray, gs: float,
+                opts: dict, rep: NewtonReport):
+        """Newton-Raphson amortiguado sobre F(x) = A_lin·x + i_dev(x) - z (+ gs·x en los nodos).
+        La parte lineal de la matriz (A_lin y sus valores) se arma una vez por llamada a
+        solve_nonlinear; por iteración solo se reestampan las entradas de los dispositivos.
+        Con jacobian_reuse > 1 (Newton modificado) la LU se reutiliza varias iteraciones y se
+        rehace antes si el paso tiene que amortiguarse. Como en solve(), el jacobiano se factoriza
+        por componente conexa (BlockLU) y cada isla flotante queda con su referencia en 0 V: la
+        fila de la referencia no se impone. GMIN sí se conserva (en paralelo con las junturas,
+        como en SPICE): sin él un transistor cortado deja nodos sin conducción y J es singular.
+        Devuelve (x, convergió)."""
+        A_lin, data_lin = lin
+        N, n, timer = plan.N, plan.n, self.timer
+        xe = np.zeros(n + 1)
+        refs = [isl[0] for isl in plan.islands]
+        x = x.copy(); x[refs] = 0.0
+        def residual(x):
+            xe[:n] = x
+            with timer.phase('device_eval'): i_dev, jv = plan.device_eval(xe)
+            F = A_lin @ x + i_dev - z
+            F[:N] += gs * x[:N]
+            F[refs] = 0.0
+            return F, jv
+        F, jv = residual(x)
+        tol_F = opts['abstol'] + opts['reltol'] * np.abs(z).max(initial=0.0)
+        lu, age = None, 0
+        for _ in range(opts['max_iter']):
+            if lu is None or age >= opts['jacobian_reuse']:
+                with timer.phase('stamping'):
+                    data = data_lin + np.bincount(plan.pos_dev, weights=jv, minlength=plan.nnz)
+                    data[plan.pos_diag] += gs
+                    A = plan.assemble(data, sparse)
+                with timer.phase('factorization'):
+                    lu = BlockLU(A, sparse, plan.blocks) if plan.decomposed else LUFactor(A, sparse)
+                rep.factorizations += 1; age = 0
+            with timer.phase('substitution'): dx = -lu.solve(F)
+            rep.iterations += 1; age += 1
+            # Amortiguamiento con el test de monotonía natural (Deuflhard): se acorta el paso a la
+            # mitad hasta que la corrección simplificada J⁻¹F(x + α·dx) sea menor que la de Newton.
+            # Al medir en unidades de x no importa que las filas sean corrientes o voltajes.
+            ndx, alpha = np.linalg.norm(dx), 1.0
+            for _ in range(opts['max_halvings']):
+                xn = x + alpha * dx
+                Fn, jvn = residual(xn)
+                with timer.phase('substitution'): nbar = np.linalg.norm(lu.solve(Fn))
+                if nbar <= (1.0 - alpha / 4) * ndx: break
+                alpha *= 0.5
+            else:
+                # Con un jacobiano viejo se rehace la LU antes de aceptar un paso que no mejora
+                if age > 1: lu = None; continue
+            step = np.abs(alpha * dx)
+            tol_x = opts['reltol'] * np.abs(xn); tol_x[:N] += opts['vntol']; tol_x[N:] += opts['abstol']
+            x, F, jv = xn, Fn, jvn
+            rep.residual = float(np.abs(F).max(initial=0.0))
+            if np.all(step <= tol_x) and rep.residual <= tol_F: return x, True
+            if alpha < 1.0 and age > 1: lu = None
+        return x, False
+
+    def solve_nonlinear(self, method: str = 'auto', max_iter: int = 100, jacobian_reuse: int = 1,
+                        reltol: float = 1e-6, vntol: float = 1e-6, abstol: float = 1e-9, x0=None):
+        """Punto de operación DC con dispositivos no lineales (solve() lo usa automáticamente).
+        Se intenta Newton amortiguado desde x0 (o la última solución, si la topología no
+        cambió); si no converge, GMIN stepping (conductancias a tierra de 1e-2 a 0) y por
+        último source stepping (fuentes escaladas de 0 a 1 con paso adaptativo).
+        jacobian_reuse: iteraciones por factorización (1 = Newton completo).
+        El resumen queda en self.newton_report; si no converge devuelve ({}, {})."""
+        t0 = time.perf_counter()
+        plan = self.compile()
+        sparse = self._use_sparse(plan.n, method)
+        opts = {'max_iter': max_iter, 'jacobian_reuse': max(1, int(jacobian_reuse)), 'reltol': reltol,
+                'vntol': vntol, 'abstol': abstol, 'max_halvings': 10}
+        rep = self.newton_report = NewtonReport(False, 'newton', 0, 0, 0, np.inf, 0.0)
+        with self.timer.phase('stamping'):
+            data_lin = plan.data()
+            lin = (plan.assemble(data_lin, True), data_lin)
+            z = plan.rhs()
+        if x0 is not None: x = np.asarray(x0, dtype=float).copy()
+        elif self._nl_x is not None and self._nl_x[0] == plan.version: x = self._nl_x[1].copy()
+        else: x = np.zeros(plan.n)
+
+        try:
+            sol, ok = self._newton(plan, sparse, x, lin, z, 0.0, opts, rep)
+            if not ok:
+                # GMIN stepping: la conductancia extra baja una década por paso (el paso se achica
+                # si Newton no converge y se agranda si converge) y al final se quita del todo
+                rep.strategy, rep.steps = 'gmin', 1
+                lg, dlg = np.log10(GMIN_START), 1.0
+                sol, ok = self._newton(plan, sparse, x, lin, z, GMIN_START, opts, rep)
+                while ok and lg > np.log10(GMIN):
+                    nxt = max(np.log10(GMIN), lg - dlg)
+                    rep.steps += 1
+                    trial, ok = self._newton(plan, sparse, sol, lin, z, 10.0**nxt, opts, rep)
+                    if ok: sol, lg, dlg = trial, nxt, min(2 * dlg, 2.0)
+                    elif dlg > 0.1: ok, dlg = True, dlg / 4
+                if ok:
+                    rep.steps += 1
+                    sol, ok = self._newton(plan, sparse, sol, lin, z, 0.0, opts, rep)
+            if not ok:
+                rep.strategy = 'source'
+                sol, lam, dlam = np.zeros(plan.n), 0.0, 0.1
+                while lam < 1.0 and dlam > 1e-4:
+                    nxt = min(1.0, lam + dlam)
+                    rep.steps += 1
+                    trial, ok = self._newton(plan, sparse, sol, lin, nxt * z, 0.0, opts, rep)
+                    if ok: sol, lam, dlam = trial, nxt, dlam * 2
+                    else: dlam /= 4
+                ok = lam >= 1.0
+        except (np.linalg.LinAlgError, RuntimeError):
+            ok = False
+        rep.converged, rep.time = ok, time.perf_counter() - t0
+        if not ok:
+            self._nl_x = None
+            return {}, CircuitResults()
+        self._nl_x = (plan.version, sol)
+        with self.timer.phase('result_building'): return self._build_results(plan, sol, gmin=True)
+
+    def _build_results(self, plan: StampPlan, sol: np.ndarray, gmin: bool = False):
+        """gmin: la resolución estampó GMIN (el residuo se mide contra la misma matriz)"""
+        N = plan.N
+        # Posición extra al final: el índice -1 (tierra) lee 0 V
+        Vext = np.append(sol[:N], 0.0)
         voltages = {'0': 0.0}
-        for n, i in idx_map.items(): voltages[n] = float(Vsol[i])
-
-        results = {}
-        for r in self.resistors:
-            v1, v2 = voltages.get(r.n1, 0.0), voltages.get(r.n2, 0.0)
-            val = r.value if abs(r.value) > 1e-9 else 1e-9
-            i_val = (v1 - v2) / val
-            p_val = i_val**2 * val
-            results[r.name] = {'v': v1-v2, 'i': i_val, 'p': p_val}
-
-        for k, vs in enumerate(self.vsources):
-            i_val = float(Isrc_v[k])
-            v1, v2 = voltages.get(vs.n_plus, 0.0), voltages.get(vs.n_minus, 0.0)
-            v_drop = v1 - v2
-            p_val = v_drop * i_val 
-            results[vs.name] = {'v': v_drop, 'i': i_val, 'p': p_val}
-
-        for isrc in self.isources:
-            v1, v2 = voltages.get(isrc.n_from, 0.0), voltages.get(isrc.n_to, 0.0)
-            v_drop = v1 - v2
-            p_val = v_drop * isrc.value
-            results[isrc.name] = {'v': v_drop, 'i': isrc.value, 'p': p_val}
+        voltages.update(zip(plan.node_names, Vext[plan.node_cols].tolist()))
 
+        g = plan.g()
+        vr = Vext[plan.r_i] - Vext[plan.r_j]; ir = vr * g
+        vv = Vext[plan.v_p] - Vext[plan.v_m]; iv = sol[N:plan.l_row]
+        vs = Vext[plan.s_f] - Vext[plan.s_t]
+        # En DC los capacitores no conducen y los inductores no tienen caída
+        vc = Vext[plan.c_i] - Vext[plan.c_j]; ic = np.zeros(len(vc))
+        vl = Vext[plan.l_p] - Vext[plan.l_m]; il = sol[plan.l_row:]
+        v_all = np.concatenate((vr, vv, vs, vc, vl))
+        i_all = np.concatenate((ir, iv, plan.I, ic, il))
+        p_all = np.concatenate((ir**2 / g, vv * iv, vs * plan.I, ic, vl * il))
+        vs_, is_, ps_, extra = [v_all], [i_all], [p_all], {}
+        # Dispositivos: v e i entre los terminales principales (A-K, C-E, D-S); p es la potencia total
+        # absorbida. Los BJT agregan la corriente de base 'ib'.
+        i_term, dev_out = [], np.zeros(plan.n + 1)
+        for kind, dnames, tn, tb, P, _ in plan.devices:
+            Vt = Vext[tn]
+            I = DEVICE_MODELS[kind][0](Vt, P)[0]
+            i_term.append(I.ravel())
+            dev_out += np.bincount(tb, weights=I.ravel(), minlength=plan.n + 1)
+            vs_.append(Vt[:, 0] - Vt[:, -1]); is_.append(I[:, 0]); ps_.append((Vt * I).sum(axis=1))
+            if kind == 'Q': extra.update((name, {'ib': ib}) for name, ib in zip(dnames, I[:, 1].tolist()))
+        # Subcircuitos: v e i entre el primer y el último puerto, la corriente de cada puerto en
+        # 'i_ports' y p la potencia total absorbida
+        if plan.subckts:
+            i_sub = plan.subckt_currents(Vext)
+            i_term.append(i_sub)
+            a = 0
+            for snames, _, tn, _ in plan.subckts:
+                I = i_sub[a:a + tn.size].reshape(tn.shape); a += tn.size
+                Vt = Vext[tn]
+                vs_.append(Vt[:, 0] - Vt[:, -1]); is_.append(I[:, 0]); ps_.append((Vt * I).sum(axis=1))
+                extra.update((name, {'i_ports': ip}) for name, ip in zip(snames, I.tolist()))
+        i_t = np.concatenate(i_term) if i_term else np.zeros(0)
+        i_w = plan.wire_currents(i_all, i_t if i_term else None)
+        vs_.append(np.zeros(len(i_w))); is_.append(i_w); ps_.append(np.zeros(len(i_w)))
+        # KCL con la incidencia (corriente neta que entra a cada nodo, tierra incluida) y residuo
+        # del sistema MNA sin armar A: parte fija, corriente de cada resistencia en sus dos nodos
+        # y lo que sale hacia los dispositivos, menos z
+        kcl = -(plan.incidence @ np.concatenate((i_all, i_t, i_w)))
+        n = plan.n
+        Ax = dev_out + np.bincount(np.where(plan.r_i < 0, n, plan.r_i), ir, minlength=n + 1) \
+            - np.bincount(np.where(plan.r_j < 0, n, plan.r_j), ir, minlength=n + 1)
+        residual = np.linalg.norm(plan.base_matrix(gmin) @ sol + Ax[:n] - plan.rhs())
+        names, index, kcl_nodes, kcl_ids = plan.result_layout()
+        results = CircuitResults(names, np.concatenate(vs_), np.concatenate(is_), np.concatenate(ps_), extra,
+                                 kcl_nodes, kcl[kcl_ids], residual, index)
         return voltages, results
-    
+
+    def sweep(self, name: str, values, method: str = 'auto') -> SweepResult:
+        """Barre el valor de un componente sobre `values` sin rearmar la matriz por punto.
+        Fuentes: un único solve con múltiples lados derechos sobre la misma LU.
+        Resistencias: corrección de rango uno (Sherman-Morrison) vectorizada sobre todos los puntos."""
+        kind, k = self._by_name[name]
+        if kind in 'WCL': raise ValueError(f"{name} no afecta el punto DC: no se puede barrer")
+        if kind == 'X': raise ValueError(f"{name} es un subcircuito: no tiene un único valor")
+        values = np.asarray(values, dtype=float).ravel()
+        K = len(values)
+        plan = self.compile()
+        if plan.devices: raise ValueError("sweep() requiere un circuito lineal")
+        N, n = plan.N, plan.n
+        lu = self._current_factor(plan, self._use_sparse(n, method))
+        z0 = plan.rhs()
+
+        G = np.tile(plan.g(), (K, 1))
+        I_isrc = np.tile(plan.I, (K, 1))
+        if kind == 'R':
+            u = plan.unit_vector(plan.r_i[k], plan.r_j[k])
+            y, w = lu.solve(z0), lu.solve(u)
+            dg = conductances(values) - conductance(plan.R[k])
+            X = y[None, :] - np.outer(dg * (u @ y) / (1.0 + dg * (u @ w)), w)
+            G[:, k] += dg
+        else:
+            if kind == 'V':
+                dz = np.zeros(n); dz[N + k] = 1.0
+            else:
+                dz = -plan.unit_vector(plan.s_f[k], plan.s_t[k])
+                I_isrc[:, k] = values
+            base = plan.V[k] if kind == 'V' else plan.I[k]
+            X = lu.solve(z0[:, None] + np.outer(dz, values - base)).T
+
+        Vext = np.hstack((X[:, :N], np.zeros((K, 1))))
+        currents = np.hstack(((Vext[:, plan.r_i] - Vext[:, plan.r_j]) * G, X[:, N:plan.l_row], I_isrc,
+                              np.zeros((K, len(plan.C))), X[:, plan.l_row:]))
+        branches = plan.r_names + plan.v_names + plan.s_names + plan.c_names + plan.l_names
+        if plan.w_names:
+            i_sub = plan.subckt_currents(Vext.T) if plan.subckts else None
+            currents = np.hstack((currents, plan.wire_currents(currents.T, i_sub).T))
+            branches = branches + plan.w_names
+        return SweepResult(values, plan.node_names, Vext[:, plan.node_cols], branches, currents)
+
+    def _node_column(self, node, node_idx: np.ndarray) -> int:
+        """Incógnita de un nodo existente (-1 si es tierra o está unido a tierra)"""
+        key = '0' if str(node).upper() in GROUND_NAMES else str(node)
+        if key not in self._node_ids: raise ValueError(f"Nodo inexistente: {node}")
+        return int(node_idx[self._node_ids[key]])
+
+    def reduce(self, ports, method: str = 'auto') -> PortModel:
+        """Reduce la red a los nodos de `ports` eliminando todas las incógnitas internas con un
+        complemento de Schur (equivalente de Thevenin/Norton multipuerto):
+            Y = A_PP - A_PI·A_II⁻¹·A_IP,   J = z_P - A_PI·A_II⁻¹·z_I
+        Se factoriza A_II una vez con p lados derechos. Las partes internas sin camino a tierra
+        ni a un puerto no influyen en los puertos y se descartan (quedan en 0 V en voltages())."""
+        plan = self.compile()
+        if plan.devices: raise ValueError("reduce() requiere un circuito lineal")
+        ports = [str(p) for p in ports]
+        node_idx, _ = self._supernode_index()
+        P = np.array([self._node_column(p, node_idx) for p in ports], dtype=np.int64)
+        if (P < 0).any(): raise ValueError("Un puerto está unido a tierra")
+        if len(np.unique(P)) != len(P): raise ValueError("Dos puertos están unidos por cables")
+
+        # Componentes internas: los puertos cuentan como tierra (su voltaje es dato)
+        n = plan.n
+        is_port = np.zeros(n + 1, dtype=bool); is_port[P] = True
+        a, b = plan.edges
+        labels, grounded = _grounded_components(np.where(is_port[a], -1, a), np.where(is_port[b], -1, b), n)
+        keep = np.flatnonzero(grounded[labels] & ~is_port[:n])
+
+        with self.timer.phase('stamping'):
+            A, z = plan.matrix(True, gmin=False).tocsr(), plan.rhs()
+            AI, AP = A[keep], A[P]
+            A_II, A_IP, A_PI, A_PP = AI[:, keep], AI[:, P].toarray(), AP[:, keep], AP[:, P].toarray()
+        sparse = self._use_sparse(len(keep), method)
+        try:
+            with self.timer.phase('factorization'):
+                lu = LUFactor(A_II.tocsc() if sparse else A_II.toarray(), sparse) if len(keep) else None
+        except (np.linalg.LinAlgError, RuntimeError):
+            raise ValueError("Red interna singular: ¿fuente de voltaje ideal entre puertos o a tierra?")
+        with self.timer.phase('substitution'):
+            W = lu.solve(A_IP) if lu else np.zeros((0, len(P)))
+            y0 = lu.solve(z[keep]) if lu else np.zeros(0)
+        Y = A_PP - A_PI @ W
+        J = z[P] - A_PI @ y0
+        reactive = bool(len(plan.C) or len(plan.L) or any(m.reactive for _, _, _, m in plan.subckts))
+        return PortModel(ports, Y, J, (keep, P, W, y0, plan.node_names, plan.node_cols, n), reactive)
+
+    def sensitivity(self, outputs, method: str = 'auto') -> SensitivityResult:
+        """Sensibilidades por el método adjunto: derivada de cada salida respecto del valor de
+        todas las resistencias y fuentes, con una sola resolución transpuesta por salida sobre
+        la factorización de solve() (en lugar de un solve por componente).
+        outputs: nodo, par (n+, n-) para una diferencia de voltaje, o lista de ellos.
+        Con Aᵀλ = c (c selecciona la salida) y u = e_i - e_j la incidencia de la resistencia:
+            dy/dR = g²·(uᵀλ)·(uᵀx),   dy/dV = λ_rama,   dy/dI = λ_hacia - λ_desde"""
+        plan = self.compile()
+        if plan.devices: raise ValueError("sensitivity() requiere un circuito lineal")
+        if isinstance(outputs, (str, tuple)): outputs = [outputs]
+        node_idx, _ = self._supernode_index()
+        labels, C = [], np.zeros((plan.n, len(outputs)))
+        for k, out in enumerate(outputs):
+            a, b = (out, '0') if isinstance(out, str) else out
+            C[:, k] = plan.unit_vector(self._node_column(a, node_idx), self._node_column(b, node_idx))
+            labels.append(f"V({a})" if isinstance(out, str) else f"V({a},{b})")
+
+        lu = self._current_factor(plan, self._use_sparse(plan.n, method))
+        with self.timer.phase('substitution'):
+            x = lu.solve(plan.rhs())
+            lam = lu.solve(C, trans=True)
+        xe, le = np.append(x, 0.0), np.vstack((lam, np.zeros((1, len(outputs)))))
+        # Con |R| <= R_MIN la conductancia está fija en 1/R_MIN: derivada nula
+        g = plan.g()
+        dg = np.where(np.abs(plan.R) > R_MIN, g * g, 0.0)
+        dR = (le[plan.r_i] - le[plan.r_j]) * (dg * (xe[plan.r_i] - xe[plan.r_j]))[:, None]
+        dV = lam[plan.N:plan.l_row]
+        dI = le[plan.s_t] - le[plan.s_f]
+        return SensitivityResult(labels, C.T @ x, plan.r_names + plan.v_names + plan.s_names,
+                                 np.concatenate((plan.R, plan.V, plan.I)), np.vstack((dR, dV, dI)).T)
+
+    def _probe_columns(self, plan: StampPlan, probes):
+        """Separa las sondas en nodos (columna de incógnita, -1 = tierra) y ramas (tipo, índice)"""
+        col = dict(zip(plan.node_names, plan.node_cols.tolist())); col['0'] = -1
+        if probes is None:
+            branches = [(nm, kind, k) for kind, names in (('R', plan.r_names), ('V', plan.v_names), ('I', plan.s_names),
+                                                          ('C', plan.c_names), ('L', plan.l_names))
+                        for k, nm in enumerate(names)]
+            return plan.node_names, plan.node_cols, branches
+        nodes, cols, branches = [], [], []
+        for p in probes:
+            p = str(p)
+            if p in self._by_name:
+                kind, k = self._by_name[p]
+                if kind == 'W': raise ValueError(f"{p} es un cable ideal: su corriente no se registra en transitorio")
+                branches.append((p, kind, k))
+            elif p in self._node_ids:
+                nodes.append(p); cols.append(col[self._node_names[self._node_ids[p]]])
+            else: raise KeyError(f"Sonda desconocida: {p}")
+        return nodes, np.array(cols, dtype=np.int64), branches
+
+    def transient(self, t_stop: float, dt: float, integration: str = 'trap', probes=None, uic: bool = False,
+                  waveforms: Dict[str, Callable[[np.ndarray], np.ndarray]] = None,
+                  method: str = 'auto') -> TransientResult:
+        """Análisis transitorio con paso fijo. Capacitores e inductores se reemplazan por su modelo
+        compañero de Euler hacia atrás (integration='be') o trapezoidal ('trap'):
+            C: i = gc·v - h,   gc = C/dt (BE) o 2C/dt (trap), h = gc·v(n) [+ i(n) en trap]
+            L: v - rl·i = -rl·i(n) [- v(n) en trap],   rl = L/dt (BE) o 2L/dt (trap)
+        Con paso fijo la matriz no cambia: se factoriza una vez y cada paso es solo una
+        sustitución hacia adelante/atrás con un lado derecho nuevo.
+        El estado inicial es el punto de operación DC; con uic=True se parte de capacitores
+        descargados e inductores sin corriente (la fila t=0 es ese estado nulo) y, en trap,
+        el primer paso se da con BE porque i_C(0) y v_L(0) no se conocen.
+        waveforms: nombre de fuente V o I -> función vectorizada del tiempo (se evalúa una sola vez
+        sobre todos los instantes). probes: nombres de nodos y de ramas (no cables) a registrar;
+        por defecto se registran todos. Las formas de onda salen en arreglos preasignados de
+        (pasos + 1) filas por sonda, así que la memoria solo crece con lo registrado."""
+        if integration not in ('be', 'trap'): raise ValueError(f"Integración desconocida: {integration}")
+        if dt <= 0 or t_stop < dt: raise ValueError("Se requiere 0 < dt <= t_stop")
+        K = int(round(t_stop / dt))
+        t = np.arange(K + 1) * dt
+        plan = self.compile()
+        if plan.devices: raise ValueError("transient() requiere un circuito lineal")
+        if any(m.reactive for _, _, _, m in plan.subckts):
+            raise ValueError("transient() no admite subcircuitos con capacitores o inductores (su modelo es de DC)")
+        sparse = self._use_sparse(plan.n, method)
+        N, n, lr = plan.N, plan.n, plan.l_row
+        timer = self.timer
+
+        # Fuentes con forma de onda: columnas de z que cambian y su valor en cada instante
+        wave_rows, wave_vals = [], []
+        for name, f in (waveforms or {}).items():
+            kind, k = self._by_name[name]
+            if kind not in ('V', 'I'): raise ValueError(f"{name} no es una fuente")
+            vals = np.broadcast_to(np.asarray(f(t), dtype=float), t.shape)
+            if kind == 'V': wave_rows.append(plan.unit_vector(N + k, -1)); wave_vals.append(vals - plan.V[k])
+            else: wave_rows.append(-plan.unit_vector(plan.s_f[k], plan.s_t[k])); wave_vals.append(vals - plan.I[k])
+        z0 = plan.rhs()
+        if wave_rows:
+            S = sp.csr_matrix(np.column_stack(wave_rows)); dW = np.column_stack(wave_vals)
+            z_at = lambda k: z0 + S @ dW[k]
+        else:
+            z_at = lambda k: z0
+
+        # Estado inicial
+        xe = np.zeros(n + 1)
+        if not uic:
+            try: xe[:n] = self._current_factor(plan, sparse).solve(z_at(0))
+            except (np.linalg.LinAlgError, RuntimeError): raise np.linalg.LinAlgError("Punto de operación singular")
+        vc = xe[plan.c_i] - xe[plan.c_j]; ic = np.zeros(len(plan.C))
+        il = xe[lr:n].copy(); vl = xe[plan.l_p] - xe[plan.l_m]
+
+        # Incidencia de los capacitores (sin la fila de tierra): inyecta h en los nodos
+        ci, cj, kc = plan.c_i, plan.c_j, np.arange(len(plan.C))
+        Pc = sp.csr_matrix((np.concatenate((np.ones((ci >= 0).sum()), -np.ones((cj >= 0).sum()))),
+                            (np.concatenate((ci[ci >= 0], cj[cj >= 0])), np.concatenate((kc[ci >= 0], kc[cj >= 0])))),
+                           shape=(n, len(plan.C)))
+
+        def companion(trap):
+            a = 2.0 if trap else 1.0
+            gc, rl = a * plan.C / dt, a * plan.L / dt
+            with timer.phase('stamping'): A = plan.matrix(sparse, gc=gc, rl=rl)
+            with timer.phase('factorization'): lu = LUFactor(A, sparse)
+            return lu, gc, rl, trap
+
+        # Salidas preasignadas: solo las sondas pedidas
+        nodes, ncols, branches = self._probe_columns(plan, probes)
+        Vout = np.empty((K + 1, len(nodes))); Iout = np.empty((K + 1, len(branches)))
+        by_kind = {kd: (np.array([c for c, (_, kk, _) in enumerate(branches) if kk == kd], dtype=np.int64),
+                        np.array([k for _, kk, k in branches if kk == kd], dtype=np.int64)) for kd in 'RVICL'}
+        (br, kr), (bc, kcs) = by_kind['R'], by_kind['C']
+        g_sel, ri, rj = plan.g()[kr], plan.r_i[kr], plan.r_j[kr]
+        bx = np.concatenate((by_kind['V'][0], by_kind['L'][0]))
+        kx = np.concatenate((N + by_kind['V'][1], lr + by_kind['L'][1]))
+        bs, ks = by_kind['I']
+        I_src = np.broadcast_to(plan.I, (K + 1, len(plan.I))).copy()
+        for name, f in (waveforms or {}).items():
+            kind, k = self._by_name[name]
+            if kind == 'I': I_src[:, k] = np.broadcast_to(np.asarray(f(t), dtype=float), t.shape)
+        Iout[:, bs] = I_src[:, ks]
+
+        def record(k):
+            Vout[k] = xe[ncols]
+            Iout[k, br] = g_sel * (xe[ri] - xe[rj])
+            Iout[k, bx] = xe[kx]
+            Iout[k, bc] = ic[kcs]
+
+        record(0)
+        steps = companion(integration == 'trap')
+        first = companion(False) if uic and integration == 'trap' else steps
+        with timer.phase('substitution'):
+            for k in range(1, K + 1):
+                lu, gc, rl, trap = first if k == 1 else steps
+                h = gc * vc + ic if trap else gc * vc
+                z = z_at(k) + Pc @ h
+                z[lr:] -= rl * il + vl if trap else rl * il
+                xe[:n] = lu.solve(z)
+                vc = xe[ci] - xe[cj]; ic = gc * vc - h
+                il = xe[lr:n].copy(); vl = xe[plan.l_p] - xe[plan.l_m]
+                record(k)
+        return TransientResult(t, nodes, Vout, [b[0] for b in branches], Iout)
+
+    def _mc_plan(self, tol: float, dist: str, percentiles, sparse: bool):
+        """Plan de Monte Carlo a partir de la topología compilada: la matriz P lleva las
+        conductancias de cada muestra a sus posiciones dentro del patrón CSC fijo"""
+        plan = self.compile()
+        P = sp.csr_matrix((plan.res_sign, (plan.res_idx, plan.pos_res)), shape=(len(plan.R), plan.nnz))
+        mc = {'n': plan.n, 'sparse': sparse, 'tol': float(tol), 'dist': dist, 'q': np.asarray(percentiles, dtype=float),
+              'R0': plan.R.copy(), 'base': plan.base, 'P': P, 'z': plan.rhs(),
+              'indices': plan.indices, 'indptr': plan.indptr, 'flat': plan.flat, 'cols': plan.node_cols}
+        if sparse:
+            # Orden de columnas de COLAMD sobre la matriz nominal (todas las muestras comparten el
+            # patrón) y el patrón CSC con las columnas en ese orden: pidx lleva los datos de una
+            # muestra al patrón permutado; la columna j es la incógnita q[j]
+            A0 = sp.csc_matrix((plan.base + P.T @ conductances(plan.R), plan.indices, plan.indptr), shape=(plan.n, plan.n))
+            q = np.argsort(spla.splu(A0, permc_spec='COLAMD').perm_c)
+            lens = np.diff(plan.indptr)[q]
+            indptr = np.concatenate(([0], np.cumsum(lens)))
+            pidx = np.repeat(plan.indptr[q] - indptr[:-1], lens) + np.arange(indptr[-1])
+            mc['order'] = (pidx, plan.indices[pidx], indptr, q)
+        return plan.node_names, mc
+
+    def monte_carlo(self, n_samples: int, tol: float = 0.05, dist: str = 'uniform', seed=None,
+                    batch_size: int = 256, workers: int = None, percentiles=(1, 5, 50, 95, 99),
+                    method: str = 'auto') -> MonteCarloResult:
+        """Análisis de tolerancias: cada resistencia varía como R·(1+δ), con δ ~ U(-tol, tol)
+        (dist='uniform') o δ ~ N(0, tol/3) (dist='normal', tol = 3σ).
+        Las muestras se resuelven en lotes vectorizados repartidos en un pool de procesos
+        (workers=1 ejecuta en el proceso actual). Cada lote tiene su propia semilla derivada de
+        `seed`, así que el resultado no depende de la cantidad de procesos.
+        Solo se acumulan estadísticas: media y desvío (fusión de Chan), mín/máx y un histograma
+        por nodo con intervalos fijos, tomados del rango del primer lote ampliado a cada lado;
+        los histogramas se suman entre lotes y los percentiles se interpolan en el intervalo."""
+        if dist not in ('uniform', 'normal'): raise ValueError(f"Distribución desconocida: {dist}")
+        if n_samples < 1: raise ValueError("monte_carlo() necesita al menos una muestra")
+        if self.compile().devices: raise ValueError("monte_carlo() requiere un circuito lineal")
+        sparse = self._use_sparse(self.compile().n, method)
+        node_names, plan = self._mc_plan(tol, dist, percentiles, sparse)
+
+        sizes = [min(batch_size, n_samples - a) for a in range(0, n_samples, batch_size)]
+        seeds = np.random.SeedSequence(seed).spawn(len(sizes))
+        tasks = list(zip(seeds, sizes))
+
+        count, mean, M2 = 0, 0.0, 0.0
+        vmin, vmax, hist = np.inf, -np.inf, 0
+        def merge(part):
+            nonlocal count, mean, M2, vmin, vmax, hist
+            K, m, m2, lo, hi, H = part
+            delta, total = m - mean, count + K
+            mean = mean + delta * K / total
+            M2 = M2 + m2 + delta**2 * count * K / total
+            count = total
+            vmin, vmax = np.minimum(vmin, lo), np.maximum(vmax, hi)
+            hist = hist + H
+
+        # Lote piloto en este proceso: su rango, ampliado a cada lado, fija los intervalos de todos
+        pilot = _mc_batch((plan,) + tasks[0])
+        span = pilot[4] - pilot[3]
+        bins = int(np.clip(MC_HIST_CELLS // max(len(node_names), 1), *MC_HIST_BINS))
+        plan['hist'] = (pilot[3] - 0.5 * span, 2.0 * span / bins, bins)
+        merge(pilot[:5] + (_mc_histogram(pilot[5], plan['hist']),))
+        if workers == 1 or len(tasks) <= 2:
+            for t in tasks[1:]: merge(_mc_batch((plan,) + t))
+        else:
+            # El plan (con los intervalos ya fijados) viaja una vez por proceso; los lotes solo
+            # llevan su semilla y su tamaño
+            with ProcessPoolExecutor(max_workers=workers, initializer=_mc_init, initargs=(plan,)) as pool:
+                for part in pool.map(_mc_worker, tasks[1:]): merge(part)
+
+        std = np.sqrt(M2 / (count - 1)) if count > 1 else np.zeros_like(mean)
+        pct = _hist_percentiles(hist, plan['hist'], vmin, vmax, plan['q'], count)
+        return MonteCarloResult(count, node_names, mean, std, pct, vmin, vmax)
+
     def validate_power_balance(self, results):
+        if isinstance(results, CircuitResults): return results.power_balance()
         return sum(item['p'] for item in results.values())
\ No newline at end of file
@@ -3,6 +3,9 @@ from tkinter import simpledialog, messagebox, ttk
 import math
 import sys
 import os
+import queue
+import threading
+from collections import deque
 
 try:
     from ctypes import windll
@@ -11,7 +14,7 @@ except:
     pass
 
 sys.path.append(os.path.dirname(__file__))
-from circuit_sim import Circuit
+from circuit_sim import Circuit, CircuitResults, PhaseTimer, SolutionCache
 
 # --- UTILS DE FORMATO E INGENIERÍA ---
 def format_eng(value, unit=""):
@@ -32,6 +35,18 @@ def format_eng(value, unit=""):
     return f"{sign}{value:.2e} {unit}"
 
 # --- UTILS DE COLOR ---
+# Etiquetas cortas de las fases medidas (motor + interfaz) para la barra de estado
+ETIQUETAS_FASE = {'node_mapping': 'mapa', 'stamping': 'estampado', 'factorization': 'LU',
+                  'substitution': 'sustitución', 'result_building': 'resultados',
+                  'tree_refresh': 'tabla', 'canvas_update': 'lienzo', 'recalc': 'motor'}
+# Cada cuánto se revisa si el hilo de cálculo terminó (ms)
+RECALC_POLL_MS = 15
+# Vista: límites de zoom, zoom por debajo del cual se ocultan las etiquetas y separación
+# mínima en pantalla entre puntos de la rejilla (con poco zoom se saltean puntos)
+ZOOM_MIN, ZOOM_MAX = 0.2, 4.0
+ZOOM_ETIQUETAS = 0.6
+REJILLA_MIN_PX = 32
+
 def get_voltage_color(v, v_min, v_max):
     if v_max == v_min: return "#2c3e50" 
     ratio = (v - v_min) / (v_max - v_min)
@@ -45,54 +60,118 @@ def get_voltage_color(v, v_min, v_max):
 # SECCIÓN 1: HISTORIAL
 # ==========================================
 class HistoryManager:
-    def __init__(self, limit=30):
-        self.history_stack = []
+    """Historial de comandos. Cada comando es la lista de deltas (operaciones primitivas
+    reversibles) que produjo una edición: deshacer aplica sus inversas en orden inverso y
+    rehacer las repite. Un comando ocupa lo que tocó, no una copia de todo el circuito."""
+    def __init__(self, limit=1000):
+        self.history_stack = deque(maxlen=limit)
         self.redo_stack = []
         self.is_recording = True
         self.limit = limit
 
-    def save(self, state):
+    def save(self):
+        """Abre un comando nuevo: las operaciones que se registren a continuación le pertenecen"""
         if not self.is_recording: return
-        self.history_stack.append(state)
         self.redo_stack.clear()
-        if len(self.history_stack) > self.limit: self.history_stack.pop(0)
+        if not self.history_stack or self.history_stack[-1]: self.history_stack.append([])
+
+    def record(self, op):
+        if self.is_recording and self.history_stack: self.history_stack[-1].append(op)
 
     def undo(self):
-        if self.history_stack:
-            state = self.history_stack.pop()
-            self.redo_stack.append(state)
-            return state
+        while self.history_stack:
+            cmd = self.history_stack.pop()
+            if cmd:
+                self.redo_stack.append(cmd)
+                return cmd
         return None
 
     def redo(self):
         if self.redo_stack:
-            state = self.redo_stack.pop()
-            self.history_stack.append(state)
-            return state
+            cmd = self.redo_stack.pop()
+            self.history_stack.append(cmd)
+            return cmd
         return None
 
+# --- ÍNDICE ESPACIAL ---
+class IndiceEspacial:
+    """Cubetas sobre la rejilla de ajuste: celda (GRID_SIZE) -> [(elemento, x, y)].
+    Guarda los elementos mismos (los dict de nodos o componentes) y aparte su posición en la lista:
+    mover o redibujar uno solo toca su celda; insertar o quitar en el medio renumera los siguientes
+    (como ya se corren los n1/n2 de los componentes). Una búsqueda solo revisa las celdas que toca
+    el círculo de radio dado y no recorre la lista."""
+    def __init__(self, cell):
+        self.cell = cell
+        self.cubetas = {}
+        self.celda_de = {}  # id(elemento) -> celda
+        self.pos = {}       # id(elemento) -> posición en la lista
+
+    def agregar(self, obj, x, y, pos):
+        celda = (math.floor(x / self.cell), math.floor(y / self.cell))
+        self.cubetas.setdefault(celda, []).append((obj, x, y))
+        self.celda_de[id(obj)] = celda; self.pos[id(obj)] = pos
+
+    def quitar(self, obj):
+        celda = self.celda_de.pop(id(obj), None)
+        if celda is None: return
+        del self.pos[id(obj)]
+        cubeta = [e for e in self.cubetas[celda] if e[0] is not obj]
+        if cubeta: self.cubetas[celda] = cubeta
+        else: del self.cubetas[celda]
+
+    def mover(self, obj, x, y):
+        pos = self.pos[id(obj)]
+        self.quitar(obj); self.agregar(obj, x, y, pos)
+
+    def renumerar(self, lista, desde):
+        """Tras insertar o quitar en `desde`, los elementos siguientes cambian de posición"""
+        for k in range(desde, len(lista)): self.pos[id(lista[k])] = k
+
+    def buscar(self, x, y, radio):
+        """Posición más baja a menos de radio de (x, y), igual que un recorrido lineal; None si no hay"""
+        cell, mejor = self.cell, None
+        for cx in range(math.floor((x - radio) / cell), math.floor((x + radio) / cell) + 1):
+            for cy in range(math.floor((y - radio) / cell), math.floor((y + radio) / cell) + 1):
+                for obj, px, py in self.cubetas.get((cx, cy), ()):
+                    if math.hypot(px - x, py - y) < radio:
+                        idx = self.pos[id(obj)]
+                        if mejor is None or idx < mejor: mejor = idx
+        return mejor
+
 # ==========================================
 # SECCIÓN 2: DIBUJO
 # ==========================================
-def dibujar_rejilla(canvas, w, h, grid_size):
-    canvas.create_rectangle(0,0,w,h, fill="#fdfefe", outline="")
-    for i in range(0, w, grid_size):
-        for j in range(0, h, grid_size):
-            canvas.create_oval(i-1, j-1, i+1, j+1, fill="#bdc3c7", outline="")
+def dibujar_rejilla(canvas, w, h, grid_size, zoom=1.0, origen=(0.0, 0.0)):
+    """Rejilla solo para la ventana visible (w x h px), con dos pasos de margen para el paneo.
+    Devuelve la separación en pantalla entre puntos"""
+    canvas.delete("rejilla")
+    paso = grid_size * zoom * max(1, math.ceil(REJILLA_MIN_PX / (grid_size * zoom)))
+    # Primer punto de la rejilla del mundo a la izquierda/arriba de la ventana
+    x0 = origen[0] % paso - 2 * paso; y0 = origen[1] % paso - 2 * paso
+    canvas.create_rectangle(x0, y0, w + 2 * paso, h + 2 * paso, fill="#fdfefe", outline="", tags="rejilla")
+    nx, ny = int((w + 2 * paso - x0) / paso) + 1, int((h + 2 * paso - y0) / paso) + 1
+    for i in range(nx):
+        x = x0 + i * paso
+        for j in range(ny):
+            y = y0 + j * paso
+            canvas.create_oval(x-1, y-1, x+1, y+1, fill="#bdc3c7", outline="", tags="rejilla")
+    canvas.tag_lower("rejilla")
+    return paso
 
 def crear_nodo_visual_func(canvas, x, y, label, is_gnd=False):
     r = 8
     color = "#34495e" 
     uid = canvas.create_oval(x-r, y-r, x+r, y+r, fill=color, outline="black", width=2, tags="nodo")
-    txt_id = canvas.create_text(x, y-22, text=label, fill="#7f8c8d", font=("Arial", 9, "bold"), tags="lbl_nodo")
+    txt_id = canvas.create_text(x, y-22, text=label, fill="#7f8c8d", font=("Arial", 9, "bold"), tags=("lbl_nodo", "etiqueta"))
     
     if is_gnd:
         gnd_ids = []
         gnd_ids.append(canvas.create_line(x, y+r, x, y+r+10, width=2, fill="black", tags="gnd"))
         gnd_ids.append(canvas.create_line(x-10, y+r+10, x+10, y+r+10, width=2, fill="black", tags="gnd"))
         gnd_ids.append(canvas.create_line(x-6, y+r+14, x+6, y+r+14, width=2, fill="black", tags="gnd"))
+        return uid, txt_id, gnd_ids
     
-    return uid, txt_id
+    return uid, txt_id, []
 
 def dibujar_componente_func(canvas, x1, y1, x2, y2, tipo, valor, nombre):
     ids = []
@@ -135,9 +214,9 @@ def dibujar_componente_func(canvas, x1, y1, x2, y2, tipo, valor, nombre):
         if angle == 90: w_box, h_box = h_box, w_box
         
         bg_id = canvas.create_rectangle(tx - w_box/2, ty - h_box/2, tx + w_box/2, ty + h_box/2, 
-                                        fill="white", outline="", tags=("comp", tag_extra))
+                                        fill="white", outline="", tags=("comp", tag_extra, "etiqueta"))
         t_id = canvas.create_text(tx, ty, text=text, font=("Arial", font_size, "bold"), 
-                                  fill=color, angle=angle, tags=("comp", tag_extra))
+                                  fill=color, angle=angle, tags=("comp", tag_extra, "etiqueta"))
         return bg_id, t_id
 
     # --- DISTANCIAS ---
@@ -165,12 +244,12 @@ def dibujar_componente_func(canvas, x1, y1, x2, y2, tipo, valor, nombre):
             
         rect_id = canvas.create_rectangle(xm-box_w/2, ym-box_h/2, xm+box_w/2, ym+box_h/2, fill="white", outline="black", width=2, tags="comp")
         ids.append(rect_id)
-        ids.append(canvas.create_text(xm, ym, text=val_str, font=("Arial", 8, "bold"), fill="black", tags="comp", angle=angle_box_text))
+        ids.append(canvas.create_text(xm, ym, text=val_str, font=("Arial", 8, "bold"), fill="black", tags=("comp", "etiqueta"), angle=angle_box_text))
 
     elif tipo == 'V':
         r = 20
         ids.append(canvas.create_oval(xm-r, ym-r, xm+r, ym+r, fill="#e74c3c", outline="black", width=2, tags="comp"))
-        ids.append(canvas.create_text(xm, ym, text="+  -", font=("Arial", 10, "bold"), fill="white", tags="comp"))
+        ids.append(canvas.create_text(xm, ym, text="+  -", font=("Arial", 10, "bold"), fill="white", tags=("comp", "etiqueta")))
         
         val_y_offset = 15 if not vertical else 15
         bg, txt = create_label_bg(nx, ny + val_y_offset if not vertical else ny, val_str, "red", angle=angle_name)
@@ -181,7 +260,7 @@ def dibujar_componente_func(canvas, x1, y1, x2, y2, tipo, valor, nombre):
     elif tipo == 'I':
         r = 20
         ids.append(canvas.create_oval(xm-r, ym-r, xm+r, ym+r, fill="#2ecc71", outline="black", width=2, tags="comp"))
-        ids.append(canvas.create_text(xm, ym, text="I", font=("Arial", 12, "bold"), fill="white", tags="comp"))
+        ids.append(canvas.create_text(xm, ym, text="I", font=("Arial", 12, "bold"), fill="white", tags=("comp", "etiqueta")))
         
         val_y_offset = 15 if not vertical else 15
         bg, txt = create_label_bg(nx, ny + val_y_offset if not vertical else ny, val_str, "green", angle=angle_name)
@@ -199,8 +278,8 @@ def dibujar_componente_func(canvas, x1, y1, x2, y2, tipo, valor, nombre):
     if tipo == 'WIRE':
         if vertical: vx, vy = (xm - 15, ym); ang_volt = 90
         else: vx, vy = (xm, ym - 15); ang_volt = 0
-        bg_id = canvas.create_rectangle(vx, vy, vx, vy, fill="white", outline="", tags="lbl_volt_wire", state="hidden")
-        txt_id = canvas.create_text(vx, vy, text="", font=("Arial", 9, "bold"), fill="#e67e22", tags="lbl_volt_wire", state="hidden", angle=ang_volt)
+        bg_id = canvas.create_rectangle(vx, vy, vx, vy, fill="white", outline="", tags=("lbl_volt_wire", "etiqueta"), state="hidden")
+        txt_id = canvas.create_text(vx, vy, text="", font=("Arial", 9, "bold"), fill="#e67e22", tags=("lbl_volt_wire", "etiqueta"), state="hidden", angle=ang_volt)
         ids.extend([bg_id, txt_id])
     
     # --- FLECHA CORRIENTE ---
@@ -210,6 +289,13 @@ def dibujar_componente_func(canvas, x1, y1, x2, y2, tipo, valor, nombre):
     
     return ids
 
+def roles_componente(tipo, ids, vertical):
+    """Ítems que cambian en cada recálculo, según el orden en que los crea dibujar_componente_func"""
+    if tipo == 'WIRE':
+        return {'linea': ids[0], 'volt_bg': ids[-4], 'volt_txt': ids[-3],
+                'flecha_bg': ids[-2], 'flecha_txt': ids[-1], 'vertical': vertical}
+    return {'valor': ids[-5], 'flecha_bg': ids[-2], 'flecha_txt': ids[-1], 'vertical': vertical}
+
 # ==========================================
 # SECCIÓN 3: INTERFAZ
 # ==========================================
@@ -228,17 +314,45 @@ class SimuladorPro(tk.Tk):
         self.GRID_SIZE = 40 
         self.nodos = []       
         self.componentes = [] 
-        self.history = HistoryManager(limit=30)
+        # Índices espaciales para find_node / find_comp (nodos por posición, componentes por punto medio)
+        self.idx_nodos = IndiceEspacial(self.GRID_SIZE)
+        self.idx_comps = IndiceEspacial(self.GRID_SIZE)
+        self.history = HistoryManager(limit=1000)
         self.tierra_idx = 0 
+        # Circuito del motor reutilizado mientras no cambie la topología (conserva su LU)
+        self.circ = None
+        self.topologia_circ = None
+        # Soluciones ya calculadas (por hash del circuito): deshacer/rehacer no vuelve a resolver
+        self.cache_sol = SolutionCache(max_entries=256)
+        # Tiempos por fase (compartidos con el motor); solo miden si se activa "Tiempos"
+        self.perfil = PhaseTimer()
+        self.mostrar_tiempos = tk.BooleanVar(value=False)
+        # Recálculo en segundo plano: contador de generación para descartar resultados viejos
+        self.gen_recalc = 0
+        self.recalc_programado = None
+        self.hilo_recalc = None
+        self.cola_recalc = queue.Queue()
+        self.tiempos_antes = None
+        # Filas de la tabla: nombre -> valores mostrados (el iid de cada fila es el nombre)
+        self.filas_arbol = {}
+        self.orden_arbol = []
         
         self.modo = "SELECCIONAR" 
         self.seleccionado = None      
         self.tipo_seleccionado = None 
         self.nodo_inicio = None
+        self.nodo_arrastre = None
         self.linea_guia = None
         self.bloqueo_arbol = False 
         self.orientacion = "HORIZONTAL"
         self.mostrar_voltajes = tk.BooleanVar(value=True)
+        # Vista: coordenadas del lienzo = mundo * zoom + (ox, oy); nodos y componentes guardan las del mundo
+        self.zoom, self.ox, self.oy = 1.0, 0.0, 0.0
+        self.etiquetas_visibles = True
+        self.paso_rejilla = self.GRID_SIZE
+        self.rejilla_desfase = [0.0, 0.0]
+        self.rejilla_programada = None
+        self.pan_previo = None
 
         self.crear_interfaz()
         self.save_state() 
@@ -248,6 +362,10 @@ class SimuladorPro(tk.Tk):
         self.bind("<Delete>", self.eliminar_seleccion)
         self.bind("<Escape>", lambda e: self.set_modo("SELECCIONAR"))
         self.bind("<space>", self.toggle_orientacion)
+        self.bind("<Control-plus>", lambda e: self.zoom_centro(1.2))
+        self.bind("<Control-equal>", lambda e: self.zoom_centro(1.2))
+        self.bind("<Control-minus>", lambda e: self.zoom_centro(1 / 1.2))
+        self.bind("<Control-0>", lambda e: self.restablecer_vista())
 
     def crear_interfaz(self):
         barra = tk.Frame(self, bg="#2c3e50", height=70, pady=5)
@@ -272,9 +390,13 @@ class SimuladorPro(tk.Tk):
                              bg="#2c3e50", fg="white", selectcolor="#2c3e50", activebackground="#2c3e50", activeforeground="white",
                              font=("Segoe UI", 10))
         chk.pack(side="left")
+        tk.Checkbutton(barra, text="Tiempos", variable=self.mostrar_tiempos, command=self.toggle_tiempos,
+                       bg="#2c3e50", fg="white", selectcolor="#2c3e50", activebackground="#2c3e50", activeforeground="white",
+                       font=("Segoe UI", 10)).pack(side="left", padx=(10, 0))
 
         tk.Button(barra, text="↪ Rehacer", command=self.redo, bg="#7f8c8d", fg="white", relief="flat", padx=10).pack(side="right", padx=5)
         tk.Button(barra, text="↩ Deshacer", command=self.undo, bg="#7f8c8d", fg="white", relief="flat", padx=10).pack(side="right", padx=5)
+        tk.Button(barra, text="⊙ 100%", command=self.restablecer_vista, bg="#7f8c8d", fg="white", relief="flat", padx=10).pack(side="right", padx=5)
         
         self.paned = tk.PanedWindow(self, orient=tk.HORIZONTAL, sashwidth=8, bg="#bdc3c7")
         self.paned.pack(fill="both", expand=True)
@@ -286,11 +408,19 @@ class SimuladorPro(tk.Tk):
         self.canvas.pack(fill="both", expand=True)
         
         self.update()
-        dibujar_rejilla(self.canvas, self.winfo_screenwidth(), self.winfo_screenheight(), self.GRID_SIZE)
+        self.redibujar_rejilla()
         
         self.canvas.bind("<Button-1>", self.clic_canvas)
         self.canvas.bind("<B1-Motion>", self.arrastrar_canvas)
         self.canvas.bind("<ButtonRelease-1>", self.soltar_canvas)
+        # Paneo con el botón central o derecho; zoom con la rueda (Windows/macOS y X11)
+        for b in ("2", "3"):
+            self.canvas.bind(f"<ButtonPress-{b}>", self.iniciar_paneo)
+            self.canvas.bind(f"<B{b}-Motion>", self.panear)
+        self.canvas.bind("<MouseWheel>", self.zoom_rueda)
+        self.canvas.bind("<Button-4>", self.zoom_rueda)
+        self.canvas.bind("<Button-5>", self.zoom_rueda)
+        self.canvas.bind("<Configure>", self.programar_rejilla)
 
         self.frame_datos = tk.Frame(self.paned, bg="#ecf0f1")
         self.paned.add(self.frame_datos, minsize=500)
@@ -328,9 +458,95 @@ class SimuladorPro(tk.Tk):
         self.status_bar.pack(fill="x", side="bottom")
 
     def actualizar_etiquetas_voltaje(self):
-        state = "normal" if self.mostrar_voltajes.get() else "hidden"
+        state = "normal" if self.mostrar_voltajes.get() and self.etiquetas_visibles else "hidden"
         self.canvas.itemconfig("lbl_volt_wire", state=state)
 
+    # --- VISTA: PANEO, ZOOM Y REJILLA VIRTUAL ---
+    def a_mundo(self, x, y): return (x - self.ox) / self.zoom, (y - self.oy) / self.zoom
+    def a_lienzo(self, x, y): return x * self.zoom + self.ox, y * self.zoom + self.oy
+
+    def a_vista(self, ids):
+        """Lleva ítems recién dibujados en coordenadas del mundo a la vista actual"""
+        if self.zoom != 1.0 or self.ox != 0.0 or self.oy != 0.0:
+            for i in ids:
+                self.canvas.scale(i, 0, 0, self.zoom, self.zoom); self.canvas.move(i, self.ox, self.oy)
+        if not self.etiquetas_visibles: self.canvas.itemconfig("etiqueta", state="hidden")
+
+    def redibujar_rejilla(self, e=None):
+        self.rejilla_programada = None
+        self.paso_rejilla = dibujar_rejilla(self.canvas, self.canvas.winfo_width(), self.canvas.winfo_height(),
+                                            self.GRID_SIZE, self.zoom, (self.ox, self.oy))
+        self.rejilla_desfase = [0.0, 0.0]
+
+    def programar_rejilla(self, e=None):
+        if self.rejilla_programada is None: self.rejilla_programada = self.after_idle(self.redibujar_rejilla)
+
+    def iniciar_paneo(self, event): self.pan_previo = (event.x, event.y)
+
+    def panear(self, event):
+        if self.pan_previo is None: return
+        dx, dy = event.x - self.pan_previo[0], event.y - self.pan_previo[1]
+        self.pan_previo = (event.x, event.y)
+        self.canvas.move("all", dx, dy)
+        self.ox += dx; self.oy += dy
+        # La rejilla es periódica: se la devuelve un número entero de pasos y sigue cubriendo la ventana
+        p, d = self.paso_rejilla, self.rejilla_desfase
+        d[0] += dx; d[1] += dy
+        sx, sy = -p * math.floor(d[0] / p), -p * math.floor(d[1] / p)
+        if sx or sy:
+            self.canvas.move("rejilla", sx, sy); d[0] += sx; d[1] += sy
+
+    def zoom_rueda(self, event):
+        acercar = getattr(event, 'num', 0) == 4 or getattr(event, 'delta', 0) > 0
+        self.aplicar_zoom(1.2 if acercar else 1 / 1.2, event.x, event.y)
+
+    def zoom_centro(self, factor):
+        self.aplicar_zoom(factor, self.canvas.winfo_width() / 2, self.canvas.winfo_height() / 2)
+
+    def aplicar_zoom(self, factor, cx, cy):
+        nuevo = min(ZOOM_MAX, max(ZOOM_MIN, self.zoom * factor))
+        f = nuevo / self.zoom
+        if f == 1.0: return
+        self.canvas.delete("rejilla")
+        self.canvas.scale("all", cx, cy, f, f)
+        self.zoom = nuevo
+        self.ox, self.oy = cx + (self.ox - cx) * f, cy + (self.oy - cy) * f
+        self.redibujar_rejilla()
+        self.aplicar_visibilidad_etiquetas()
+
+    def restablecer_vista(self):
+        self.canvas.delete("rejilla")
+        self.canvas.move("all", -self.ox, -self.oy)
+        self.canvas.scale("all", 0, 0, 1 / self.zoom, 1 / self.zoom)
+        self.zoom, self.ox, self.oy = 1.0, 0.0, 0.0
+        self.redibujar_rejilla()
+        self.aplicar_visibilidad_etiquetas()
+
+    def aplicar_visibilidad_etiquetas(self):
+        """Con poco zoom los textos (que no escalan) se ocultan"""
+        visibles = self.zoom >= ZOOM_ETIQUETAS
+        if visibles == self.etiquetas_visibles: return
+        self.etiquetas_visibles = visibles
+        self.canvas.itemconfig("etiqueta", state="normal" if visibles else "hidden")
+        if not visibles: return
+        # Al volver a mostrarlas se respetan las ocultas por otro motivo (voltajes, flechas sin corriente)
+        self.actualizar_etiquetas_voltaje()
+        for c in self.componentes:
+            if c['vista'].get('flecha', False) is None:
+                self.canvas.itemconfig(c['roles']['flecha_txt'], state="hidden")
+                self.canvas.itemconfig(c['roles']['flecha_bg'], state="hidden")
+
+    def toggle_tiempos(self):
+        self.perfil.enabled = self.mostrar_tiempos.get()
+        self.perfil.reset()
+        self.simular_en_tiempo_real()
+
+    def texto_tiempos(self, antes):
+        """Duración de cada fase que corrió en este recálculo (las que no cambiaron de cuenta se omiten)"""
+        partes = [f"{ETIQUETAS_FASE.get(k, k)} {st[2]*1e3:.2f} ms" for k, st in self.perfil.stats.items()
+                  if st[0] != antes.get(k, 0)]
+        return " | ".join(partes)
+
     def btn_tool(self, parent, txt, mode, col, fg="white"):
         tk.Button(parent, text=txt, command=lambda: self.set_modo(mode), bg=col, fg=fg, 
                  font=("Segoe UI", 10, "bold"), relief="flat", width=14, pady=5).pack(side="left", padx=5)
@@ -357,13 +573,14 @@ class SimuladorPro(tk.Tk):
 
     def clic_canvas(self, event):
         self.canvas.focus_set()
-        x, y = self.snap(event.x), self.snap(event.y)
+        wx, wy = self.a_mundo(event.x, event.y)
+        x, y = self.snap(wx), self.snap(wy)
         
         if self.modo == "GND":
             idx = self.find_node(x, y)
             if idx is not None:
-                self.tierra_idx = idx
-                self.save_state()
+                if idx != self.tierra_idx:
+                    self.save_state(); self.registrar(('tierra', self.tierra_idx, idx))
                 self.simular_en_tiempo_real()
                 return 
 
@@ -394,7 +611,8 @@ class SimuladorPro(tk.Tk):
         elif self.modo == "GND":
             idx = self.find_node(x,y)
             if idx is None:
-                self.save_state(); idx = self.crear_nodo(x,y); self.tierra_idx = idx
+                self.save_state(); idx = self.crear_nodo(x,y)
+                if idx != self.tierra_idx: self.registrar(('tierra', self.tierra_idx, idx))
                 self.set_modo("SELECCIONAR"); self.simular_en_tiempo_real()
 
         elif self.modo == "NODO":
@@ -404,50 +622,66 @@ class SimuladorPro(tk.Tk):
             idx = self.find_node(x,y)
             if idx is not None:
                 self.nodo_inicio = idx
-                nx, ny = self.nodos[idx]['x'], self.nodos[idx]['y']
-                self.linea_guia = self.canvas.create_line(nx, ny, x, y, dash=(2,2), fill="#2c3e50", width=2)
+                nx, ny = self.a_lienzo(self.nodos[idx]['x'], self.nodos[idx]['y'])
+                self.linea_guia = self.canvas.create_line(nx, ny, *self.a_lienzo(x, y), dash=(2,2), fill="#2c3e50", width=2)
         elif self.modo == "SELECCIONAR":
             idx_n = self.find_node(x,y)
-            if idx_n is not None: self.seleccionar('NODO', idx_n); return
+            if idx_n is not None:
+                # Arrastrar un nodo lo mueve (ver soltar_canvas)
+                self.seleccionar('NODO', idx_n); self.nodo_arrastre = idx_n; return
             idx_c = self.find_comp(x,y)
             if idx_c is not None: self.seleccionar('COMP', idx_c); return
             self.seleccionar(None, None)
 
     def arrastrar_canvas(self, event):
+        wx, wy = self.a_mundo(event.x, event.y)
         if self.linea_guia and self.modo == "WIRE":
-            x, y = self.snap(event.x), self.snap(event.y)
-            nx, ny = self.nodos[self.nodo_inicio]['x'], self.nodos[self.nodo_inicio]['y']
+            x, y = self.a_lienzo(self.snap(wx), self.snap(wy))
+            nx, ny = self.a_lienzo(self.nodos[self.nodo_inicio]['x'], self.nodos[self.nodo_inicio]['y'])
             dist_x, dist_y = abs(x-nx), abs(y-ny)
             if dist_x > dist_y: self.canvas.coords(self.linea_guia, nx, ny, x, ny, x, y)
             else: self.canvas.coords(self.linea_guia, nx, ny, nx, y, x, y)
         if self.modo in ["WIRE", "R", "V", "I", "SELECCIONAR"]:
-            idx = self.find_node(event.x, event.y)
+            idx = self.find_node(wx, wy)
             self.canvas.delete("highlight")
             if idx is not None:
-                nx, ny = self.nodos[idx]['x'], self.nodos[idx]['y']
+                nx, ny = self.a_lienzo(self.nodos[idx]['x'], self.nodos[idx]['y'])
                 self.canvas.create_oval(nx-10, ny-10, nx+10, ny+10, outline="#39ff14", width=3, tags="highlight")
+        if self.nodo_arrastre is not None and self.modo == "SELECCIONAR":
+            self.canvas.delete("fantasma")
+            gx, gy = self.a_lienzo(self.snap(wx), self.snap(wy))
+            self.canvas.create_oval(gx-8, gy-8, gx+8, gy+8, outline="#e74c3c", width=2, dash=(2,2), tags="fantasma")
 
     def soltar_canvas(self, event):
         if self.linea_guia:
             self.canvas.delete(self.linea_guia)
             self.linea_guia = None
             if self.modo == "WIRE":
-                x, y = self.snap(event.x), self.snap(event.y)
+                wx, wy = self.a_mundo(event.x, event.y)
+                x, y = self.snap(wx), self.snap(wy)
                 idx_end = self.find_node(x,y)
                 if idx_end is not None and idx_end != self.nodo_inicio:
                     self.save_state()
                     self.crear_componente(self.nodo_inicio, idx_end, "WIRE")
                     self.simular_en_tiempo_real()
             self.nodo_inicio = None
+        if self.nodo_arrastre is not None:
+            i, self.nodo_arrastre = self.nodo_arrastre, None
+            self.canvas.delete("fantasma")
+            wx, wy = self.a_mundo(event.x, event.y)
+            x, y = self.snap(wx), self.snap(wy)
+            n = self.nodos[i]
+            if (x, y) != (n['x'], n['y']) and self.find_node(x, y) is None:
+                self.save_state()
+                self.registrar(('mover', i, (n['x'], n['y']), (x, y)))
+                self.simular_en_tiempo_real()
 
     def crear_nodo(self, x, y):
         existente = self.find_node(x, y)
         if existente is not None: return existente
-        is_gnd = (len(self.nodos) == 0)
-        if is_gnd: self.tierra_idx = 0
-        lbl = "GND" if is_gnd else str(len(self.nodos))
-        uid, txt_id = crear_nodo_visual_func(self.canvas, x, y, lbl, is_gnd)
-        self.nodos.append({'x': x, 'y': y, 'id': uid, 'txt_id': txt_id})
+        if not self.nodos and self.tierra_idx != 0: self.registrar(('tierra', self.tierra_idx, 0))
+        # El primer nodo lleva el símbolo de tierra
+        self.registrar(('nodo+', len(self.nodos), {'x': x, 'y': y, 'gnd': not self.nodos, 'tierra': False}))
         return len(self.nodos) - 1
 
     def crear_componente(self, n1, n2, tipo, valor=None, nombre=None):
@@ -458,30 +692,122 @@ class SimuladorPro(tk.Tk):
             count = len([c for c in self.componentes if c['tipo'] == tipo]) + 1
             prefix = "W" if tipo == "WIRE" else tipo
             nombre = f"{prefix}{count}"
+        self.registrar(('comp+', len(self.componentes), {'tipo': tipo, 'n1': n1, 'n2': n2, 'valor': valor, 'nombre': nombre}))
+        return len(self.componentes) - 1
+
+    # --- EDICIÓN: operaciones primitivas reversibles (los deltas del historial) ---
+    # ('nodo+' | 'nodo-', idx, datos), ('comp+' | 'comp-', idx, datos), ('valor', idx, viejo, nuevo),
+    # ('tierra', vieja, nueva), ('mover', idx, (x0, y0), (x1, y1))
+    def registrar(self, op):
+        """Aplica una operación y la agrega al comando abierto del historial"""
+        self.aplicar_op(op)
+        self.history.record(op)
+
+    def aplicar_op(self, op, revertir=False):
+        k = op[0]
+        if k == 'nodo+': (self.quitar_nodo if revertir else self.poner_nodo)(op[1], op[2])
+        elif k == 'nodo-': (self.poner_nodo if revertir else self.quitar_nodo)(op[1], op[2])
+        elif k == 'comp+': (self.quitar_comp if revertir else self.poner_comp)(op[1], op[2])
+        elif k == 'comp-': (self.poner_comp if revertir else self.quitar_comp)(op[1], op[2])
+        elif k == 'valor':
+            # Se redibuja para que la caja del valor se ajuste al texto nuevo
+            self.componentes[op[1]]['valor'] = op[2] if revertir else op[3]; self.redibujar_comp(op[1])
+        elif k == 'tierra': self.tierra_idx = op[1] if revertir else op[2]
+        elif k == 'mover': self.mover_nodo(op[1], *(op[2] if revertir else op[3]))
+
+    def datos_nodo(self, idx):
+        n = self.nodos[idx]
+        return {'x': n['x'], 'y': n['y'], 'gnd': bool(n['gnd_ids']), 'tierra': idx == self.tierra_idx}
+
+    def datos_comp(self, idx):
+        c = self.componentes[idx]
+        return {k: c[k] for k in ('tipo', 'n1', 'n2', 'valor', 'nombre')}
+
+    def poner_nodo(self, idx, d):
+        x, y = d['x'], d['y']
+        lbl = "GND" if d['gnd'] else str(idx)
+        uid, txt_id, gnd_ids = crear_nodo_visual_func(self.canvas, x, y, lbl, d['gnd'])
+        self.a_vista([uid, txt_id] + gnd_ids)
+        # Los índices posteriores se corren un lugar (componentes y tierra)
+        if d['tierra']: self.tierra_idx = idx
+        elif idx <= self.tierra_idx < len(self.nodos): self.tierra_idx += 1
+        self.nodos.insert(idx, {'x': x, 'y': y, 'id': uid, 'txt_id': txt_id, 'gnd_ids': gnd_ids})
+        self.idx_nodos.agregar(self.nodos[idx], x, y, idx)
+        if idx == len(self.nodos) - 1: return
+        self.idx_nodos.renumerar(self.nodos, idx + 1)
+        for c in self.componentes:
+            if c['n1'] >= idx: c['n1'] += 1
+            if c['n2'] >= idx: c['n2'] += 1
+
+    def quitar_nodo(self, idx, d):
+        """Solo se quitan nodos sin componentes (como en cleanup_isolated_nodes)"""
+        n = self.nodos.pop(idx)
+        self.idx_nodos.quitar(n); self.idx_nodos.renumerar(self.nodos, idx)
+        self.canvas.delete(n['id'], n['txt_id'], *n['gnd_ids'])
+        if idx == self.tierra_idx: self.tierra_idx = 0
+        elif self.tierra_idx > idx: self.tierra_idx -= 1
+        for c in self.componentes:
+            if c['n1'] > idx: c['n1'] -= 1
+            if c['n2'] > idx: c['n2'] -= 1
+
+    def dibujar_comp(self, d):
+        """Dibuja un componente a partir de sus datos y devuelve su registro (no lo agrega a la lista)"""
+        tipo, n1, n2 = d['tipo'], d['n1'], d['n2']
         x1, y1 = self.nodos[n1]['x'], self.nodos[n1]['y']
         x2, y2 = self.nodos[n2]['x'], self.nodos[n2]['y']
-        ids = dibujar_componente_func(self.canvas, x1, y1, x2, y2, tipo, valor, nombre)
-        self.componentes.append({'tipo': tipo, 'n1': n1, 'n2': n2, 'valor': valor, 'ids': ids, 'nombre': nombre})
+        ids = dibujar_componente_func(self.canvas, x1, y1, x2, y2, tipo, d['valor'], d['nombre'])
+        self.a_vista(ids)
+        roles = roles_componente(tipo, ids, abs(y2 - y1) > abs(x2 - x1))
         
         if tipo == 'WIRE':
-            # ids: line, line(opt), bg, text
-            volt_id = ids[-1] 
-            bg_id = ids[-2]
-            state = "normal" if self.mostrar_voltajes.get() else "hidden"
-            self.canvas.itemconfig(volt_id, state=state)
-            self.canvas.itemconfig(bg_id, state=state)
-            
-        return len(self.componentes) - 1
+            # Etiqueta de voltaje del cable según "Ver Voltajes"
+            state = "normal" if self.mostrar_voltajes.get() and self.etiquetas_visibles else "hidden"
+            self.canvas.itemconfig(roles['volt_txt'], state=state)
+            self.canvas.itemconfig(roles['volt_bg'], state=state)
+        # 'vista': lo que muestra hoy el lienzo (refrescar_lienzo solo actualiza lo que cambió)
+        return {'tipo': tipo, 'n1': n1, 'n2': n2, 'valor': d['valor'], 'ids': ids, 'nombre': d['nombre'],
+                'roles': roles, 'vista': {}}
+
+    def poner_comp(self, idx, d):
+        c = self.dibujar_comp(d)
+        self.componentes.insert(idx, c)
+        self.idx_comps.agregar(c, *self.centro_comp(c), idx); self.idx_comps.renumerar(self.componentes, idx + 1)
+
+    def quitar_comp(self, idx, d):
+        c = self.componentes.pop(idx)
+        self.idx_comps.quitar(c); self.idx_comps.renumerar(self.componentes, idx)
+        self.canvas.delete(*c['ids'])
+
+    def mover_nodo(self, idx, x, y):
+        """Mueve un nodo y redibuja solo los componentes conectados a él"""
+        n = self.nodos[idx]
+        dx, dy = (x - n['x']) * self.zoom, (y - n['y']) * self.zoom
+        for item in [n['id'], n['txt_id']] + n['gnd_ids']: self.canvas.move(item, dx, dy)
+        n['x'], n['y'] = x, y
+        self.idx_nodos.mover(n, x, y)
+        for k, c in enumerate(self.componentes):
+            if c['n1'] == idx or c['n2'] == idx: self.redibujar_comp(k)
+
+    def redibujar_comp(self, idx):
+        """Redibuja un componente; su registro es nuevo, así que se reemplaza en el índice"""
+        viejo = self.componentes[idx]
+        self.canvas.delete(*viejo['ids'])
+        self.idx_comps.quitar(viejo)
+        c = self.componentes[idx] = self.dibujar_comp(viejo)
+        self.idx_comps.agregar(c, *self.centro_comp(c), idx)
+        if self.tipo_seleccionado == 'COMP' and self.seleccionado == idx: self.seleccionar('COMP', idx, update_tree=False)
 
     def seleccionar(self, tipo, idx, update_tree=True):
         self.canvas.itemconfig("nodo", fill="black")
+        for n in self.nodos: n.pop('vista', None)
         if self.tierra_idx < len(self.nodos): self.canvas.itemconfig(self.nodos[self.tierra_idx]['id'], fill="#2c3e50")
         for c in self.componentes:
             idx_shape = 0 if c['tipo']=='WIRE' else (1 if c['tipo']=='R' else 0)
             try:
                 shape_id = c['ids'][idx_shape]
                 self.canvas.itemconfig(shape_id, outline="black", width=2)
-                if c['tipo']=='WIRE': self.canvas.itemconfig(shape_id, fill="#2c3e50", width=3)
+                if c['tipo']=='WIRE':
+                    self.canvas.itemconfig(shape_id, fill="#2c3e50", width=3); c['vista'].pop('color', None)
             except: pass
         self.tipo_seleccionado = tipo; self.seleccionado = idx
         if tipo == 'NODO': self.canvas.itemconfig(self.nodos[idx]['id'], fill="#e74c3c")
@@ -494,11 +820,9 @@ class SimuladorPro(tk.Tk):
                 self.canvas.itemconfig(shape_id, outline="#e74c3c", width=3)
                 if c['tipo']=='WIRE': self.canvas.itemconfig(shape_id, fill="#e74c3c", width=5)
             except: pass
-            if update_tree:
+            if update_tree and c['nombre'] in self.filas_arbol:
                 self.bloqueo_arbol = True
-                for item in self.tree.get_children():
-                    if self.tree.item(item)['values'][0] == c['nombre']:
-                        self.tree.selection_set(item); self.tree.see(item); break
+                self.tree.selection_set(c['nombre']); self.tree.see(c['nombre'])
                 self.bloqueo_arbol = False
 
     def on_tree_select(self, event):
@@ -522,239 +846,293 @@ class SimuladorPro(tk.Tk):
             if c['nombre'] == nombre_comp: current_val = c['valor']
         new_val = simpledialog.askfloat("Editar", f"Valor para {nombre_comp}:", initialvalue=current_val, parent=self)
         if new_val is not None:
-            for c in self.componentes:
+            for i, c in enumerate(self.componentes):
                 if c['nombre'] == nombre_comp:
-                    self.save_state(); c['valor'] = new_val; break
+                    self.save_state(); self.registrar(('valor', i, c['valor'], new_val)); break
             self.simular_en_tiempo_real()
 
     def simular_en_tiempo_real(self):
+        """Pide un recálculo. Las ráfagas de ediciones se agrupan en uno solo (after_idle) y la
+        resolución corre en un hilo aparte; si hay uno en curso, al terminar se lanza el siguiente"""
+        self.gen_recalc += 1
+        if self.recalc_programado is None and self.hilo_recalc is None:
+            self.recalc_programado = self.after_idle(self.lanzar_recalculo)
+
+    def lanzar_recalculo(self):
+        self.recalc_programado = None
+        # Instantánea inmutable del circuito: el hilo no toca las estructuras de la interfaz
+        comps = tuple((c['tipo'], c['nombre'], c['n1'], c['n2'], c['valor']) for c in self.componentes)
+        self.tiempos_antes = {k: st[0] for k, st in self.perfil.stats.items()} if self.perfil.enabled else None
+        self.hilo_recalc = threading.Thread(target=self.resolver_en_hilo, args=(self.gen_recalc, self.tierra_idx, comps), daemon=True)
+        self.hilo_recalc.start()
+        self.after(RECALC_POLL_MS, self.sondear_recalculo)
+
+    def resolver_en_hilo(self, gen, tierra_idx, comps):
+        """Arma (o actualiza) el Circuit y lo resuelve. Solo corre un hilo a la vez, así que
+        self.circ y su LU en caché no se comparten entre hilos"""
+        try:
+            with self.perfil.phase('recalc'):
+                topologia = (tierra_idx, tuple(c[:4] for c in comps))
+                reutilizar = self.circ is not None and topologia == self.topologia_circ
+                circ = self.circ if reutilizar else Circuit()
+                circ.timer, circ.cache = self.perfil, self.cache_sol
+                for tipo, nombre, a, b, val in comps:
+                    n1 = str(a) if a != tierra_idx else '0'
+                    n2 = str(b) if b != tierra_idx else '0'
+                    if reutilizar:
+                        # Solo cambiaron valores: el motor actualiza su factorización (Woodbury)
+                        if tipo != 'WIRE': circ.set_value(nombre, val)
+                        continue
+                    # Los cables son cortos ideales: se fusionan en supernodos dentro del motor
+                    if tipo == 'WIRE': circ.add_wire(nombre, n1, n2)
+                    elif tipo == 'R': circ.add_resistor(nombre, n1, n2, val)
+                    elif tipo == 'V': circ.add_vsource(nombre, n1, n2, val)
+                    elif tipo == 'I': circ.add_isource(nombre, n1, n2, val)
+                self.circ, self.topologia_circ = circ, topologia
+                voltages, results = circ.solve()
+                islas = circ.floating_islands()
+            self.cola_recalc.put((gen, voltages, results, islas, None))
+        except Exception as e:
+            # Se descarta el circuito: puede haber quedado a medio actualizar
+            self.circ = self.topologia_circ = None
+            self.cola_recalc.put((gen, None, None, None, e))
+
+    def sondear_recalculo(self):
+        try:
+            gen, voltages, results, islas, error = self.cola_recalc.get_nowait()
+        except queue.Empty:
+            self.after(RECALC_POLL_MS, self.sondear_recalculo); return
+        self.hilo_recalc = None
+        if gen != self.gen_recalc:
+            # Resultado viejo: hubo ediciones mientras se resolvía; se recalcula con lo último
+            self.recalc_programado = self.after_idle(self.lanzar_recalculo); return
+        if error is not None:
+            # Sin solución (p. ej. sistema singular): se vacían tabla y lienzo para no dejar los
+            # valores del cálculo anterior y se muestra el error
+            self.aplicar_resultados({}, CircuitResults())
+            self.status_bar.config(text=f"Error: {str(error)}", fg="#e67e22"); return
+        self.aplicar_resultados(voltages, results, islas)
+
+    def aplicar_resultados(self, voltages, results, islas=()):
+        """Vuelca los resultados en la tabla y el lienzo (hilo de Tk).
+        islas: grupos de nodos sin conexión a tierra (se resuelven con su propia referencia)"""
         sel = self.tree.selection()
         sel_name = self.tree.item(sel[0])['values'][0] if sel else None
-        circ = Circuit()
-        circ.nodes.add('0')
-        
         node_degree = {str(i): 0 for i in range(len(self.nodos))}
-
         for c in self.componentes:
-            n1 = str(c['n1']) if c['n1'] != self.tierra_idx else '0'
-            n2 = str(c['n2']) if c['n2'] != self.tierra_idx else '0'
-            
-            idx1 = str(self.tierra_idx) if n1 == '0' else str(c['n1'])
-            idx2 = str(self.tierra_idx) if n2 == '0' else str(c['n2'])
-            
-            if n1 == '0': idx1 = str(self.tierra_idx)
-            if n2 == '0': idx2 = str(self.tierra_idx)
-
-            node_degree[idx1] = node_degree.get(idx1, 0) + 1
-            node_degree[idx2] = node_degree.get(idx2, 0) + 1
-
-            val = c['valor']
-            if c['tipo'] == 'WIRE': val = 1e-9
-            if c['tipo'] in ['R', 'WIRE']: circ.add_resistor(c['nombre'], n1, n2, val)
-            elif c['tipo'] == 'V': circ.add_vsource(c['nombre'], n1, n2, val)
-            elif c['tipo'] == 'I': circ.add_isource(c['nombre'], n1, n2, val)
+            node_degree[str(c['n1'])] = node_degree.get(str(c['n1']), 0) + 1
+            node_degree[str(c['n2'])] = node_degree.get(str(c['n2']), 0) + 1
 
         self.canvas.delete("error_mark")
         try:
-            voltages, results = circ.solve() 
-            self.bloqueo_arbol = True
-            self.tree.delete(*self.tree.get_children())
+            flotantes = {nd for isla in islas for nd in isla.nodes}
+            with self.perfil.phase('tree_refresh'): self.refrescar_tabla(voltages, results, node_degree, sel_name, flotantes)
+            with self.perfil.phase('canvas_update'): self.refrescar_lienzo(voltages, results)
+
+            texto = "Cálculo Automático OK"
+            if islas: texto += f" — {len(islas)} grupo(s) sin conexión a tierra: voltajes relativos"
+            if self.tiempos_antes is not None: texto += f" — {self.texto_tiempos(self.tiempos_antes)}"
+            self.status_bar.config(text=texto, fg="#e67e22" if islas else "#27ae60")
             
-            p_gen, p_dis = 0.0, 0.0
-            kcl_nodos = {str(i) if i!=self.tierra_idx else '0': 0.0 for i in range(len(self.nodos))}
+        except Exception as e:
+            self.status_bar.config(text=f"Error: {str(e)}", fg="#e67e22")
+
+    def refrescar_tabla(self, voltages, results, node_degree, sel_name, flotantes=frozenset()):
+        """Tabla de ramas, balance de potencia y validación KCL. Las filas persisten entre
+        recálculos (iid = nombre del componente): solo se tocan las que cambiaron"""
+        self.bloqueo_arbol = True
+        # Balance de potencia y KCL por nodo vienen vectorizados del motor
+        p_gen, p_dis = results.power_totals()
+        kcl = results.kcl_residuals()
+        kcl_nodos = {k: kcl.get(k, 0.0) for k in (str(i) if i!=self.tierra_idx else '0' for i in range(len(self.nodos)))}
+        orden = []
+
+        for c in self.componentes:
+            if c['tipo'] == 'WIRE': continue
+            d = results.get(c['nombre'], {'v':0, 'i':0, 'p':0})
+            n1_key = str(c['n1']) if c['n1'] != self.tierra_idx else '0'
+            n2_key = str(c['n2']) if c['n2'] != self.tierra_idx else '0'
             
-            v_max = max(voltages.values()) if voltages else 1.0
-            v_min = min(voltages.values()) if voltages else 0.0
+            va = voltages.get(n1_key, 0.0); vb = voltages.get(n2_key, 0.0)
 
-            for c in self.componentes:
-                d = results.get(c['nombre'], {'v':0, 'i':0, 'p':0})
-                n1_key = str(c['n1']) if c['n1'] != self.tierra_idx else '0'
-                n2_key = str(c['n2']) if c['n2'] != self.tierra_idx else '0'
+            val_fmt = format_eng(c['valor'], "Ω" if c['tipo']=='R' else ("V" if c['tipo']=='V' else "A"))
+            v_drop = format_eng(d['v'], "V")
+            i_fmt = format_eng(abs(d['i']), "A")
+            p_fmt = format_eng(d['p'], "W")
+            
+            vals = (c['nombre'], c['tipo'], val_fmt, f"{va:.2f}", f"{vb:.2f}", v_drop, i_fmt, p_fmt)
+            previo = self.filas_arbol.get(c['nombre'])
+            if previo is None: self.tree.insert("", "end", iid=c['nombre'], values=vals)
+            elif previo != vals: self.tree.item(c['nombre'], values=vals)
+            self.filas_arbol[c['nombre']] = vals
+            orden.append(c['nombre'])
+
+        # Filas de componentes borrados y reordenamiento (p. ej. tras deshacer un borrado)
+        vigentes = set(orden)
+        borrar = [nm for nm in self.filas_arbol if nm not in vigentes]
+        if borrar:
+            self.tree.delete(*borrar)
+            for nm in borrar: del self.filas_arbol[nm]
+        if orden != self.orden_arbol:
+            for k, nm in enumerate(orden): self.tree.move(nm, "", k)
+            self.orden_arbol = orden
+        if sel_name in vigentes and self.tree.selection() != (sel_name,): self.tree.selection_set(sel_name)
+        self.bloqueo_arbol = False
+
+        self.lbl_p_gen.config(text=f"P. Suministrada: {format_eng(p_gen, 'W')}")
+        self.lbl_p_dis.config(text=f"P. Disipada: {format_eng(p_dis, 'W')}")
+        neto = p_gen - p_dis
+        color_bal = "green" if abs(neto) < 1e-4 else "red"
+        self.lbl_balance.config(text=f"Neto: {neto:.5e} W", fg=color_bal)
+
+        lineas = [f"{'NODO':<10} | {'Σ I (A)':<15}\n" + "-"*30 + "\n"]
+        for k, v in kcl_nodos.items():
+            lbl = "GND" if k=='0' else f"N{k}"
+            real_idx = str(self.tierra_idx) if k == '0' else k
+            conns = node_degree.get(real_idx, 0)
+            if conns < 2: status = "❌ (Abierto)"
+            elif k in flotantes: status = "⚠️ (Flotante)"
+            else: status = "✅" if abs(v) < 1e-3 else "❌ (Error KCL)"
+            lineas.append(f"{lbl:<10} | {v:+.5f} {status}\n")
+        self.txt_kcl.delete("1.0", tk.END)
+        self.txt_kcl.insert(tk.END, "".join(lineas))
+
+    def refrescar_lienzo(self, voltages, results):
+        """Colores de nodos y cables, etiquetas de valor y flechas de corriente.
+        Cada componente recuerda en c['vista'] lo que muestra; solo se llama a Tk si cambió"""
+        v_max = max(voltages.values()) if voltages else 1.0
+        v_min = min(voltages.values()) if voltages else 0.0
+        cv = self.canvas
+        for c in self.componentes:
+            r, vista = c['roles'], c['vista']
+            if c['tipo'] == 'WIRE':
+                v_wire = voltages.get(str(c['n1']) if c['n1'] != self.tierra_idx else '0', 0.0)
+                color = get_voltage_color(v_wire, v_min, v_max)
+                if vista.get('color') != color:
+                    cv.itemconfig(r['linea'], fill=color); vista['color'] = color
                 
-                kcl_nodos[n1_key] -= d['i']
-                kcl_nodos[n2_key] += d['i']
-
-                if c['tipo'] == 'WIRE': 
-                    v_wire = voltages.get(n1_key, 0.0)
-                    color = get_voltage_color(v_wire, v_min, v_max)
-                    self.canvas.itemconfig(c['ids'][0], fill=color)
-                    
-                    # Update wire voltage text
-                    for item in c['ids']:
-                        tags = self.canvas.gettags(item)
-                        if "lbl_volt_wire" in tags and self.canvas.type(item) == "text":
-                            self.canvas.itemconfig(item, text=format_eng(v_wire, "V"))
-                            # Update BG
-                            bg_item = c['ids'][c['ids'].index(item)-1]
-                            txt = format_eng(v_wire, "V")
-                            w_box = len(txt)*6
-                            h_box = 16
-                            coords = self.canvas.coords(item)
-                            if self.canvas.itemcget(item, "angle") == "90.0":
-                                w_box, h_box = h_box, w_box
-                            
-                            self.canvas.coords(bg_item, coords[0]-w_box/2, coords[1]-h_box/2, coords[0]+w_box/2, coords[1]+h_box/2)
-                    continue 
+                txt = format_eng(v_wire, "V")
+                if vista.get('volt') != txt:
+                    cv.itemconfig(r['volt_txt'], text=txt)
+                    # Los fondos escalan con el zoom como el resto de la geometría
+                    w_box = len(txt)*6*self.zoom
+                    h_box = 16*self.zoom
+                    if r['vertical']: w_box, h_box = h_box, w_box
+                    coords = cv.coords(r['volt_txt'])
+                    cv.coords(r['volt_bg'], coords[0]-w_box/2, coords[1]-h_box/2, coords[0]+w_box/2, coords[1]+h_box/2)
+                    vista['volt'] = txt
+                continue
+            
+            val_txt = format_eng(c['valor'], "Ω" if c['tipo']=='R' else ("V" if c['tipo']=='V' else "A"))
+            if vista.get('valor') != val_txt:
+                cv.itemconfig(r['valor'], text=val_txt); vista['valor'] = val_txt
+
+            curr = results.get(c['nombre'], {'i':0})['i']
+            flecha = None
+            if abs(curr) > 1e-12:
+                x1,y1 = self.nodos[c['n1']]['x'], self.nodos[c['n1']]['y']
+                x2,y2 = self.nodos[c['n2']]['x'], self.nodos[c['n2']]['y']
                 
-                va = voltages.get(n1_key, 0.0); vb = voltages.get(n2_key, 0.0)
-                if d['p'] > 0: p_dis += d['p']
-                else: p_gen += abs(d['p'])
-
-                val_fmt = format_eng(c['valor'], "Ω" if c['tipo']=='R' else ("V" if c['tipo']=='V' else "A"))
-                v_drop = format_eng(d['v'], "V")
-                i_fmt = format_eng(abs(d['i']), "A")
-                p_fmt = format_eng(d['p'], "W")
+                # LOGICA DE FLECHA ABSOLUTA EN PANTALLA
+                dx = x2 - x1
+                dy = y2 - y1
+                if curr < 0:
+                    dx, dy = -dx, -dy # Invertir vector si corriente negativa
                 
-                vals = (c['nombre'], c['tipo'], val_fmt, f"{va:.2f}", f"{vb:.2f}", v_drop, i_fmt, p_fmt)
-                item = self.tree.insert("", "end", values=vals)
-                if c['nombre'] == sel_name: self.tree.selection_set(item)
-            
-            self.bloqueo_arbol = False
-            
-            for c in self.componentes:
-                if c['tipo'] == 'WIRE': continue
+                ang = math.degrees(math.atan2(dy, dx)) % 360
                 
-                # Update value text
-                for item in c['ids']:
-                    tags = self.canvas.gettags(item)
-                    if "comp" in tags and self.canvas.type(item) == "text":
-                        txt = self.canvas.itemcget(item, "text")
-                        if any(ch.isdigit() for ch in txt) and c['nombre'] not in txt:
-                             self.canvas.itemconfig(item, text=format_eng(c['valor'], "Ω" if c['tipo']=='R' else ("V" if c['tipo']=='V' else "A")))
-
-                arrow_text_id = c['ids'][-1]
-                arrow_bg_id = c['ids'][-2]
+                # Selección de caracter basado en ángulo de pantalla
+                if 45 <= ang < 135:   arrow_char = "▼" 
+                elif 135 <= ang < 225: arrow_char = "◄" 
+                elif 225 <= ang < 315: arrow_char = "▲" 
+                else:                 arrow_char = "➤" 
                 
-                curr = results.get(c['nombre'], {'i':0})['i']
-                if abs(curr) > 1e-12:
-                    x1,y1 = self.nodos[c['n1']]['x'], self.nodos[c['n1']]['y']
-                    x2,y2 = self.nodos[c['n2']]['x'], self.nodos[c['n2']]['y']
-                    
-                    # LOGICA DE FLECHA ABSOLUTA EN PANTALLA
-                    dx = x2 - x1
-                    dy = y2 - y1
-                    if curr < 0:
-                        dx, dy = -dx, -dy # Invertir vector si corriente negativa
-                    
-                    ang = math.degrees(math.atan2(dy, dx)) % 360
-                    
-                    # Selección de caracter basado en ángulo de pantalla
-                    if 45 <= ang < 135:   arrow_char = "▼" 
-                    elif 135 <= ang < 225: arrow_char = "◄" 
-                    elif 225 <= ang < 315: arrow_char = "▲" 
-                    else:                 arrow_char = "➤" 
-                    
-                    is_vertical = abs(y2 - y1) > abs(x2 - x1)
-                    txt_angle = 90 if is_vertical else 0
-                    
-                    # Texto SIEMPRE horizontal para lectura fácil (revertido a angle=0 por feedback)
-                    # Pero el usuario pidió vertical si el componente es vertical.
-                    # Vamos a respetar la lógica de rotación del texto de intensidad si es vertical
-                    
-                    final_txt = f"{arrow_char} {format_eng(abs(curr), 'A')}"
-                    
-                    self.canvas.itemconfig(arrow_text_id, text=final_txt, angle=txt_angle, state="normal")
-                    self.canvas.itemconfig(arrow_bg_id, state="normal")
-                    
-                    # Ajustar fondo de flecha
-                    coords = self.canvas.coords(arrow_text_id) 
-                    char_w = 6
-                    w_box = len(final_txt) * char_w
-                    h_box = 16
-                    if txt_angle == 90: w_box, h_box = h_box, w_box
-                    
-                    self.canvas.coords(arrow_bg_id, coords[0]-w_box/2, coords[1]-h_box/2, coords[0]+w_box/2, coords[1]+h_box/2)
-
-                else: 
-                    self.canvas.itemconfig(arrow_text_id, state="hidden")
-                    self.canvas.itemconfig(arrow_bg_id, state="hidden")
-
-            for i, n in enumerate(self.nodos):
-                if i == self.tierra_idx:
-                    self.canvas.delete(n.get('gnd_lines', [])) 
-                key = str(i) if i!=self.tierra_idx else '0'
-                v_val = voltages.get(key, 0.0)
-                color = get_voltage_color(v_val, v_min, v_max)
-                self.canvas.itemconfig(n['id'], fill=color)
-                prefix = "GND" if i==self.tierra_idx else f"N{i}"
-                self.canvas.itemconfig(n['txt_id'], text=prefix)
-
-            self.lbl_p_gen.config(text=f"P. Suministrada: {format_eng(p_gen, 'W')}")
-            self.lbl_p_dis.config(text=f"P. Disipada: {format_eng(p_dis, 'W')}")
-            neto = p_gen - p_dis
-            color_bal = "green" if abs(neto) < 1e-4 else "red"
-            self.lbl_balance.config(text=f"Neto: {neto:.5e} W", fg=color_bal)
-
-            self.txt_kcl.delete("1.0", tk.END)
-            self.txt_kcl.insert(tk.END, f"{'NODO':<10} | {'Σ I (A)':<15}\n" + "-"*30 + "\n")
+                # Texto vertical si el componente es vertical
+                txt_angle = 90 if r['vertical'] else 0
+                flecha = (f"{arrow_char} {format_eng(abs(curr), 'A')}", txt_angle)
+
+            if vista.get('flecha', False) == flecha: continue
+            vista['flecha'] = flecha
+            if flecha is None:
+                cv.itemconfig(r['flecha_txt'], state="hidden")
+                cv.itemconfig(r['flecha_bg'], state="hidden")
+                continue
+            final_txt, txt_angle = flecha
+            estado = "normal" if self.etiquetas_visibles else "hidden"
+            cv.itemconfig(r['flecha_txt'], text=final_txt, angle=txt_angle, state=estado)
+            cv.itemconfig(r['flecha_bg'], state=estado)
             
-            for k, v in kcl_nodos.items():
-                lbl = "GND" if k=='0' else f"N{k}"
-                real_idx = str(self.tierra_idx) if k == '0' else k
-                conns = node_degree.get(real_idx, 0)
-                if conns < 2: status = "❌ (Abierto)"
-                else: status = "✅" if abs(v) < 1e-3 else "❌ (Error KCL)"
-                self.txt_kcl.insert(tk.END, f"{lbl:<10} | {v:+.5f} {status}\n")
-
-            self.status_bar.config(text="Cálculo Automático OK", fg="#27ae60")
+            # Ajustar fondo de flecha
+            coords = cv.coords(r['flecha_txt']) 
+            char_w = 6
+            w_box = len(final_txt) * char_w * self.zoom
+            h_box = 16 * self.zoom
+            if txt_angle == 90: w_box, h_box = h_box, w_box
             
-        except Exception as e:
-            self.status_bar.config(text=f"Error: {str(e)}", fg="#e67e22")
+            cv.coords(r['flecha_bg'], coords[0]-w_box/2, coords[1]-h_box/2, coords[0]+w_box/2, coords[1]+h_box/2)
+
+        for i, n in enumerate(self.nodos):
+            if i == self.tierra_idx and n.get('gnd_lines'):
+                cv.delete(n['gnd_lines']) 
+            key = str(i) if i!=self.tierra_idx else '0'
+            v_val = voltages.get(key, 0.0)
+            color = get_voltage_color(v_val, v_min, v_max)
+            prefix = "GND" if i==self.tierra_idx else f"N{i}"
+            if n.get('vista') != (color, prefix):
+                cv.itemconfig(n['id'], fill=color)
+                cv.itemconfig(n['txt_id'], text=prefix)
+                n['vista'] = (color, prefix)
 
     def save_state(self):
-        if not self.history.is_recording: return
-        state = {'n': [{'x':n['x'],'y':n['y']} for n in self.nodos], 
-                 'c': [{'t':c['tipo'],'n1':c['n1'],'n2':c['n2'],'v':c['valor'],'n':c['nombre']} for c in self.componentes]}
-        self.history.save(state)
+        """Abre un comando de historial antes de una edición"""
+        self.history.save()
 
     def undo(self, e=None):
-        s = self.history.undo()
-        if s: self.restore(s)
+        cmd = self.history.undo()
+        if cmd: self.reproducir(cmd, revertir=True)
 
     def redo(self, e=None):
-        s = self.history.redo()
-        if s: self.restore(s)
-
-    def restore(self, s):
-        self.history.is_recording = False
-        self.canvas.delete("all")
-        dibujar_rejilla(self.canvas, self.winfo_screenwidth(), self.winfo_screenheight(), self.GRID_SIZE)
-        self.nodos = []
-        self.componentes = []
-        for n in s['n']: self.crear_nodo(n['x'], n['y'])
-        for c in s['c']: self.crear_componente(c['n1'], c['n2'], c['t'], c['v'], c['n'])
-        self.history.is_recording = True
+        cmd = self.history.redo()
+        if cmd: self.reproducir(cmd)
+
+    def reproducir(self, cmd, revertir=False):
+        """Aplica o revierte un comando en el lugar: solo se tocan los ítems afectados"""
+        self.quitar_resaltado()
+        for op in (reversed(cmd) if revertir else cmd): self.aplicar_op(op, revertir)
         self.simular_en_tiempo_real()
 
+    def quitar_resaltado(self):
+        """Deselecciona restaurando solo el ítem resaltado (seleccionar(None) recorre todo)"""
+        i, tipo = self.seleccionado, self.tipo_seleccionado
+        if i is None: tipo = None
+        if tipo == 'NODO' and i < len(self.nodos):
+            self.canvas.itemconfig(self.nodos[i]['id'], fill="black"); self.nodos[i].pop('vista', None)
+        elif tipo == 'COMP' and i < len(self.componentes):
+            c = self.componentes[i]
+            shape_id = c['ids'][1 if c['tipo'] == 'R' else 0]
+            self.canvas.itemconfig(shape_id, outline="black", width=2)
+            if c['tipo'] == 'WIRE':
+                self.canvas.itemconfig(shape_id, fill="#2c3e50", width=3); c['vista'].pop('color', None)
+        self.seleccionado = self.tipo_seleccionado = None
+
     def cleanup_isolated_nodes(self):
+        """Quita los nodos sin componentes (de mayor a menor índice, para no correr los pendientes).
+        Si se va el nodo de tierra, la tierra pasa al nodo 0 como antes"""
         used_indices = set()
         for c in self.componentes:
             used_indices.add(c['n1'])
             used_indices.add(c['n2'])
-        new_nodos = []
-        mapping = {}
-        for old_i, node in enumerate(self.nodos):
-            if old_i in used_indices:
-                mapping[old_i] = len(new_nodos)
-                new_nodos.append(node)
-            else:
-                self.canvas.delete(node['id'])
-                self.canvas.delete(node['txt_id'])
-        for c in self.componentes:
-            c['n1'] = mapping[c['n1']]
-            c['n2'] = mapping[c['n2']]
-        if self.tierra_idx in mapping:
-            self.tierra_idx = mapping[self.tierra_idx]
-        else:
-            self.tierra_idx = 0 if len(new_nodos) > 0 else 0
-        self.nodos = new_nodos
+        for i in reversed(range(len(self.nodos))):
+            if i not in used_indices: self.registrar(('nodo-', i, self.datos_nodo(i)))
+
+    def centro_comp(self, c):
+        n1, n2 = self.nodos[c['n1']], self.nodos[c['n2']]
+        return (n1['x'] + n2['x']) / 2, (n1['y'] + n2['y']) / 2
 
     def eliminar_seleccion(self, e=None):
         if self.seleccionado is not None and self.tipo_seleccionado == 'COMP':
             self.save_state()
-            for i in self.componentes[self.seleccionado]['ids']: 
-                self.canvas.delete(i)
-            self.componentes.pop(self.seleccionado)
+            self.registrar(('comp-', self.seleccionado, self.datos_comp(self.seleccionado)))
             self.seleccionado = None
             self.cleanup_isolated_nodes()
             self.simular_en_tiempo_real()
@@ -771,12 +1149,8 @@ class SimuladorPro(tk.Tk):
             self.simular_en_tiempo_real()
 
     def find_node(self, x, y):
-        for i, n in enumerate(self.nodos):
-            if math.hypot(n['x']-x, n['y']-y) < 20: return i
+        return self.idx_nodos.buscar(x, y, 20)
             
     def find_comp(self, x, y, radius_override=None):
         radius = radius_override if radius_override else 40
-        for i, c in enumerate(self.componentes):
-            x1,y1=self.nodos[c['n1']]['x'], self.nodos[c['n1']]['y']
-            x2,y2=self.nodos[c['n2']]['x'], self.nodos[c['n2']]['y']
-            if math.hypot((x1+x2)/2-x, (y1+y2)/2-y) < radius: return i
\ No newline at end of file
+        return self.idx_comps.buscar(x, y, radius)
\ No newline at end of file
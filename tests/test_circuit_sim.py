@@ -0,0 +1,230 @@
+"""
+test_circuit_sim.py - Casos de regresión del motor MNA (python -m pytest tests)
+"""
+import os
+import sys
+
+import numpy as np
+import pytest
+
+sys.path.append(os.path.join(os.path.dirname(__file__), '..', 'src'))
+from batch_runner import iter_cards
+from circuit_sim import SOLUTION_CACHE_VERSION, Circuit, SolutionCache, SubcircuitDef, _mc_batch
+
+def _mesh(n, seed=0, floating_source=False):
+    """Red aleatoria conexa de n nodos: árbol más ramas extra, fuente de voltaje a tierra y de corriente"""
+    rng = np.random.default_rng(seed)
+    c = Circuit()
+    for k in range(1, n):
+        c.add_resistor(f'R{k}', str(k), str(rng.integers(0, k)), rng.uniform(1, 100))
+        c.add_resistor(f'Rx{k}', str(k), str(rng.integers(0, n)), rng.uniform(1, 100))
+    c.add_vsource('V1', '1', '0', 5.0); c.add_isource('I1', '0', str(n - 1), 0.02)
+    if floating_source: c.add_vsource('V2', str(n // 2), str(n // 3), 1.5)
+    return c
+
+def _dense_mna(c):
+    """Referencia: MNA densa armada elemento por elemento desde las vistas (R, V e I, sin cables)"""
+    nodes = sorted(nd for nd in c.nodes if nd != '0')
+    col = {nd: k for k, nd in enumerate(nodes)}; col['0'] = None
+    n, vs = len(nodes), c.vsources
+    A, z = np.zeros((n + len(vs), n + len(vs))), np.zeros(n + len(vs))
+    def put(i, j, val):
+        if i is not None and j is not None: A[i, j] += val
+    for r in c.resistors:
+        a, b, g = col[r.n1], col[r.n2], 1.0 / r.value
+        put(a, a, g); put(b, b, g); put(a, b, -g); put(b, a, -g)
+    for k, v in enumerate(vs):
+        a, b = col[v.n_plus], col[v.n_minus]
+        put(a, n + k, 1.0); put(n + k, a, 1.0); put(b, n + k, -1.0); put(n + k, b, -1.0); z[n + k] = v.value
+    for s in c.isources:
+        if col[s.n_from] is not None: z[col[s.n_from]] -= s.value
+        if col[s.n_to] is not None: z[col[s.n_to]] += s.value
+    x = np.linalg.solve(A, z)
+    return {nd: x[k] for nd, k in col.items() if k is not None}
+
+def test_element_between_ground_aliases():
+    """Un elemento de tierra a tierra ('0'-'GND') no une ninguna componente a tierra"""
+    c = Circuit()
+    c.add_resistor('Rg', '0', 'GND', 5.0)
+    voltages, results = c.solve()
+    assert voltages == {'0': 0.0} and results['Rg']['i'] == 0.0
+
+    c = Circuit()
+    c.add_vsource('V1', 'a', '0', 5.0); c.add_resistor('R1', 'a', '0', 10.0); c.add_resistor('Rg', '0', 'GND', 5.0)
+    c.add_resistor('Rx', 'x', 'y', 10.0)
+    voltages, results = c.solve()
+    assert voltages['a'] == pytest.approx(5.0) and results['R1']['i'] == pytest.approx(0.5)
+    assert [isl.nodes for isl in c.floating_islands()] == [['x', 'y']]
+
+def test_reduce_with_port_to_ground_elements():
+    """Los elementos entre un puerto y tierra quedan de tierra a tierra en el análisis de reduce()"""
+    c = Circuit()
+    c.add_isource('I1', '0', 'a', 1e-3); c.add_resistor('R1', 'a', 'p', 100.0); c.add_resistor('R0', 'p', '0', 1e3)
+    c.add_resistor('Rx', 'x', 'y', 10.0)
+    Z, v_oc = c.reduce(['p']).thevenin()
+    assert Z[0, 0] == pytest.approx(1e3) and v_oc[0] == pytest.approx(1.0)
+
+def test_netlist_title_starting_with_card_letter():
+    """La primera línea de un netlist es el título aunque empiece con R, V, I, C o L"""
+    cards = list(iter_cards(["Rectifier bias test", "V1 in 0 DC 5", "R1 in 0 1k", ".end"]))
+    assert [c[2] for c in cards] == ['V1', 'R1'] and cards[1][5] == 1e3
+
+def test_monte_carlo_percentiles_merge_across_batches():
+    """Los percentiles fusionados entre lotes coinciden con los de todas las muestras juntas"""
+    c = Circuit()
+    c.add_vsource('V1', 'in', '0', 10.0); c.add_resistor('R1', 'in', 'a', 1e3); c.add_resistor('R2', 'a', '0', 1e3)
+    mc = c.monte_carlo(20000, seed=1, workers=1, batch_size=256)
+    # Mismas muestras (una semilla por lote) resueltas aparte y reunidas
+    _, plan = c._mc_plan(0.05, 'uniform', (1, 99), False)
+    sizes = [256] * (20000 // 256) + [20000 % 256]
+    V = np.vstack([_mc_batch((plan, sd, K))[5] for sd, K in zip(np.random.SeedSequence(1).spawn(len(sizes)), sizes)])
+    exact = np.percentile(V, [1, 99], axis=0)
+    assert np.abs(mc.percentiles[1.0] - exact[0]).max() < 1e-4
+    assert np.abs(mc.percentiles[99.0] - exact[1]).max() < 1e-4
+    with pytest.raises(ValueError): c.monte_carlo(0)
+
+def test_fingerprint_memo_follows_value_changes(tmp_path):
+    """El fingerprint memorizado cambia con set_value y la caché en disco usa un subdirectorio por versión"""
+    c = Circuit()
+    c.add_vsource('V1', 'a', '0', 5.0); c.add_resistor('R1', 'a', '0', 10.0)
+    f0 = c.fingerprint()
+    c.set_value('R1', 20.0)
+    assert c.fingerprint() != f0
+    c.set_value('R1', 10.0)
+    assert c.fingerprint() == f0
+    c.cache = SolutionCache(path=str(tmp_path))
+    c.solve()
+    assert os.listdir(tmp_path) == [f"v{SOLUTION_CACHE_VERSION}"]
+
+def test_nonlinear_islands_match_linear_solve():
+    """Newton trata las islas flotantes como solve(): referencia de cada isla en 0 V"""
+    def build(diode):
+        c = Circuit()
+        c.add_vsource('V1', 'in', '0', 5.0); c.add_resistor('R1', 'in', 'a', 1e3)
+        if diode: c.add_diode('D1', 'a', '0')
+        else: c.add_resistor('Ra', 'a', '0', 1e3)
+        c.add_resistor('Rx', 'x', 'y', 100.0); c.add_resistor('Ry', 'y', 'z', 100.0); c.add_isource('Ix', 'x', 'z', 1e-3)
+        return c
+    lin, _ = build(False).solve()
+    c = build(True)
+    nl, _ = c.solve()
+    assert c.newton_report.converged
+    for node in 'xyz': assert nl[node] == pytest.approx(lin[node], abs=1e-9)
+
+@pytest.mark.parametrize('method', ['dense', 'sparse'])
+@pytest.mark.parametrize('floating_source', [False, True])
+def test_woodbury_updates_match_fresh_solve(method, floating_source):
+    """Cambios de resistencias sobre la LU en caché (Woodbury) dan lo mismo que resolver de cero"""
+    c = _mesh(60, floating_source=floating_source)
+    c.solve(method)
+    changes = {'R5': 3.0, 'Rx7': 250.0, 'R20': 0.5}
+    for name, value in changes.items(): c.set_value(name, value)
+    c.set_value('V1', 7.0)
+    voltages, results = c.solve(method)
+    assert c._lu_cache is not None and set(c._lowrank_g0) == set(changes)
+
+    ref = _mesh(60, floating_source=floating_source)
+    for name, value in changes.items(): ref.set_value(name, value)
+    ref.set_value('V1', 7.0)
+    v_ref, r_ref = ref.solve('dense')
+    for node in v_ref: assert voltages[node] == pytest.approx(v_ref[node], abs=1e-9)
+    for name in ('R5', 'Rx7', 'V1', 'I1'): assert results[name]['i'] == pytest.approx(r_ref[name]['i'], abs=1e-9)
+
+def test_stamp_plan_keeps_pattern_across_value_changes():
+    """set_value no recompila: el mismo plan y patrón CSC estampan los valores nuevos"""
+    c = _mesh(40, floating_source=True)
+    plan = c.compile()
+    indices, indptr = plan.indices.copy(), plan.indptr.copy()
+    c.set_value('R3', 12.0); c.set_value('Rx9', 0.8); c.set_value('V2', -2.0); c.set_value('I1', 0.1)
+    assert c.compile() is plan
+    assert np.array_equal(plan.indices, indices) and np.array_equal(plan.indptr, indptr)
+
+    ref = _mesh(40, floating_source=True)
+    ref.set_value('R3', 12.0); ref.set_value('Rx9', 0.8); ref.set_value('V2', -2.0); ref.set_value('I1', 0.1)
+    assert np.allclose(plan.matrix(True).toarray(), ref.compile().matrix(True).toarray(), rtol=0, atol=1e-15)
+    voltages, _ = c.solve('sparse')
+    for node, v in _dense_mna(c).items(): assert voltages[node] == pytest.approx(v, abs=1e-9)
+
+@pytest.mark.parametrize('method', ['dense', 'sparse'])
+def test_spd_factor_matches_dense_reference(method):
+    """Fuentes a tierra y resistencias positivas: Cholesky sobre el sistema reducido, con las
+    corrientes de las fuentes recuperadas por KCL"""
+    c = _mesh(80, seed=3)
+    voltages, results = c.solve(method)
+    assert type(c._lu_cache['lu']).__name__ == 'SPDFactor'
+    for node, v in _dense_mna(c).items(): assert voltages[node] == pytest.approx(v, abs=1e-9)
+    lu = _mesh(80, seed=3); lu.cholesky = False
+    assert results['V1']['i'] == pytest.approx(lu.solve(method)[1]['V1']['i'], abs=1e-12)
+    assert type(lu._lu_cache['lu']).__name__ != 'SPDFactor'
+
+@pytest.mark.parametrize('solver, floating_source', [('cg', False), ('gmres', True), ('minres', True)])
+def test_iterative_solve_matches_direct(solver, floating_source):
+    """Los modos de Krylov convergen a la solución directa y arrancan en caliente tras una edición"""
+    c = _mesh(120, seed=5, floating_source=floating_source)
+    precond = 'jacobi' if solver == 'minres' else 'ilu'
+    voltages, _ = c.solve_iterative(solver, precond=precond, tol=1e-12)
+    assert c.iterative_report.converged and c.iterative_report.solver == solver
+    for node, v in _dense_mna(c).items(): assert voltages[node] == pytest.approx(v, abs=1e-7)
+
+    c.set_value('R10', 40.0)
+    voltages, _ = c.solve_iterative(solver, precond=precond, tol=1e-12)
+    assert c.iterative_report.converged and c.iterative_report.warm_start
+    for node, v in _dense_mna(c).items(): assert voltages[node] == pytest.approx(v, abs=1e-7)
+
+def test_sensitivity_matches_finite_differences():
+    """Derivadas adjuntas de un voltaje de nodo y de una diferencia contra diferencias centrales"""
+    c = _mesh(30, seed=2, floating_source=True)
+    s = c.sensitivity(['10', ('5', '7')])
+    assert s.outputs == ['V(10)', 'V(5,7)'] and len(s.names) == s.dydp.shape[1]
+    num = np.zeros_like(s.dydp)
+    for p, (name, value) in enumerate(zip(s.names, s.values)):
+        h = 1e-6 * max(abs(value), 1e-3); y = []
+        for sign in (1, -1):
+            ref = _mesh(30, seed=2, floating_source=True); ref.set_value(name, value + sign * h)
+            v = _dense_mna(ref); y.append(np.array([v['10'], v['5'] - v['7']]))
+        num[:, p] = (y[0] - y[1]) / (2 * h)
+    assert np.abs(s.dydp - num).max() < 1e-6 * np.abs(num).max()
+
+def test_subcircuits_memoized_and_equal_to_flat():
+    """Cada combinación de parámetros se reduce una vez y las instancias dan lo mismo que el circuito plano"""
+    builds = []
+    def cell(c, R=100.0):
+        builds.append(R)
+        c.add_resistor('R1', 'a', 'm', R); c.add_resistor('R2', 'm', 'b', R); c.add_resistor('R3', 'm', 'k', 1e3)
+        c.add_vsource('Vk', 'k', '0', 0.5)
+    CELL = SubcircuitDef('cell', ['a', 'b'], cell)
+    hier, flat = Circuit(), Circuit()
+    for c in (hier, flat): c.add_vsource('VIN', 'n0', '0', 5.0); c.add_resistor('RL', 'n12', '0', 1e3)
+    for i in range(12):
+        R = 100.0 if i % 2 else 150.0
+        hier.add_subcircuit(f'X{i}', CELL, [f'n{i}', f'n{i + 1}'], R=R)
+        flat.add_resistor(f'X{i}.R1', f'n{i}', f'X{i}.m', R); flat.add_resistor(f'X{i}.R2', f'X{i}.m', f'n{i + 1}', R)
+        flat.add_resistor(f'X{i}.R3', f'X{i}.m', f'X{i}.k', 1e3); flat.add_vsource(f'X{i}.Vk', f'X{i}.k', '0', 0.5)
+    assert sorted(builds) == [100.0, 150.0]
+
+    vh, rh = hier.solve(); vf, rf = flat.solve()
+    for node in vh: assert vh[node] == pytest.approx(vf[node], abs=1e-9)
+    assert rh['VIN']['i'] == pytest.approx(rf['VIN']['i'], abs=1e-12)
+    inner = hier.subcircuit_voltages('X3', vh)
+    assert inner['X3.m'] == pytest.approx(vf['X3.m'], abs=1e-9) and inner['X3.k'] == pytest.approx(0.5)
+
+def test_cache_fingerprint_ignores_insertion_order():
+    """Mismo circuito armado en otro orden: mismo fingerprint y acierto en la caché compartida"""
+    parts = [('R', 'R1', 'a', 'b', 10.0), ('R', 'R2', 'b', '0', 20.0), ('V', 'V1', 'a', '0', 5.0), ('I', 'I1', '0', 'b', 0.1)]
+    def build(order):
+        c = Circuit()
+        for kind, name, n1, n2, val in order:
+            {'R': c.add_resistor, 'V': c.add_vsource, 'I': c.add_isource}[kind](name, n1, n2, val)
+        return c
+    a, b = build(parts), build(parts[::-1])
+    assert a.fingerprint() == b.fingerprint()
+    b.set_value('R2', 21.0)
+    assert a.fingerprint() != b.fingerprint()
+    b.set_value('R2', 20.0)
+
+    cache = SolutionCache()
+    a.cache = b.cache = cache
+    va, _ = a.solve()
+    vb, rb = b.solve()
+    assert (cache.hits, cache.misses) == (1, 1) and vb == va
+    assert vb['b'] == pytest.approx(_dense_mna(b)['b']) and rb['R2']['i'] == pytest.approx(vb['b'] / 20.0)